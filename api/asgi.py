@@ -0,0 +1,293 @@
+"""
+ASGI entry point for the Nutrition Assistant.
+
+POST /api/analyze, /api/analyze/stream and /api/analyze/batch run on the async graph (every
+agent awaits llm.ainvoke), so a single process can hold hundreds of
+concurrent analyses while they wait on the LLM instead of pinning one worker
+thread each. Every other route is served by the existing Flask app.
+
+Run with:
+    uvicorn api.asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import logging
+import math
+import time
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import flask_app, build_initial_state, build_response, AnalysisEventStream, STREAM_MODES, stream_error_event
+from app import get_user_id, request_deadline, select_graph, workflow, loaded_workflow
+from app import InvalidReadings, get_tenant, overloaded_response
+from app import finish_profile, start_profile
+from app import COALESCE_REQUESTS, coalescing_key, in_flight
+from app import JOBS_SHUTDOWN_SECONDS, REQUEST_DEADLINE_SECONDS, forget_job_thread, is_job_thread, job_graph, jobs, plan_response, submit_job, wants_job
+from app import BATCH_MAX_RECORDS, batch_concurrency, batch_line, batch_summary, prepare_batch
+from batch import SharedBackoff, arun_batch, batch_config
+from llm_client import DeadlineExceeded, with_deadline
+from metrics import metrics
+from profiler import with_profile
+from scheduler import Overloaded, with_tenant
+
+flask_asgi = WsgiToAsgi(flask_app)
+
+logger = logging.getLogger("nutrition.api")
+
+
+async def read_body(receive) -> bytes:
+    """Collects the full HTTP request body from the ASGI receive channel"""
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            return body
+
+
+async def send_json(send, payload: dict, status: int = 200, headers: tuple = ()):
+    """Sends a JSON response with the same CORS header flask-cors would add"""
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"access-control-allow-origin", b"*"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def request_headers(scope) -> dict:
+    """ASGI headers as a case-insensitive-enough dict (Title-Case keys)"""
+    return {name.decode("latin-1").title(): value.decode("latin-1") for name, value in scope["headers"]}
+
+
+async def analyze_journal(scope, receive, send):
+    """
+    Async twin of the Flask /api/analyze handler. A profiled run here gets
+    node timings only: the event loop thread is shared, so it is not sampled.
+    """
+    try:
+        try:
+            data = json.loads(await read_body(receive) or b"null")
+        except json.JSONDecodeError:
+            data = None
+
+        if not data or 'journal_entry' not in data:
+            await send_json(send, {'error': 'Missing journal_entry in request body'}, 400)
+            return
+
+        headers = request_headers(scope)
+        profile = start_profile(headers)
+
+        async def run():
+            if wants_job(data):
+                return await analyze_with_job(data, headers, profile)
+
+            graph, config = select_graph(get_user_id(data, headers), workflow().async_app, workflow().get_async_profile_app())
+            initial_state = build_initial_state(data, resumed=config is not None)
+            config = with_tenant(config, get_tenant(data, headers))
+            config = with_profile(with_deadline(config, request_deadline(headers)), profile)
+            result = await graph.ainvoke(initial_state, config=config)
+            return build_response(result, initial_state)
+
+        if profile is None:
+            await send_json(send, await coalesced(data, headers, run))
+            return
+
+        try:
+            response = {**await run(), 'coalesced': False}
+        finally:
+            summary = await asyncio.to_thread(finish_profile, profile)
+        await send_json(send, {**response, 'profile': summary})
+
+    except InvalidReadings as e:
+        await send_json(send, {'success': False, 'error': str(e)}, 400)
+    except Overloaded as e:
+        logger.warning("Request turned away by the LLM scheduler: %s", e)
+        await send_json(send, overloaded_response(e), 429, [(b"retry-after", str(math.ceil(e.retry_after)).encode())])
+    except DeadlineExceeded as e:
+        logger.warning("Request deadline exceeded: %s", e)
+        await send_json(send, {'success': False, 'error': str(e)}, 504)
+    except Exception as e:
+        logger.exception("Error processing request")
+        await send_json(send, {'success': False, 'error': str(e)}, 500)
+
+
+async def coalesced(data: dict, headers: dict, run) -> dict:
+    """Async twin of app.coalesced"""
+    if not COALESCE_REQUESTS:
+        return {**await run(), 'coalesced': False}
+    response, shared = await in_flight.ado(coalescing_key(data, headers), run)
+    if shared:
+        metrics.inc("nutrition_coalesced_requests_total", endpoint="analyze")
+    return {**response, 'coalesced': shared}
+
+
+async def analyze_with_job(data: dict, headers: dict, profile=None) -> dict:
+    """
+    Async twin of app.analyze_with_job. The job runs on the worker pool but
+    resumes the graph on this event loop, where the async checkpointer lives.
+    """
+    graph, config = job_graph(get_user_id(data, headers), asynchronous=True)
+    await asyncio.to_thread(jobs.wait_for_key, config['configurable']['thread_id'], REQUEST_DEADLINE_SECONDS)
+    initial_state = build_initial_state(data, resumed=not is_job_thread(graph))
+    config = with_tenant(config, get_tenant(data, headers))
+    result = await graph.ainvoke(
+        initial_state,
+        config=with_profile(with_deadline(config, request_deadline(headers)), profile),
+        interrupt_before=workflow().deferrable_nodes(graph)
+    )
+    loop = asyncio.get_running_loop()
+
+    def resume():
+        coroutine = graph.ainvoke(None, config=with_deadline(config, REQUEST_DEADLINE_SECONDS))
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    pending = (await graph.aget_state(config)).next
+    job = submit_job(graph, config, initial_state, resume) if pending else None
+    if job is not None:
+        return plan_response(result, initial_state, job)
+    if pending:
+        result = await graph.ainvoke(None, config=with_deadline(config, REQUEST_DEADLINE_SECONDS))
+    forget_job_thread(graph, config)
+    return {**build_response(result, initial_state), 'job': None}
+
+
+async def analyze_journal_stream(scope, receive, send):
+    """Async twin of the Flask /api/analyze/stream handler"""
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except json.JSONDecodeError:
+        data = None
+
+    if not data or 'journal_entry' not in data:
+        await send_json(send, {'error': 'Missing journal_entry in request body'}, 400)
+        return
+
+    headers = request_headers(scope)
+    graph, config = select_graph(get_user_id(data, headers), workflow().async_app, workflow().get_async_profile_app())
+    try:
+        initial_state = build_initial_state(data, resumed=config is not None)
+    except InvalidReadings as e:
+        await send_json(send, {'error': str(e)}, 400)
+        return
+    config = with_deadline(with_tenant(config, get_tenant(data, headers)), request_deadline(headers), hedge=False)
+    try:
+        workflow().check_admission(config)
+    except Overloaded as e:
+        logger.warning("Stream turned away by the LLM scheduler: %s", e)
+        await send_json(send, overloaded_response(e), 429, [(b"retry-after", str(math.ceil(e.retry_after)).encode())])
+        return
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+
+    async def emit(event: str):
+        await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+
+    events = AnalysisEventStream(initial_state)
+    try:
+        async for mode, chunk in graph.astream(initial_state, config=config, stream_mode=STREAM_MODES):
+            for event in events.feed(mode, chunk):
+                await emit(event)
+        await emit(events.finish())
+    except Exception as e:
+        await emit(stream_error_event(e))
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def analyze_journal_batch(scope, receive, send):
+    """Async twin of the Flask /api/analyze/batch handler (NDJSON in completion order)"""
+    try:
+        data = json.loads(await read_body(receive) or b"null")
+    except json.JSONDecodeError:
+        data = None
+
+    records = (data or {}).get('records')
+    if not isinstance(records, list) or not records:
+        await send_json(send, {'error': 'Missing records in request body'}, 400)
+        return
+    if len(records) > BATCH_MAX_RECORDS:
+        await send_json(send, {'error': f'At most {BATCH_MAX_RECORDS} records per batch'}, 413)
+        return
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"application/x-ndjson"),
+            (b"access-control-allow-origin", b"*"),
+        ],
+    })
+
+    async def emit(line: dict):
+        body = (json.dumps(line) + "\n").encode("utf-8")
+        await send({"type": "http.response.body", "body": body, "more_body": True})
+
+    started = time.perf_counter()
+    backoff = SharedBackoff()
+    try:
+        states, indexes, errors = prepare_batch(records)
+        failed = len(errors)
+        for line in errors:
+            await emit(line)
+
+        config = batch_config(batch_concurrency(data.get('max_concurrency')), llm=workflow().get_batch_models(), backoff=backoff)
+        async for position, result in arun_batch(workflow().async_app, states, config):
+            line = batch_line(records, indexes[position], result, states[position])
+            failed += not line['success']
+            await emit(line)
+        await emit(batch_summary(len(records), failed, backoff, started))
+    except Exception as e:
+        logger.exception("Error processing batch")
+        await emit({'done': True, 'success': False, 'error': str(e)})
+
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # A long-running server loads the workflow up front (off the event
+            # loop) so the first analyze request does not pay for it
+            await asyncio.to_thread(workflow)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await asyncio.to_thread(jobs.shutdown, JOBS_SHUTDOWN_SECONDS)
+            if loaded_workflow() is not None:
+                await loaded_workflow().close_async_profile_app()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "POST":
+        if scope["path"] == "/api/analyze":
+            await analyze_journal(scope, receive, send)
+            return
+        if scope["path"] == "/api/analyze/stream":
+            await analyze_journal_stream(scope, receive, send)
+            return
+        if scope["path"] == "/api/analyze/batch":
+            await analyze_journal_batch(scope, receive, send)
+            return
+
+    await flask_asgi(scope, receive, send)
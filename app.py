@@ -1,23 +1,492 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+import io
 import os
 import json
+import math
+import time
+import sys
+import logging
+import uuid
+from typing import Dict, Iterator, List, Optional
 from dotenv import load_dotenv
 
 # Import the existing workflow
-from main import app as langgraph_app, AgentState
-from langchain_core.messages import HumanMessage
+# The workflow (main) is imported on first use, see workflow()
+from logs import configure_logging
+from metrics import metrics
+from batch import SharedBackoff, batch_config, run_batch
+from jobs import JobQueue
+from json_extract import JSONStreamExtractor, LOGISTICS_SCHEMA, MEAL_PLAN_SCHEMA, SchemaError, validate
+from singleflight import SingleFlight, request_key
+from profile_store import thread_config
+from llm_client import DeadlineExceeded, with_deadline
+from scheduler import Overloaded, with_tenant
+from profiler import Profile, RequestProfiler, load_profiling_settings, with_profile
 
 load_dotenv()
 
+logger = configure_logging().getChild("api")
+
 # Validate API key
-if not os.getenv("OPENAI_API_KEY") and not os.getenv("GROQ_API_KEY"):
-    print("WARNING: API keys not found in environment variables. Set OPENAI_API_KEY or GROQ_API_KEY for functionality.")
+if not os.getenv("OPENAI_API_KEY") and not os.getenv("GROQ_API_KEY") and os.getenv("LLM_PROVIDER") != "fake":
+    logger.warning("API keys not found in environment variables. Set OPENAI_API_KEY or GROQ_API_KEY for functionality.")
 
 # Create Flask app
 flask_app = Flask(__name__, static_folder='static', static_url_path='')
 CORS(flask_app)  # Enable CORS for local development
 
+def workflow():
+    """
+    The agent workflow module, imported on the first analyze request.
+    Importing it pulls in LangChain/LangGraph, builds the LLM client and
+    compiles the graphs; health checks and static files never pay for
+    that on a cold start. Python's import system memoises it.
+    """
+    import main
+    return main
+
+def loaded_workflow():
+    """The workflow module if an earlier request already loaded it, else None"""
+    return sys.modules.get("main")
+
+def get_user_id(data: dict, headers) -> str:
+    """User id from the request body or the X-User-Id header ('' if anonymous)"""
+    return str(data.get('user_id') or headers.get('X-User-Id') or '')
+
+def get_tenant(data: dict, headers) -> str:
+    """Whose LLM token quota a request counts against: its X-Api-Key, else its user id ('' for none)"""
+    return str(headers.get('X-Api-Key') or get_user_id(data, headers))
+
+def overloaded_response(error: Overloaded) -> dict:
+    """The 429 body for a request the LLM scheduler turned away"""
+    return {'success': False, 'error': str(error), 'reason': error.reason, 'retry_after': error.retry_after}
+
+def build_initial_state(data: dict, resumed: bool = False) -> dict:
+    """
+    Creates the initial workflow state from an /api/analyze request body.
+    When resuming a user's checkpointed thread this is only the delta:
+    the new message, and profile fields only if sent.
+    """
+    from langchain_core.messages import HumanMessage
+    
+    # Extract data from request
+    journal_entry = data.get('journal_entry', '')
+    health_data = data.get('health_data', {
+        'glucose_trend': 'Normal',
+        'energy_level': 'Normal'
+    })
+    if data.get('glucose_readings'):
+        # Raw CGM readings are summarised here; only the summary goes on
+        health_data = glucose_health_data(data['glucose_readings'], health_data)
+    
+    # Create initial state for the workflow; per-request fields are reset
+    # so a resumed thread does not carry over the previous visit's results
+    state = {
+        "messages": [HumanMessage(content=f"Here is my journal: {journal_entry}")],
+        "health_data": health_data,
+        "journal_entry": journal_entry,
+        "detected_triggers": [],
+        "final_plan": "",
+        "timings": None,
+        "history_tokens": None,
+        "semantic_cache": None,
+        "speculation": None,
+        "recipe_id": None,
+        "prompt_tokens": None
+    }
+    if 'user_profile' in data:
+        state["user_profile"] = data['user_profile']
+    elif not resumed:
+        state["user_profile"] = {
+            'name': 'User',
+            'diet': 'No specific diet',
+            'allergies': []
+        }
+    return state
+
+class InvalidReadings(ValueError):
+    """glucose_readings in a request body that cannot be summarised (answered with 400)"""
+
+def glucose_health_data(readings, health_data: dict) -> dict:
+    """health_data with the glucose trend computed from CGM readings (JSON, see cgm.readings_from_json)"""
+    import cgm
+    try:
+        summary = cgm.summarise(cgm.readings_from_json(readings))
+    except (ValueError, TypeError, IndexError) as e:
+        raise InvalidReadings(f'Could not read glucose readings: {e}') from e
+    return cgm.to_health_data(summary, health_data)
+
+# Upper bound on one analyze request's LLM time; a client may ask for less
+# with an X-Request-Deadline-Ms header
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "90"))
+
+def request_deadline(headers) -> float:
+    """Seconds this request may spend in the workflow"""
+    try:
+        requested = float(headers.get('X-Request-Deadline-Ms')) / 1000
+    except (TypeError, ValueError):
+        return REQUEST_DEADLINE_SECONDS
+    return max(0.0, min(requested, REQUEST_DEADLINE_SECONDS))
+
+def select_graph(user_id: str, graph, profile_graph):
+    """Picks the per-user checkpointed graph when possible; returns (graph, config)"""
+    if user_id and profile_graph is not None:
+        return profile_graph, thread_config(user_id)
+    return graph, None
+
+def build_response(result: dict, initial_state: dict) -> dict:
+    """Shapes the final workflow state into the /api/analyze JSON response"""
+    # Extract results
+    final_message = result['messages'][-1].content if result.get('messages') else ""
+    timings = result.get('timings', {})
+    saving = workflow().parallel_saving_ms(timings)
+    logger.info("Analysis finished", extra={"nodes_ms": timings, "parallel_saving_ms": saving})
+    
+    return {
+        'success': True,
+        'results': {
+            'user_profile': result.get('user_profile', initial_state.get('user_profile', {})),
+            'detected_triggers': result.get('detected_triggers', []),
+            'final_plan': result.get('final_plan', ''),
+            'complete_response': final_message
+        },
+        'timings': {
+            'nodes_ms': timings,
+            'parallel_saving_ms': saving
+        },
+        # Tokens before/after history compaction, per stage
+        'history_tokens': result.get('history_tokens') or {},
+        # Prompt tokens per node: static template prefix and per-request part
+        'prompt_tokens': result.get('prompt_tokens') or {},
+        # Semantic cache lookup (hit and best similarity), None if it did not run
+        'semantic_cache': semantic_cache_summary(result.get('semantic_cache'))
+    }
+
+def semantic_cache_summary(lookup: Optional[dict]) -> Optional[dict]:
+    if not lookup:
+        return None
+    return {'hit': lookup['hit'], 'similarity': lookup['similarity']}
+
+# Identical /api/analyze requests in flight at the same time (double
+# submits, client retries) share one run instead of each calling the LLM.
+# COALESCE_REQUESTS: on | off
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "on").lower() == "on"
+in_flight = SingleFlight()
+
+def coalescing_key(data: dict, headers) -> str:
+    """
+    Canonical hash of everything that decides an /api/analyze response,
+    including the tenant and deadline: another tenant's quota 429 or a
+    shorter deadline's 504 must not be handed to this request
+    """
+    return request_key(
+        data.get('journal_entry'), data.get('user_profile'), data.get('health_data'),
+        data.get('glucose_readings'), get_user_id(data, headers), wants_job(data),
+        get_tenant(data, headers), request_deadline(headers)
+    )
+
+def coalesced(data: dict, headers, run) -> dict:
+    """run()'s response, shared with identical requests already in flight"""
+    if not COALESCE_REQUESTS:
+        return {**run(), 'coalesced': False}
+    response, shared = in_flight.do(coalescing_key(data, headers), run)
+    if shared:
+        metrics.inc("nutrition_coalesced_requests_total", endpoint="analyze")
+    return {**response, 'coalesced': shared}
+
+# Profiling: an /api/analyze request sent with X-Profiling: 1, or a
+# PROFILING_SAMPLE_RATE share of them, has its graph run sampled and written
+# to PROFILING_DIR as speedscope/flamegraph files (see profiler.py)
+profiler = RequestProfiler(load_profiling_settings())
+
+def start_profile(headers, name: str = 'analyze') -> Optional[Profile]:
+    """A Profile if this request is to be profiled, else None"""
+    return profiler.start(name) if profiler.wanted(headers) else None
+
+def finish_profile(profile: Profile) -> Optional[dict]:
+    """Writes the profile's files; returns its summary (None if they could not be written)"""
+    try:
+        return profiler.finish(profile)
+    except OSError as e:
+        logger.warning("Could not write profile %s: %s", profile.id, e)
+        return None
+
+def invoke_graph(graph, initial_state, config: dict, profile: Optional[Profile], **kwargs) -> dict:
+    """graph.invoke; in a profiled request the calling thread is sampled as LangGraph's own time"""
+    if profile is None:
+        return graph.invoke(initial_state, config=config, **kwargs)
+    with profile.watch():
+        return graph.invoke(initial_state, config=with_profile(config, profile), **kwargs)
+
+# Job mode: /api/analyze answers as soon as the plan is ready and the
+# deferrable nodes (logistics) finish on a bounded worker pool; clients poll
+# /api/jobs/<id>. A request opts in with "job": true, ANALYZE_JOBS=on makes
+# it the default
+ANALYZE_JOBS = os.getenv("ANALYZE_JOBS", "off").lower() == "on"
+JOBS_MAX_WAIT_SECONDS = float(os.getenv("JOBS_MAX_WAIT_SECONDS", "30"))
+JOBS_SHUTDOWN_SECONDS = float(os.getenv("JOBS_SHUTDOWN_SECONDS", "30"))
+jobs = JobQueue(
+    workers=int(os.getenv("JOBS_MAX_WORKERS", "4")),
+    max_pending=int(os.getenv("JOBS_MAX_PENDING", "256")),
+    ttl_seconds=float(os.getenv("JOBS_TTL_SECONDS", "600"))
+)
+
+def wants_job(data: dict) -> bool:
+    return bool(data.get('job', ANALYZE_JOBS))
+
+def job_graph(user_id: str, asynchronous: bool = False):
+    """
+    Checkpointed graph for job mode; returns (graph, config). Users resume
+    their own thread, anonymous requests get a throwaway one.
+    """
+    profile_graph = workflow().get_async_profile_app() if asynchronous else workflow().profile_app
+    if user_id and profile_graph is not None:
+        return profile_graph, thread_config(user_id)
+    return workflow().get_job_app(asynchronous), thread_config(f"job-{uuid.uuid4().hex}")
+
+def is_job_thread(graph) -> bool:
+    return graph.checkpointer is workflow().job_checkpointer
+
+def forget_job_thread(graph, config: dict) -> None:
+    """Drops an anonymous job thread's checkpoints once its result is out"""
+    if is_job_thread(graph):
+        graph.checkpointer.delete_thread(config['configurable']['thread_id'])
+
+def submit_job(graph, config: dict, initial_state: dict, resume):
+    """
+    Queues resume() (which finishes the interrupted run and returns its
+    final state) on the job pool; None if the queue is full
+    """
+    def finish():
+        try:
+            return build_response(resume(), initial_state)
+        finally:
+            forget_job_thread(graph, config)
+    return jobs.submit(finish, key=config['configurable']['thread_id'])
+
+def job_summary(job) -> dict:
+    return {'id': job.id, 'status': job.status, 'url': f'/api/jobs/{job.id}'}
+
+def plan_response(result: dict, initial_state: dict, job) -> dict:
+    """The /api/analyze response for a run stopped before its deferrable nodes"""
+    response = build_response(result, initial_state)
+    response['results']['complete_response'] = result.get('final_plan', '')
+    response['job'] = job_summary(job)
+    return response
+
+def analyze_with_job(data: dict, headers, profile: Optional[Profile] = None) -> dict:
+    """
+    Job mode of /api/analyze: runs the graph up to its deferrable nodes and
+    answers with the plan and a job that finishes the rest. Runs that stop
+    earlier (unsafe input, preference updates, cache hits) are answered in
+    full with 'job': None, as are all runs while the job queue is full.
+    A profile covers the run up to the plan only.
+    """
+    graph, config = job_graph(get_user_id(data, headers))
+    # A user's earlier job has to finish before their thread moves on
+    jobs.wait_for_key(config['configurable']['thread_id'], REQUEST_DEADLINE_SECONDS)
+    initial_state = build_initial_state(data, resumed=not is_job_thread(graph))
+    config = with_tenant(config, get_tenant(data, headers))
+    result = invoke_graph(
+        graph, initial_state, with_deadline(config, request_deadline(headers)), profile,
+        interrupt_before=workflow().deferrable_nodes(graph)
+    )
+
+    # The job gets a deadline of its own
+    def resume():
+        return graph.invoke(None, config=with_deadline(config, REQUEST_DEADLINE_SECONDS))
+
+    pending = graph.get_state(config).next
+    job = submit_job(graph, config, initial_state, resume) if pending else None
+    if job is not None:
+        return plan_response(result, initial_state, job)
+    if pending:
+        result = resume()
+    forget_job_thread(graph, config)
+    return {**build_response(result, initial_state), 'job': None}
+
+# LangGraph stream modes used by the streaming endpoint: "tasks" for node
+# start/end, "messages" for LLM tokens and "values" for the final state
+STREAM_MODES = ["tasks", "messages", "values"]
+
+# Only the nutritionist's tokens are shown to the user as they arrive
+STREAMED_TOKEN_NODES = {"nutritionist_agent"}
+
+# Node output keys that are safe to serialise into node_end events
+STREAMED_STATE_KEYS = ("safety_flag", "user_profile", "detected_triggers", "final_plan")
+
+# Nodes whose JSON output is parsed while their tokens stream and sent as a
+# structured event the moment its closing bracket arrives
+STREAMED_JSON_NODES = {"logistics_agent": LOGISTICS_SCHEMA, "meal_planner_agent": MEAL_PLAN_SCHEMA}
+
+def format_sse(event: str, data: dict) -> str:
+    """Formats one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_error_event(error: Exception) -> str:
+    """
+    The event ending a stream whose run failed after its 200 went out:
+    overloaded (with reason and retry_after), deadline_exceeded or error
+    """
+    if isinstance(error, Overloaded):
+        logger.warning("Stream turned away by the LLM scheduler: %s", error)
+        return format_sse("overloaded", overloaded_response(error))
+    if isinstance(error, DeadlineExceeded):
+        logger.warning("Stream deadline exceeded: %s", error)
+        return format_sse("deadline_exceeded", {'success': False, 'error': str(error)})
+    logger.exception("Error processing stream")
+    return format_sse("error", {'success': False, 'error': str(error)})
+
+class AnalysisEventStream:
+    """
+    Translates LangGraph stream chunks into Server-Sent Events:
+    node_start / node_end per agent, token for streamed nutritionist output
+    and a final result event carrying the same payload as /api/analyze.
+    Streamed tokens pass through the output safety check first; once it
+    trips, token forwarding stops and the validated plan arrives with
+    nutritionist_agent's node_end event. The JSON replies of
+    STREAMED_JSON_NODES are extracted from their tokens as they arrive and
+    sent as a structured event once complete and safe, before the node ends.
+    """
+
+    def __init__(self, initial_state: dict):
+        self.initial_state = initial_state
+        self.final_state = None
+        self.streamed_text = ""
+        self.tokens_blocked = False
+        self.extractors: Dict[str, JSONStreamExtractor] = {}
+
+    def feed(self, mode: str, chunk) -> List[str]:
+        if mode == "values":
+            self.final_state = chunk
+            return []
+
+        if mode == "tasks":
+            if "result" not in chunk:
+                return [format_sse("node_start", {"node": chunk["name"]})]
+            update = dict(chunk.get("result") or [])
+            return [format_sse("node_end", {
+                "node": chunk["name"],
+                "error": str(chunk["error"]) if chunk.get("error") else None,
+                "ms": (update.get("timings") or {}).get(chunk["name"]),
+                "update": {k: update[k] for k in STREAMED_STATE_KEYS if k in update},
+            })]
+
+        if mode == "messages":
+            message, metadata = chunk
+            node = metadata.get("langgraph_node")
+            text = message.content if isinstance(message.content, str) else ""
+            if node in STREAMED_JSON_NODES and text:
+                return self.structured(node, text)
+            if node not in STREAMED_TOKEN_NODES or not text or self.tokens_blocked:
+                return []
+            self.streamed_text += text
+            # Dangerous phrases are short, so checking the tail is enough
+            is_safe, _ = workflow().safety.validate_output(self.streamed_text[-256:])
+            if not is_safe:
+                self.tokens_blocked = True
+                return [format_sse("tokens_withheld", {"node": node})]
+            return [format_sse("token", {"node": node, "text": text})]
+
+        return []
+
+    def structured(self, node: str, text: str) -> List[str]:
+        """Feeds a token of a JSON-producing node; the structured event once its value is complete"""
+        extractor = self.extractors.get(node)
+        if extractor is None:
+            start_chars = "{" if isinstance(STREAMED_JSON_NODES[node], dict) else "["
+            extractor = self.extractors[node] = JSONStreamExtractor(start_chars=start_chars)
+        if extractor.done:
+            return []
+        value = extractor.feed(text)
+        if value is None:
+            return []
+        try:
+            value = validate(value, STREAMED_JSON_NODES[node])
+        except SchemaError:
+            # The node escalates this reply to the large model; parse that one instead
+            del self.extractors[node]
+            return []
+        if not workflow().safety.validate_output(json.dumps(value))[0]:
+            return []
+        return [format_sse("structured", {"node": node, "value": value})]
+
+    def finish(self) -> str:
+        return format_sse("result", build_response(self.final_state or {}, self.initial_state))
+
+# Batch runs: default / maximum graphs in flight, and records per request
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_RECORDS = int(os.getenv("BATCH_MAX_RECORDS", "1000"))
+
+def prepare_batch(records: List[dict]) -> tuple:
+    """
+    Splits batch records into initial states to run and error lines for
+    records that cannot run. Batch re-analysis is stateless: records carry
+    their own profile and never touch a user's checkpointed thread.
+    Returns (states, state_indexes, error_lines).
+    """
+    states, indexes, errors = [], [], []
+    for i, record in enumerate(records):
+        if not isinstance(record, dict) or 'journal_entry' not in record:
+            errors.append({'index': i, 'success': False, 'error': 'Missing journal_entry in record'})
+            continue
+        try:
+            states.append(build_initial_state(record))
+        except InvalidReadings as e:
+            errors.append({'index': i, 'success': False, 'error': str(e)})
+            continue
+        indexes.append(i)
+    return states, indexes, errors
+
+def batch_line(records: List[dict], index: int, result, initial_state: dict) -> dict:
+    """One NDJSON result line for records[index] (result may be an exception)"""
+    record_id = records[index].get('id')
+    if isinstance(result, Exception):
+        return {'index': index, 'id': record_id, 'success': False, 'error': str(result)}
+    return {'index': index, 'id': record_id, **build_response(result, initial_state)}
+
+def batch_summary(lines: int, failed: int, backoff: SharedBackoff, started: float) -> dict:
+    return {
+        'done': True,
+        'records': lines,
+        'failed': failed,
+        'rate_limited': backoff.rate_limited,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
+
+def batch_concurrency(requested: Optional[int]) -> int:
+    return max(1, min(int(requested or BATCH_MAX_CONCURRENCY), BATCH_MAX_CONCURRENCY))
+
+def analyze_batch(records: List[dict], max_concurrency: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Python API for bulk analysis: runs the graph over /api/analyze-style
+    records with at most max_concurrency in flight and yields one result
+    dict per record in completion order (each tagged with its index and
+    id), then a summary dict with 'done': True. Rate limits are retried
+    through one backoff shared by the whole batch.
+    """
+    started = time.perf_counter()
+    backoff = SharedBackoff()
+    states, indexes, errors = prepare_batch(records)
+    failed = len(errors)
+    yield from errors
+
+    config = batch_config(batch_concurrency(max_concurrency), llm=workflow().get_batch_models(), backoff=backoff)
+    for position, result in run_batch(workflow().app, states, config):
+        line = batch_line(records, indexes[position], result, states[position])
+        failed += not line['success']
+        yield line
+
+    yield batch_summary(len(records), failed, backoff, started)
+
+def sse_response(events) -> Response:
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @flask_app.route('/')
 def index():
     """Serve the main HTML page"""
@@ -39,8 +508,19 @@ def analyze_journal():
         "health_data": {
             "glucose_trend": "Normal",
             "energy_level": "Low"
-        }
+        },
+        "glucose_readings": [{"timestamp": "2024-05-01T08:00:00", "glucose": 112}, ...],
+        "job": false
     }
+    glucose_readings (optional) is a raw CGM series; its computed trend
+    replaces health_data's glucose_trend
+    Identical requests arriving while one is running wait for it and get
+    its response, with "coalesced": true.
+    With "job": true (or ANALYZE_JOBS=on) the response comes once the plan
+    is ready and carries a job whose result, the full response, is served
+    at /api/jobs/<id>
+    With an X-Profiling: 1 header the run is profiled; the response then
+    carries a "profile" summary and the files are listed at /api/profiles
     """
     try:
         data = request.get_json()
@@ -50,55 +530,161 @@ def analyze_journal():
                 'error': 'Missing journal_entry in request body'
             }), 400
         
-        # Extract data from request
-        journal_entry = data.get('journal_entry', '')
-        user_profile = data.get('user_profile', {
-            'name': 'User',
-            'diet': 'No specific diet',
-            'allergies': []
-        })
-        health_data = data.get('health_data', {
-            'glucose_trend': 'Normal',
-            'energy_level': 'Normal'
-        })
-        
-        # Create initial state for the workflow
-        initial_state = {
-            "messages": [HumanMessage(content=f"Here is my journal: {journal_entry}")],
-            "user_profile": user_profile,
-            "health_data": health_data,
-            "journal_entry": journal_entry
-        }
-        
-        # Run the LangGraph workflow
-        print(f"\n{'='*60}")
-        print("Processing journal entry via API...")
-        print(f"{'='*60}\n")
+        profile = start_profile(request.headers)
         
-        result = langgraph_app.invoke(initial_state)
+        def run():
+            if wants_job(data):
+                return analyze_with_job(data, request.headers, profile)
+            
+            user_id = get_user_id(data, request.headers)
+            graph, config = select_graph(user_id, workflow().app, workflow().profile_app)
+            initial_state = build_initial_state(data, resumed=config is not None)
+            config = with_tenant(config, get_tenant(data, request.headers))
+            
+            # Run the LangGraph workflow
+            logger.debug("Processing journal entry via API")
+            
+            result = invoke_graph(graph, initial_state, with_deadline(config, request_deadline(request.headers)), profile)
+            return build_response(result, initial_state)
         
-        # Extract results
-        final_message = result['messages'][-1].content if result.get('messages') else ""
+        if profile is None:
+            return jsonify(coalesced(data, request.headers, run)), 200
         
-        response = {
-            'success': True,
-            'results': {
-                'user_profile': result.get('user_profile', user_profile),
-                'detected_triggers': result.get('detected_triggers', []),
-                'final_plan': result.get('final_plan', ''),
-                'complete_response': final_message
-            }
-        }
-        
-        return jsonify(response), 200
+        # A profiled request is not coalesced, so the profile is of its own run
+        try:
+            response = {**run(), 'coalesced': False}
+        finally:
+            summary = finish_profile(profile)
+        return jsonify({**response, 'profile': summary}), 200
         
+    except InvalidReadings as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+    except Overloaded as e:
+        logger.warning("Request turned away by the LLM scheduler: %s", e)
+        return jsonify(overloaded_response(e)), 429, {'Retry-After': str(math.ceil(e.retry_after))}
+    except DeadlineExceeded as e:
+        logger.warning("Request deadline exceeded: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 504
     except Exception as e:
-        print(f"Error processing request: {str(e)}")
+        logger.exception("Error processing request")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
+@flask_app.route('/api/analyze/stream', methods=['POST'])
+def analyze_journal_stream():
+    """
+    Streaming variant of /api/analyze (Server-Sent Events).
+    Takes the same JSON body and emits node_start/node_end events for each
+    agent, token events for the nutritionist's plan as it is generated and a
+    final result event with the /api/analyze payload.
+    """
+    data = request.get_json(silent=True)
+    
+    if not data or 'journal_entry' not in data:
+        return jsonify({
+            'error': 'Missing journal_entry in request body'
+        }), 400
+    
+    user_id = get_user_id(data, request.headers)
+    graph, config = select_graph(user_id, workflow().app, workflow().profile_app)
+    try:
+        initial_state = build_initial_state(data, resumed=config is not None)
+    except InvalidReadings as e:
+        return jsonify({'error': str(e)}), 400
+    # Hedging is off here: a duplicate call would stream its tokens too
+    config = with_deadline(with_tenant(config, get_tenant(data, request.headers)), request_deadline(request.headers), hedge=False)
+    try:
+        workflow().check_admission(config)
+    except Overloaded as e:
+        logger.warning("Stream turned away by the LLM scheduler: %s", e)
+        return jsonify(overloaded_response(e)), 429, {'Retry-After': str(math.ceil(e.retry_after))}
+    
+    def generate():
+        events = AnalysisEventStream(initial_state)
+        try:
+            for mode, chunk in graph.stream(initial_state, config=config, stream_mode=STREAM_MODES):
+                yield from events.feed(mode, chunk)
+            yield events.finish()
+        except Exception as e:
+            yield stream_error_event(e)
+    
+    return sse_response(generate())
+
+@flask_app.route('/api/analyze/batch', methods=['POST'])
+def analyze_journal_batch():
+    """
+    Batch variant of /api/analyze for bulk re-analysis.
+    Body: {"records": [<analyze body>, ...], "max_concurrency": 8}
+    Streams NDJSON: one line per record in completion order, each with its
+    index (and id, if the record had one), then a final {"done": true} line.
+    """
+    data = request.get_json(silent=True)
+    records = (data or {}).get('records')
+    
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Missing records in request body'}), 400
+    if len(records) > BATCH_MAX_RECORDS:
+        return jsonify({'error': f'At most {BATCH_MAX_RECORDS} records per batch'}), 413
+    
+    def generate():
+        try:
+            for line in analyze_batch(records, data.get('max_concurrency')):
+                yield json.dumps(line) + "\n"
+        except Exception as e:
+            logger.exception("Error processing batch")
+            yield json.dumps({'done': True, 'success': False, 'error': str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@flask_app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """
+    Status of a job started by /api/analyze: its id, status (pending,
+    running, done, error) and, once done, the full analyze response as
+    result. ?wait=<seconds> long-polls until the job finishes, at most
+    JOBS_MAX_WAIT_SECONDS. Jobs are forgotten JOBS_TTL_SECONDS after they
+    finish.
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0.0), JOBS_MAX_WAIT_SECONDS)
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+    
+    job = jobs.wait(job_id, wait) if wait else jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict()), 200
+
+@flask_app.route('/api/glucose/summary', methods=['POST'])
+def glucose_summary():
+    """
+    Summarises a CGM or wearable glucose export without running the agents.
+    Body: CSV (text/csv, read as it streams in) or JSON readings. Returns
+    the summary (trend, variability, spikes, time in range) and the
+    health_data to send with /api/analyze; ?energy_level= is carried over.
+    """
+    import cgm
+    
+    try:
+        if request.mimetype == 'text/csv':
+            readings = cgm.readings_from_csv(io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline=''))
+        else:
+            readings = cgm.readings_from_json(json.loads(request.get_data() or b'null'))
+        summary = cgm.summarise(readings)
+    except (ValueError, TypeError, IndexError) as e:
+        return jsonify({'error': f'Could not read glucose readings: {e}'}), 400
+    
+    health_data = {'energy_level': request.args.get('energy_level', 'Normal')}
+    return jsonify({'summary': summary, 'health_data': cgm.to_health_data(summary, health_data)}), 200
+
 @flask_app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -112,14 +698,83 @@ def debug_env():
     """Debug endpoint to check environment (Be careful not to expose actual keys)"""
     groq_key = os.getenv("GROQ_API_KEY")
     openai_key = os.getenv("OPENAI_API_KEY")
+    llm_cache = get_llm_cache()
+    loaded = loaded_workflow()
     
     return jsonify({
         'groq_key_present': bool(groq_key),
         'openai_key_present': bool(openai_key),
         'groq_key_length': len(groq_key) if groq_key else 0,
-        'env_vars': list(os.environ.keys())  # List available env vars keys only
+        'env_vars': list(os.environ.keys()),  # List available env vars keys only
+        'workflow_loaded': loaded is not None,
+        # Model per node on a non-default tier (the rest use the large model)
+        'models': loaded.models.describe() if loaded else None,
+        'llm_cache': llm_cache.stats() if llm_cache else None,
+        # LLM calls in flight and queued, and the estimated queue wait per priority class
+        'llm_scheduler': loaded.llm_scheduler.stats() if loaded and loaded.llm_scheduler else None,
+        'semantic_cache': loaded.semantic_cache.stats() if loaded and loaded.semantic_cache else None,
+        'latency': metrics.summary()
     }), 200
 
+@flask_app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """Request profiles on disk, newest first (needs X-Admin-Token matching PROFILING_ADMIN_TOKEN)"""
+    if not profiler.authorized(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify({'directory': profiler.settings.directory, 'profiles': profiler.list()}), 200
+
+@flask_app.route('/api/profiles/<path:filename>', methods=['GET'])
+def download_profile(filename):
+    """One profile file: <id>.speedscope.json (open in speedscope.app) or <id>.folded (flamegraph.pl)"""
+    if not profiler.authorized(request.headers):
+        return jsonify({'error': 'Admin token required'}), 403
+    return send_from_directory(os.path.abspath(profiler.settings.directory), filename, as_attachment=True)
+
+def get_llm_cache():
+    """The LLM response cache, or None if disabled or nothing has been analysed yet"""
+    loaded = loaded_workflow()
+    return loaded.llm_cache if loaded else None
+
+def cache_counters() -> list:
+    """LLM cache hit/miss totals as (name, labels, value) for /api/metrics"""
+    llm_cache = get_llm_cache()
+    if not llm_cache:
+        return []
+    stats = llm_cache.stats()
+    return [
+        ("nutrition_llm_cache_lookups_total", {"result": "hit"}, stats['hits']),
+        ("nutrition_llm_cache_lookups_total", {"result": "miss"}, stats['misses']),
+    ]
+
+def cache_gauges() -> list:
+    """LLM cache, scheduler and semantic cache sizes, pending jobs and analyses in flight as (name, labels, value) for /api/metrics"""
+    gauges = [("nutrition_jobs_pending", {}, jobs.pending()), ("nutrition_analyses_in_flight", {}, in_flight.in_flight())]
+    llm_cache = get_llm_cache()
+    if llm_cache:
+        stats = llm_cache.stats()
+        gauges += [("nutrition_llm_cache_entries", {"tier": tier}, size) for tier, size in stats['tier_sizes'].items()]
+    loaded = loaded_workflow()
+    if loaded and loaded.llm_scheduler:
+        stats = loaded.llm_scheduler.stats()
+        gauges.append(("nutrition_llm_calls_in_flight", {}, stats['in_flight']))
+        gauges += [("nutrition_llm_queue_depth", {"priority": priority}, depth) for priority, depth in stats['queued'].items()]
+        gauges += [("nutrition_llm_estimated_wait_seconds", {"priority": priority}, wait) for priority, wait in stats['estimated_wait_s'].items()]
+    if loaded and loaded.semantic_cache:
+        stats = loaded.semantic_cache.stats()
+        gauges += [
+            ("nutrition_semantic_cache_entries", {}, stats['entries']),
+            ("nutrition_semantic_cache_hit_ratio", {}, stats['hit_rate']),
+        ]
+    return gauges
+
+@flask_app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Prometheus text exposition: per-node and per-agent LLM latency histograms,
+    token/cost/retry/parse-failure counters, LLM cache counters and gauges
+    """
+    return Response(metrics.render_prometheus(cache_gauges(), cache_counters()), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 Starting Nutrition Assistant Web Server")
@@ -128,4 +783,8 @@ if __name__ == '__main__':
     print(f"🔧 API endpoint: http://localhost:5000/api/analyze")
     print(f"\nPress Ctrl+C to stop the server\n")
     
-    flask_app.run(host='0.0.0.0', port=5000, debug=True)
+    try:
+        flask_app.run(host='0.0.0.0', port=5000, debug=True)
+    finally:
+        # Queued jobs are dropped; running ones get a grace period
+        jobs.shutdown(JOBS_SHUTDOWN_SECONDS)
@@ -0,0 +1,117 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import metrics
+
+
+def is_rate_limit(error: BaseException) -> bool:
+    """True for provider rate-limit errors (HTTP 429, e.g. groq.RateLimitError)"""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from the Retry-After header of a 429 response, if present"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class SharedBackoff:
+    """
+    Rate-limit backoff shared by every LLM call in a batch. When any call is
+    rate limited, all calls pause until the backoff window has passed
+    (exponential, or the server's Retry-After), instead of each call retrying
+    on its own schedule and hammering the API together.
+    """
+
+    def __init__(self, max_retries: int = 6, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rate_limited = 0
+        self._consecutive = 0
+        self._resume_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        return max(0.0, self._resume_at - time.monotonic())
+
+    def _penalise(self, error: BaseException) -> None:
+        with self._lock:
+            self.rate_limited += 1
+            self._consecutive += 1
+            delay = _retry_after(error)
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * 2 ** (self._consecutive - 1))
+                delay *= 1 + random.random() * 0.1
+            self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def _succeeded(self) -> None:
+        self._consecutive = 0
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        """Runs fn, waiting out the shared window and retrying on rate limits"""
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.wait_time())
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                self._penalise(e)
+                metrics.inc("nutrition_llm_retries_total", reason="rate_limit")
+            else:
+                self._succeeded()
+                return result
+
+    async def acall(self, fn: Callable[[], Any]) -> Any:
+        """Async twin of call(); fn returns an awaitable"""
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.wait_time())
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limit(e) or attempt == self.max_retries:
+                    raise
+                self._penalise(e)
+                metrics.inc("nutrition_llm_retries_total", reason="rate_limit")
+            else:
+                self._succeeded()
+                return result
+
+
+def batch_config(max_concurrency: int, llm: Any = None, backoff: Optional[SharedBackoff] = None) -> Dict:
+    """
+    Graph config for a batch run: LangGraph caps the number of graphs in
+    flight at max_concurrency, and agent nodes pick the batch models (a
+    ModelRegistry or a single chat model), the shared backoff and the
+    batch priority class up from `configurable`.
+    """
+    # Batch calls queue behind interactive ones in the LLM scheduler
+    configurable = {"priority": "batch"}
+    if llm is not None:
+        configurable["llm"] = llm
+    if backoff is not None:
+        configurable["rate_limit_backoff"] = backoff
+    return {"max_concurrency": max_concurrency, "configurable": configurable}
+
+
+def run_batch(graph, states: List[Dict], config: Dict) -> Iterator[Tuple[int, Any]]:
+    """Runs the graph over every state; yields (index, final_state_or_exception) as each finishes"""
+    if not states:
+        return
+    yield from graph.batch_as_completed(states, config, return_exceptions=True)
+
+
+async def arun_batch(graph, states: List[Dict], config: Dict) -> AsyncIterator[Tuple[int, Any]]:
+    """Async twin of run_batch for the async graph"""
+    if not states:
+        return
+    async for index, result in graph.abatch_as_completed(states, config, return_exceptions=True):
+        yield index, result
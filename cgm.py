@@ -0,0 +1,273 @@
+"""
+Local summaries of continuous glucose monitor (CGM) exports.
+
+A CGM records a reading every few minutes, thousands per user per day.
+The readings never reach the LLM: summarise() reduces a series to trend,
+variability, spikes and time in range with vectorized NumPy windows, and
+to_health_data() turns that into the few health_data fields the agents
+read.
+"""
+import csv
+import itertools
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+# Consensus target range, mg/dL
+GLUCOSE_LOW = 70.0
+GLUCOSE_HIGH = 180.0
+MMOL_TO_MG_DL = 18.0
+
+# Trend: least-squares slope over the last hour; beyond +-30 mg/dL/h it is
+# reported as rising/falling
+TREND_WINDOW_SECONDS = 3600
+FAST_CHANGE_MG_DL_PER_HOUR = 30.0
+# Spike: glucose at least SPIKE_RISE above where it was SPIKE_WINDOW ago
+SPIKE_WINDOW_SECONDS = 3600
+SPIKE_RISE_MG_DL = 50.0
+# Time out of range only counts as an episode once it lasts this long
+EPISODE_MIN_SECONDS = 15 * 60
+# A reading stands for the time until the next one, up to this (sensor gaps)
+MAX_GAP_SECONDS = 15 * 60
+# Coefficient of variation above which glucose counts as unstable
+UNSTABLE_CV_PCT = 36.0
+SPIKY_PER_DAY = 2.0
+
+TIME_COLUMNS = ("timestamp", "time", "date", "datetime")
+GLUCOSE_COLUMNS = ("glucose", "sgv", "value", "mg/dl", "mmol/l")
+
+
+class Readings(NamedTuple):
+    times: np.ndarray    # Epoch seconds, float64
+    glucose: np.ndarray  # mg/dL, float64
+
+
+def parse_times(values) -> np.ndarray:
+    """
+    Epoch seconds from epoch numbers (seconds or milliseconds) or ISO 8601
+    strings. Strings are read as wall-clock time; offsets are dropped,
+    which keeps the spacing between readings of one export.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in "iuf":
+        times = array.astype(np.float64)
+        return times / 1000 if times.size and np.nanmax(times) > 1e11 else times
+    try:
+        return array.astype("U19").astype("datetime64[s]").astype(np.float64)
+    except (ValueError, TypeError):
+        # Mixed or missing values: one at a time, NaN (dropped) where unreadable
+        times = np.array([_time(value) for value in array.tolist()], dtype=np.float64)
+        return np.where(times > 1e11, times / 1000, times)
+
+
+def _time(value) -> float:
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        pass
+    try:
+        return float(np.datetime64(str(value)[:19], "s").astype(np.float64))
+    except (ValueError, TypeError):
+        return np.nan
+
+
+def to_readings(times, glucose) -> Readings:
+    """Sorted readings in mg/dL, one per timestamp, with unreadable values dropped"""
+    times = parse_times(times)
+    glucose = np.asarray(glucose, dtype=np.float64)
+    if times.shape != glucose.shape:
+        raise ValueError("timestamps and glucose values differ in length")
+    keep = np.isfinite(times) & np.isfinite(glucose)
+    times, glucose = times[keep], glucose[keep]
+    steps = np.diff(times)
+    if np.any(steps < 0):
+        order = np.argsort(times, kind="stable")
+        times, glucose = times[order], glucose[order]
+        steps = np.diff(times)
+    if np.any(steps == 0):
+        # Repeated timestamps (overlapping exports, re-sent readings) become one reading at their mean
+        times, index = np.unique(times, return_inverse=True)
+        glucose = np.bincount(index, weights=glucose) / np.bincount(index)
+    # mmol/L exports: no plausible mg/dL series has a median this low
+    if glucose.size and np.median(glucose) < 35:
+        glucose = glucose * MMOL_TO_MG_DL
+    return Readings(times, glucose)
+
+
+def _column(header: List[str], names: Tuple[str, ...]) -> Optional[int]:
+    lowered = [name.strip().lower() for name in header]
+    for name in names:
+        for index, column in enumerate(lowered):
+            if name in column:
+                return index
+    return None
+
+
+def readings_from_csv(lines: Iterable[str]) -> Readings:
+    """
+    Readings from CSV lines, consumed as they arrive. A header naming the
+    timestamp and glucose columns (e.g. "timestamp,glucose", Dexcom and
+    Libre exports) is looked for in the first row; without one the first
+    two columns are used. Rows without a numeric glucose value (device
+    events, "High"/"Low") are skipped.
+    """
+    rows = csv.reader(lines)
+    times: List[str] = []
+    values: List[str] = []
+    first = next((row for row in rows if row), [])
+    time_column, glucose_column = _column(first, TIME_COLUMNS), _column(first, GLUCOSE_COLUMNS)
+    if time_column is None or glucose_column is None:
+        # No header: the first row is data
+        time_column, glucose_column = 0, 1
+        rows = itertools.chain([first], rows)
+    width = max(time_column, glucose_column) + 1
+    for row in rows:
+        if len(row) >= width:
+            times.append(row[time_column])
+            values.append(row[glucose_column])
+
+    glucose = _numbers(values)
+    keep = ~np.isnan(glucose)
+    stamps = np.asarray(times)[keep]
+    if stamps.size and not np.isnan(_numbers(stamps[:1])[0]):
+        stamps = _numbers(stamps)
+    return to_readings(stamps, glucose[keep])
+
+
+def _numbers(values) -> np.ndarray:
+    """Floats from strings, NaN where a value is not a number"""
+    try:
+        return np.asarray(values).astype(np.float64)
+    except ValueError:
+        return np.array([_number(value) for value in values], dtype=np.float64)
+
+
+def _number(value: str) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def readings_from_json(payload) -> Readings:
+    """
+    Readings from parsed JSON: {"timestamps": [...], "glucose": [...]},
+    [[timestamp, glucose], ...] or [{"timestamp": ..., "glucose": ...}, ...]
+    (also "time"/"date" and "value"/"sgv" keys, as in Nightscout entries)
+    """
+    if isinstance(payload, dict):
+        return to_readings(payload.get("timestamps", []), payload.get("glucose", []))
+    if not payload:
+        return to_readings([], [])
+    if isinstance(payload[0], dict):
+        time_key = next((key for key in ("timestamp", "time", "date", "datetime") if key in payload[0]), None)
+        glucose_key = next((key for key in ("glucose", "sgv", "value") if key in payload[0]), None)
+        if time_key is None or glucose_key is None:
+            raise ValueError("readings need a timestamp and a glucose value")
+        return to_readings([entry.get(time_key) for entry in payload], [entry.get(glucose_key, np.nan) for entry in payload])
+    pairs = list(zip(*payload))
+    return to_readings(pairs[0], pairs[1])
+
+
+def _episodes(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Start and end (exclusive) indices of each run of True in mask"""
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def summarise(readings: Readings) -> Dict:
+    """Trend, variability, spikes and time in range of a series, in mg/dL and percent"""
+    times, glucose = readings
+    if glucose.size < 2:
+        raise ValueError("need at least two glucose readings")
+
+    # Each reading stands for the time until the next one, capped at sensor gaps
+    gaps = np.diff(times)
+    if not np.all(gaps > 0):
+        raise ValueError("readings need distinct, increasing timestamps (see to_readings)")
+    interval = float(np.median(gaps))
+    weights = np.minimum(np.append(gaps, interval), MAX_GAP_SECONDS)
+    covered = np.cumsum(weights)
+    total = float(covered[-1]) or 1.0
+    below, above = glucose < GLUCOSE_LOW, glucose > GLUCOSE_HIGH
+
+    mean = float(np.average(glucose, weights=weights))
+    sd = float(np.sqrt(np.average((glucose - mean) ** 2, weights=weights)))
+    days = float(max(times[-1] - times[0], interval)) / 86400
+
+    # Out-of-range episodes long enough to count
+    def episodes(mask):
+        starts, ends = _episodes(mask)
+        durations = covered[ends - 1] - covered[starts] + weights[starts]
+        return int(np.count_nonzero(durations >= EPISODE_MIN_SECONDS))
+
+    # Spikes: runs where glucose sits SPIKE_RISE above its level a window earlier
+    earlier = np.searchsorted(times, times - SPIKE_WINDOW_SECONDS)
+    rise = glucose - glucose[earlier]
+    spike_starts, _ = _episodes(rise >= SPIKE_RISE_MG_DL)
+
+    # Trend: least-squares slope over the last window
+    recent = slice(int(np.searchsorted(times, times[-1] - TREND_WINDOW_SECONDS)), None)
+    x = times[recent] - times[recent].mean()
+    spread = float(x @ x)
+    slope = float(x @ (glucose[recent] - glucose[recent].mean())) / spread * 3600 if spread else 0.0
+
+    return {
+        "readings": int(glucose.size),
+        "days": round(days, 2),
+        "mean_mg_dl": round(mean, 1),
+        "sd_mg_dl": round(sd, 1),
+        "cv_pct": round(100 * sd / mean, 1) if mean else 0.0,
+        # Glucose management indicator, an HbA1c estimate from the mean
+        "gmi_pct": round(3.31 + 0.02392 * mean, 1),
+        "time_in_range_pct": round(100 * float(weights[~below & ~above].sum()) / total, 1),
+        "time_below_pct": round(100 * float(weights[below].sum()) / total, 1),
+        "time_above_pct": round(100 * float(weights[above].sum()) / total, 1),
+        "low_episodes": episodes(below),
+        "high_episodes": episodes(above),
+        "spikes": int(spike_starts.size),
+        "spikes_per_day": round(spike_starts.size / days, 2) if days else 0.0,
+        "max_rise_mg_dl": round(float(rise.max()), 1),
+        "latest_mg_dl": round(float(glucose[-1]), 1),
+        "trend_mg_dl_per_hour": round(slope, 1),
+    }
+
+
+def trend_label(summary: Dict) -> str:
+    """One-word glucose trend as the agents and recipe index read it"""
+    if summary["latest_mg_dl"] < GLUCOSE_LOW:
+        return "Low"
+    if summary["trend_mg_dl_per_hour"] >= FAST_CHANGE_MG_DL_PER_HOUR:
+        return "Rising"
+    if summary["trend_mg_dl_per_hour"] <= -FAST_CHANGE_MG_DL_PER_HOUR:
+        return "Falling"
+    if summary["latest_mg_dl"] > GLUCOSE_HIGH:
+        return "High"
+    if summary["spikes_per_day"] >= SPIKY_PER_DAY or summary["cv_pct"] >= UNSTABLE_CV_PCT:
+        return "Spiking"
+    return "Stable"
+
+
+def describe(summary: Dict) -> str:
+    """The summary as one line for the agent prompts"""
+    return (
+        f"latest {summary['latest_mg_dl']:.0f} mg/dL, {summary['trend_mg_dl_per_hour']:+.0f} mg/dL/h; "
+        f"{summary['time_in_range_pct']:.0f}% in range {GLUCOSE_LOW:.0f}-{GLUCOSE_HIGH:.0f}, "
+        f"{summary['time_below_pct']:.0f}% under, {summary['time_above_pct']:.0f}% over; "
+        f"mean {summary['mean_mg_dl']:.0f} mg/dL, CV {summary['cv_pct']:.0f}%; "
+        f"{summary['spikes_per_day']:.1f} spikes/day over {summary['days']:.1f} days"
+    )
+
+
+def to_health_data(summary: Dict, health_data: Optional[Dict] = None) -> Dict:
+    """
+    health_data for the workflow: the client's fields (energy level, ...)
+    with glucose_trend replaced by the computed label and the one-line
+    summary in glucose_summary
+    """
+    return {
+        **(health_data or {}),
+        "glucose_trend": trend_label(summary),
+        "glucose_summary": describe(summary),
+    }
+
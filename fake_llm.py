@@ -0,0 +1,168 @@
+"""
+Deterministic local stand-in for the Groq chat model, for load tests and
+benchmarks that should not spend API credits (LLM_PROVIDER=fake).
+
+Replies are canned per agent (valid JSON for the JSON-producing agents)
+and take a simulated time: a log-normal time to first token plus the
+completion tokens at a log-normal token rate. Both are seeded from the
+prompt, so the same prompt always gets the same reply and latency no matter
+how many requests run concurrently.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Dict, Iterator, List, Mapping, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from triggers import TriggerClassifier
+
+NUTRITIONIST_PLAN = """**Meal: Grilled Chicken Quinoa Bowl with Roasted Vegetables**
+
+**Key ingredients**
+- 1 grilled chicken breast
+- 1/2 cup cooked quinoa
+- 1 cup roasted broccoli and bell peppers
+- 1 tbsp olive oil and lemon dressing
+
+**Why this meal fits right now**
+Lean protein and fibre release energy slowly, which steadies glucose after a spike and
+lifts low energy without the crash that comfort food brings. A warm, filling bowl also
+answers stress-driven cravings with something satisfying.
+
+**Nutritional benefits**
+- About 35 g of protein for satiety
+- Complex carbohydrates with a low glycemic load
+- Magnesium and B vitamins that support energy metabolism"""
+
+LOGISTICS = {
+    "grocery_items": ["2 chicken breasts", "1 cup quinoa", "1 head broccoli", "2 bell peppers", "1 lemon"],
+    "prep_time_minutes": 35,
+    "best_prep_day": "Sunday",
+    "best_prep_time": "5:00 PM",
+    "meal_prep_tips": ["Cook the quinoa in a double batch", "Roast vegetables on one tray", "Portion into containers while warm"],
+    "trigger_specific_advice": "Keep a prepared bowl ready for high-stress afternoons",
+    "storage_instructions": "Refrigerate in airtight containers for up to 4 days",
+    "serving_suggestions": "Reheat the chicken and vegetables; add dressing just before eating",
+}
+
+MEAL_PLAN = {
+    **LOGISTICS,
+    "meal": "Grilled Chicken Quinoa Bowl with Roasted Vegetables",
+    "ingredients": ["chicken breast", "quinoa", "broccoli", "bell pepper", "lemon"],
+    "rationale": "Lean protein and fibre steady glucose and energy and answer stress cravings.",
+    "nutritional_benefits": ["High protein", "Low glycemic load", "Rich in magnesium"],
+}
+
+SUMMARY = "The user has shared journals about work stress and afternoon energy dips and asked for practical meals."
+
+_JOURNAL = re.compile(r'Journal: "(.*?)"', re.DOTALL)
+_PROFILE = re.compile(r"Current Profile: (\{.*?\})\s*$", re.MULTILINE)
+
+_classifier = TriggerClassifier()
+
+
+def canned_reply(prompt: str) -> Tuple[str, str]:
+    """(agent, reply) for a rendered prompt, recognised by each agent's instructions"""
+    if "Nutritionist and meal planning logistics expert" in prompt:
+        return "meal_planner_agent", json.dumps(MEAL_PLAN)
+    if "meal planning logistics expert" in prompt:
+        return "logistics_agent", json.dumps(LOGISTICS)
+    if "expert Nutritionist" in prompt:
+        return "nutritionist_agent", NUTRITIONIST_PLAN
+    if "Preference Learning Agent" in prompt:
+        match = _PROFILE.search(prompt)
+        profile = json.loads(match.group(1)) if match else {}
+        profile = {"name": "User", "diet": "No specific diet", "allergies": [], "likes": [], "dislikes": [], **profile}
+        return "preference_agent", json.dumps(profile)
+    if "eating triggers" in prompt:
+        match = _JOURNAL.search(prompt)
+        triggers, _ = _classifier.classify(match.group(1) if match else prompt)
+        return "trigger_detective", json.dumps(triggers or ["Stress"])
+    if "Summarise the conversation" in prompt:
+        return "history_summary", SUMMARY
+    return "unknown", "OK"
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model returning canned replies after a simulated, seeded latency"""
+
+    model_name: str = "fake"
+    ttft_ms: float = 300.0
+    ttft_sigma: float = 0.3
+    tokens_per_second: float = 500.0
+    rate_sigma: float = 0.2
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def _render(self, messages: List) -> str:
+        return "\n".join(str(message.content) for message in messages)
+
+    def plan(self, messages: List) -> Tuple[str, str, int, int, float, float]:
+        """(agent, reply, prompt tokens, completion tokens, ttft seconds, seconds per token)"""
+        prompt = self._render(messages)
+        agent, reply = canned_reply(prompt)
+        digest = hashlib.sha256(f"{self.seed}\x00{self.model_name}\x00{prompt}".encode("utf-8")).digest()
+        rng = random.Random(int.from_bytes(digest[:8], "big"))
+        ttft = self.ttft_ms / 1000 * rng.lognormvariate(0, self.ttft_sigma)
+        rate = self.tokens_per_second * rng.lognormvariate(0, self.rate_sigma)
+        return agent, reply, max(1, len(prompt) // 4), max(1, len(reply) // 4), ttft, 1 / rate
+
+    def _message(self, messages: List) -> Tuple[AIMessage, float]:
+        _, reply, prompt_tokens, completion_tokens, ttft, per_token = self.plan(messages)
+        usage = {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+        message = AIMessage(content=reply, usage_metadata=usage, response_metadata={"model_name": self.model_name})
+        return message, ttft + completion_tokens * per_token
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, seconds = self._message(messages)
+        time.sleep(seconds)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message, seconds = self._message(messages)
+        await asyncio.sleep(seconds)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        _, reply, _, _, ttft, per_token = self.plan(messages)
+        time.sleep(ttft)
+        # Roughly one token per four characters
+        for start in range(0, len(reply), 4):
+            time.sleep(per_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=reply[start:start + 4]))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def build_fake_llm(model: str = "fake", env: Mapping[str, str] = os.environ, **overrides) -> FakeChatModel:
+    """
+    A FakeChatModel configured from FAKE_LLM_TTFT_MS (median time to first
+    token, default 300), FAKE_LLM_TTFT_SIGMA (log-normal spread, 0.3),
+    FAKE_LLM_TOKENS_PER_SECOND (median, 500), FAKE_LLM_RATE_SIGMA (0.2)
+    and FAKE_LLM_SEED (0)
+    """
+    settings = dict(
+        model_name=model,
+        ttft_ms=float(env.get("FAKE_LLM_TTFT_MS", "300")),
+        ttft_sigma=float(env.get("FAKE_LLM_TTFT_SIGMA", "0.3")),
+        tokens_per_second=float(env.get("FAKE_LLM_TOKENS_PER_SECOND", "500")),
+        rate_sigma=float(env.get("FAKE_LLM_RATE_SIGMA", "0.2")),
+        seed=int(env.get("FAKE_LLM_SEED", "0")),
+    )
+    settings.update(overrides)
+    return FakeChatModel(**settings)
@@ -0,0 +1,114 @@
+import os
+import re
+from typing import List, Mapping, NamedTuple, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+# Prompt for "llm" summaries; the transcript of the older turns follows it
+SUMMARY_PROMPT = """
+    Summarise the conversation below for another assistant in at most {max_words} words.
+    Keep every fact about the user's food preferences, diet, allergies, likes, dislikes
+    and eating triggers. Drop greetings, formatting and meal plan details.
+    Return only the summary.
+    """
+
+_FIRST_SENTENCE = re.compile(r"^(.+?[.!?])(?:\s|$)", re.DOTALL)
+
+
+class HistoryPolicy(NamedTuple):
+    """
+    How much conversation is kept (in a stored thread or an agent's prompt).
+    The last `window` messages are kept verbatim while they fit in
+    `max_tokens`; anything older is folded into one summary message
+    ("extractive", "llm") or dropped ("off").
+    """
+    max_tokens: int = 1500
+    window: int = 6
+    summary: str = "extractive"
+
+
+def load_policy(scope: str, env: Mapping[str, str] = os.environ, defaults: HistoryPolicy = HistoryPolicy()) -> HistoryPolicy:
+    """
+    Reads HISTORY_MAX_TOKENS / HISTORY_WINDOW / HISTORY_SUMMARY, each of which
+    can be overridden per scope, e.g. HISTORY_PREFERENCE_WINDOW=4.
+    """
+    prefix = f"HISTORY_{scope.upper()}_"
+
+    def setting(name, default):
+        return env.get(prefix + name, env.get(f"HISTORY_{name}", default))
+
+    return HistoryPolicy(
+        max_tokens=int(setting("MAX_TOKENS", defaults.max_tokens)),
+        window=int(setting("WINDOW", defaults.window)),
+        summary=str(setting("SUMMARY", defaults.summary)).lower(),
+    )
+
+
+def count_tokens(messages: Sequence[BaseMessage]) -> int:
+    """Approximate prompt tokens for a list of messages (no tokenizer needed)"""
+    return count_tokens_approximately(messages) if messages else 0
+
+
+def split_history(messages: Sequence[BaseMessage], policy: HistoryPolicy) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Splits messages into (older, recent): recent is at most `window` messages
+    and fits the token budget left after the summary's share, except that
+    the newest message is always kept.
+    """
+    messages = list(messages)
+    if len(messages) <= policy.window and count_tokens(messages) <= policy.max_tokens:
+        return [], messages
+
+    budget = policy.max_tokens - summary_budget(policy)
+    recent = messages[-policy.window:] if policy.window > 0 else messages[-1:]
+    while len(recent) > 1 and count_tokens(recent) > budget:
+        recent = recent[1:]
+    return messages[:len(messages) - len(recent)], recent
+
+
+def summary_budget(policy: HistoryPolicy) -> int:
+    """Share of the token budget reserved for the summary of older turns"""
+    return 0 if policy.summary == "off" else policy.max_tokens // 4
+
+
+def _speaker(message: BaseMessage) -> str:
+    if isinstance(message, HumanMessage):
+        return "User"
+    if isinstance(message, AIMessage):
+        return "Assistant"
+    return "System"
+
+
+def render_transcript(messages: Sequence[BaseMessage]) -> str:
+    """Plain-text transcript used as input to an "llm" summary"""
+    return "\n".join(f"{_speaker(m)}: {m.content}" for m in messages)
+
+
+def extractive_summary(messages: Sequence[BaseMessage], max_tokens: int) -> str:
+    """
+    One line per message (its first sentence, clipped), newest lines kept
+    first when the budget runs out. Earlier summaries are carried over whole.
+    """
+    lines: List[str] = []
+    used = 0
+    for message in reversed(messages):
+        text = str(message.content).strip()
+        if text.startswith(SUMMARY_PREFIX):
+            line = text[len(SUMMARY_PREFIX):].strip()
+        else:
+            first = _FIRST_SENTENCE.match(text)
+            sentence = " ".join((first.group(1) if first else text).split())
+            line = f"- {_speaker(message)}: {sentence[:200]}"
+        cost = count_tokens([HumanMessage(content=line)])
+        if lines and used + cost > max_tokens:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(reversed(lines))
+
+
+def summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=f"{SUMMARY_PREFIX}\n{summary.strip()}")
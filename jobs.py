@@ -0,0 +1,143 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from metrics import metrics
+
+
+class Job:
+    """One piece of deferred work and its outcome"""
+
+    def __init__(self, key: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.status = "pending"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = {"id": self.id, "status": self.status, "created": round(self.created, 3)}
+        if self.finished is not None:
+            payload["elapsed_ms"] = round((self.finished - self.created) * 1000, 1)
+        if self.status == "done":
+            payload["result"] = self.result
+        elif self.status == "error":
+            payload["error"] = self.error
+        return payload
+
+
+class JobQueue:
+    """
+    Runs deferred work on a bounded thread pool and keeps each job's
+    outcome for ttl_seconds after it finishes. At most max_pending jobs
+    wait or run at once; submit() returns None beyond that so the caller
+    can do the work inline. A job may carry a key (e.g. a graph thread id)
+    so later work on the same key can wait for it first.
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 256, ttl_seconds: float = 600):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._by_key: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+
+    def _expire(self, now: float) -> None:
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished is not None and job.finished + self.ttl_seconds < now]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.finished is None)
+
+    def submit(self, work: Callable[[], Any], key: Optional[str] = None) -> Optional[Job]:
+        """Queues work() on the pool; None if max_pending jobs are already waiting or running"""
+        with self._lock:
+            self._expire(time.time())
+            if self._closed:
+                return None
+            if sum(1 for job in self._jobs.values() if job.finished is None) >= self.max_pending:
+                metrics.inc("nutrition_jobs_total", outcome="rejected")
+                return None
+            job = Job(key)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+            pool = self._pool
+        pool.submit(self._run, job, work)
+        return job
+
+    def _run(self, job: Job, work: Callable[[], Any]) -> None:
+        with self._lock:
+            if job.finished is not None:  # cancelled by shutdown()
+                return
+            job.status = "running"
+        try:
+            result = work()
+        except Exception as e:
+            job.error, job.status = str(e), "error"
+        else:
+            job.result, job.status = result, "done"
+        job.finished = time.time()
+        metrics.inc("nutrition_jobs_total", outcome=job.status)
+        metrics.observe("nutrition_job_duration_seconds", job.finished - job.created)
+        with self._lock:
+            if job.key is not None and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+        job.done.set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """The job, or None if it is unknown or expired"""
+        with self._lock:
+            self._expire(time.time())
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Like get(), but first waits up to `timeout` seconds for the job to finish (long polling)"""
+        job = self.get(job_id)
+        if job is not None:
+            job.done.wait(timeout)
+        return job
+
+    def wait_for_key(self, key: str, timeout: float) -> None:
+        """Waits up to `timeout` seconds for the unfinished job on `key`, if there is one"""
+        with self._lock:
+            job = self._by_key.get(key)
+        if job is not None:
+            job.done.wait(timeout)
+
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Stops taking jobs, fails the ones that have not started and waits up
+        to `timeout` seconds (None: no limit) for the running ones to finish
+        """
+        with self._lock:
+            self._closed = True
+            pool, self._pool = self._pool, None
+            cancelled = [job for job in self._jobs.values() if job.status == "pending"]
+            for job in cancelled:
+                job.error, job.status = "server shutting down", "error"
+                job.finished = time.time()
+                if job.key is not None and self._by_key.get(job.key) is job:
+                    del self._by_key[job.key]
+            running = [job for job in self._jobs.values() if job.finished is None]
+        for job in cancelled:
+            metrics.inc("nutrition_jobs_total", outcome="cancelled")
+            job.done.set()
+        if pool is None:
+            return
+        pool.shutdown(wait=False, cancel_futures=True)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in running:
+            job.done.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
@@ -0,0 +1,271 @@
+import ast
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# Characters the scanner has to look at outside / inside a JSON string
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+# Per-agent output schemas for the JSON-producing agents in main.py
+PROFILE_SCHEMA = {"name": str, "diet": str, "allergies": [str], "likes": [str], "dislikes": [str]}
+TRIGGERS_SCHEMA = [str]
+LOGISTICS_SCHEMA = {
+    "grocery_items": [str],
+    "prep_time_minutes": int,
+    "best_prep_day": str,
+    "best_prep_time": str,
+    "meal_prep_tips": [str],
+    "trigger_specific_advice": str,
+    "storage_instructions": str,
+    "serving_suggestions": str,
+}
+MEAL_PLAN_SCHEMA = {
+    **LOGISTICS_SCHEMA,
+    "meal": str,
+    "ingredients": [str],
+    "rationale": str,
+    "nutritional_benefits": [str],
+}
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no usable JSON value can be recovered from LLM output"""
+
+
+class SchemaError(ValueError):
+    """Raised when an extracted value does not fit the expected schema"""
+
+
+def _loads_lenient(candidate: str) -> Any:
+    """json.loads, then trailing-comma repair, then Python-literal syntax ('single quotes')"""
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        pass
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate)
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError:
+        pass
+    try:
+        value = ast.literal_eval(repaired)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        raise JSONExtractionError(f"Could not parse JSON candidate: {candidate[:80]!r}")
+    if not isinstance(value, (dict, list)):
+        raise JSONExtractionError(f"Could not parse JSON candidate: {candidate[:80]!r}")
+    return value
+
+
+class JSONStreamExtractor:
+    """
+    Finds the first balanced JSON object or array in text that may arrive in
+    pieces (e.g. LLM tokens). Prose, markdown fences and anything after the
+    value are ignored. feed() returns the value as soon as its closing
+    bracket arrives; finish() additionally repairs output that was cut off.
+    Each chunk is scanned once on arrival, so streaming n chunks costs O(n)
+    in the total length (the text is only joined to parse a candidate).
+    """
+
+    def __init__(self, start_chars: str = "{["):
+        self.start_chars = start_chars
+        self.value: Any = None
+        self.done = False
+        self._parts: List[str] = []
+        self._length = 0
+        self._escaped = False  # the last chunk ended inside a string escape
+        self._reset_candidate()
+
+    def _reset_candidate(self):
+        self._start: Optional[int] = None
+        self._stack: List[str] = []
+        self._in_string = False
+        # Last point where the value could be cut and closed cleanly
+        self._cut: Optional[Tuple[int, List[str]]] = None
+
+    def _text(self) -> str:
+        """Everything fed so far (joined once, then kept joined)"""
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, chunk: str) -> Any:
+        """Consumes the next piece of text; returns the parsed value once complete, else None"""
+        if self.done or not chunk:
+            return self.value if self.done else None
+        base = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        restart = self._scan(chunk, base)
+        # A balanced candidate that was not JSON: rescan from just after its start
+        while restart is not None and not self.done:
+            restart = self._scan(self._text()[restart:], restart)
+        return self.value if self.done else None
+
+    def _scan(self, text: str, base: int) -> Optional[int]:
+        """
+        Scans `text`, which starts at offset `base` of everything fed, from
+        where the previous chunk left off. Returns the offset to rescan from
+        when a candidate turns out not to be JSON, else None.
+        """
+        pos = 0
+        if self._escaped:
+            self._escaped = False
+            pos = 1
+
+        while pos < len(text):
+            if self._start is None:
+                starts = [i for i in (text.find(c, pos) for c in self.start_chars) if i != -1]
+                if not starts:
+                    return None
+                start = min(starts)
+                self._start = base + start
+                self._stack = [_CLOSERS[text[start]]]
+                self._cut = (self._start + 1, list(self._stack))
+                pos = start + 1
+                continue
+
+            if self._in_string:
+                match = _STRING_SPECIAL.search(text, pos)
+                if match is None:
+                    return None
+                if match.group() == "\\":
+                    if match.end() >= len(text):
+                        # Escape split across chunks - skip its character in the next one
+                        self._escaped = True
+                        return None
+                    pos = match.end() + 1
+                    continue
+                self._in_string = False
+                pos = match.end()
+                continue
+
+            match = _STRUCTURAL.search(text, pos)
+            if match is None:
+                return None
+            ch = match.group()
+            pos = match.end()
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == ",":
+                self._cut = (base + match.start(), list(self._stack))
+            elif ch in _CLOSERS:
+                self._stack.append(_CLOSERS[ch])
+                self._cut = (base + pos, list(self._stack))
+            elif self._stack and ch == self._stack[-1]:
+                self._stack.pop()
+                if not self._stack:
+                    start = self._start
+                    try:
+                        self.value = _loads_lenient(self._text()[start:base + pos])
+                        self.done = True
+                        return None
+                    except JSONExtractionError:
+                        # Balanced but not JSON (e.g. "[sic]" in prose) - keep looking
+                        self._reset_candidate()
+                        return start + 1
+            else:
+                # Mismatched bracket - this candidate is not JSON
+                start = self._start
+                self._reset_candidate()
+                return start + 1
+        return None
+
+    def finish(self) -> Any:
+        """
+        Returns the extracted value, repairing a truncated one by closing any
+        open string and brackets (or dropping the last partial element).
+        Raises JSONExtractionError if nothing usable was found.
+        """
+        if self.done:
+            return self.value
+        if self._start is None:
+            raise JSONExtractionError("No JSON object or array found")
+
+        text = self._text()
+        tail = text[self._start:]
+        if self._in_string:
+            tail += '"'
+        closers = "".join(reversed(self._stack))
+        candidates = [tail.rstrip().rstrip(",:") + closers]
+        if self._cut is not None:
+            cut_at, cut_stack = self._cut
+            cut_candidate = text[self._start:cut_at] + "".join(reversed(cut_stack))
+            # A list item cut off mid-string ("Anx") is junk - prefer dropping it
+            if self._in_string and self._stack[-1] == "]":
+                candidates.insert(0, cut_candidate)
+            else:
+                candidates.append(cut_candidate)
+
+        for candidate in candidates:
+            try:
+                self.value = _loads_lenient(candidate)
+                self.done = True
+                return self.value
+            except JSONExtractionError:
+                continue
+        raise JSONExtractionError(f"Could not repair truncated JSON: {tail[:80]!r}")
+
+
+def validate(value: Any, schema: Any, path: str = "$") -> Any:
+    """
+    Checks (and lightly coerces) a value against a schema, where a schema is
+    a type (str, int, float, bool), a one-item list [item_schema] or a dict
+    {field: schema}. Object fields are optional and unknown fields are kept;
+    scalars are coerced where unambiguous ("30" -> 30, "x" -> ["x"]).
+    Raises SchemaError on a structural mismatch.
+    """
+    if isinstance(schema, list):
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+            value = [value]
+        if not isinstance(value, list):
+            raise SchemaError(f"{path}: expected a list, got {type(value).__name__}")
+        return [validate(item, schema[0], f"{path}[{i}]") for i, item in enumerate(value)]
+
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise SchemaError(f"{path}: expected an object, got {type(value).__name__}")
+        checked = dict(value)
+        for field, field_schema in schema.items():
+            if checked.get(field) is not None:
+                checked[field] = validate(checked[field], field_schema, f"{path}.{field}")
+        return checked
+
+    if schema is str:
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+    elif schema in (int, float):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return schema(value)
+        if isinstance(value, str):
+            number = re.match(r"\s*(\d+(?:\.\d+)?)", value)
+            if number:
+                return schema(float(number.group(1)))
+    elif schema is bool and isinstance(value, bool):
+        return value
+
+    raise SchemaError(f"{path}: expected {schema.__name__}, got {value!r}")
+
+
+def parse_json(text: str, schema: Any = None) -> Any:
+    """
+    Extracts the first JSON object/array from LLM output, repairing common
+    truncation, and validates it against `schema` when given.
+    Raises JSONExtractionError / SchemaError (both ValueError).
+    """
+    if isinstance(schema, dict):
+        start_chars = "{"
+    elif isinstance(schema, list):
+        start_chars = "["
+    else:
+        start_chars = "{["
+    extractor = JSONStreamExtractor(start_chars=start_chars)
+    extractor.feed(text or "")
+    value = extractor.finish()
+    return validate(value, schema) if schema is not None else value
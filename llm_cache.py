@@ -0,0 +1,218 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration
+
+
+# Constructor arguments that change how a call is sent, not what it returns
+TRANSPORT_PARAMS = frozenset({
+    "max_retries", "request_timeout", "timeout", "http_client", "http_async_client",
+    "groq_api_key", "openai_api_key", "api_key", "groq_api_base", "base_url", "groq_proxy",
+    "default_headers", "default_query", "streaming",
+})
+
+
+def model_identity(llm_string: str) -> str:
+    """
+    `llm_string` without transport settings, so models that differ only in
+    retries, timeouts or HTTP clients (e.g. the batch registry's
+    max_retries=0 models) share cache entries. Serializable models come as
+    '<constructor JSON>---<call params>'; anything else is kept as is.
+    """
+    constructor, separator, call_params = llm_string.rpartition("---")
+    if not separator:
+        return llm_string
+    try:
+        serialized = json.loads(constructor)
+    except ValueError:
+        return llm_string
+    kwargs = serialized.get("kwargs") if isinstance(serialized, dict) else None
+    if not isinstance(kwargs, dict):
+        return llm_string
+    serialized["kwargs"] = {name: value for name, value in kwargs.items() if name not in TRANSPORT_PARAMS}
+    return json.dumps(serialized, sort_keys=True) + separator + call_params
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Content address for one LLM call. LangChain passes the rendered messages as
+    `prompt` and the model name plus invocation parameters as `llm_string`;
+    only the model's identity and sampling parameters count (see model_identity).
+    """
+    return hashlib.sha256(f"{model_identity(llm_string)}\x00{prompt}".encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """In-process LRU tier with a per-entry TTL (ttl_seconds=0 disables expiry)"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """On-disk tier that survives restarts; entries are stored as serialised chat messages"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str = ".llm_cache.sqlite", ttl_seconds: float = 86400):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[RETURN_VAL_TYPE]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+        return [ChatGeneration(message=message) for message in messages_from_dict(json.loads(value))]
+
+    def set(self, key: str, value: RETURN_VAL_TYPE) -> None:
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds else 0
+        serialised = json.dumps([message_to_dict(generation.message) for generation in value])
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, serialised, expires_at),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+def _mark_cache_hit(value: RETURN_VAL_TYPE, tier: str) -> RETURN_VAL_TYPE:
+    """Copies of the cached generations tagged with response_metadata["cache_hit"]"""
+    marked = []
+    for generation in value:
+        message = getattr(generation, "message", None)
+        if message is None:
+            marked.append(generation)
+            continue
+        metadata = {**(message.response_metadata or {}), "cache_hit": tier}
+        marked.append(ChatGeneration(message=message.model_copy(update={"response_metadata": metadata}),
+                                     generation_info=generation.generation_info))
+    return marked
+
+
+class LLMResponseCache(BaseCache):
+    """
+    Content-addressed LLM response cache, plugged into a chat model via its
+    `cache=` argument so every invoke/ainvoke/stream goes through it.
+    Tiers are checked in order (fastest first); a hit in a slower tier is
+    copied into the faster ones. Any object with get/set/clear can be a tier.
+    """
+
+    def __init__(self, tiers: Sequence[Any]):
+        self.tiers = list(tiers)
+        self.hits = 0
+        self.misses = 0
+        self.tier_hits: Dict[str, int] = {tier.name: 0 for tier in self.tiers}
+        self._stats_lock = threading.Lock()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        for index, tier in enumerate(self.tiers):
+            value = tier.get(key)
+            if value is not None:
+                for faster in self.tiers[:index]:
+                    faster.set(key, value)
+                with self._stats_lock:
+                    self.hits += 1
+                    self.tier_hits[tier.name] += 1
+                return _mark_cache_hit(value, tier.name)
+        with self._stats_lock:
+            self.misses += 1
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = cache_key(prompt, llm_string)
+        for tier in self.tiers:
+            tier.set(key, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "tier_hits": dict(self.tier_hits),
+            "tier_sizes": {tier.name: len(tier) for tier in self.tiers},
+        }
+
+
+def build_llm_cache(mode: str, max_entries: int = 1024, ttl_seconds: float = 3600,
+                    sqlite_path: str = ".llm_cache.sqlite") -> Optional[LLMResponseCache]:
+    """
+    Builds the cache for a mode string:
+    "off" -> no cache, "memory" -> LRU+TTL only, "sqlite" -> LRU+TTL in front of SQLite.
+    """
+    mode = (mode or "off").lower()
+    if mode == "off":
+        return None
+
+    tiers: List[Any] = [MemoryTier(max_entries=max_entries, ttl_seconds=ttl_seconds)]
+    if mode == "sqlite":
+        tiers.append(SQLiteTier(path=sqlite_path, ttl_seconds=ttl_seconds))
+    elif mode != "memory":
+        raise ValueError(f"Unknown LLM cache mode: {mode!r} (expected off, memory or sqlite)")
+    return LLMResponseCache(tiers)
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Mapping, NamedTuple, Optional
+
+from metrics import metrics
+
+
+class DeadlineExceeded(TimeoutError):
+    """An LLM call ran past its per-agent timeout or the request deadline"""
+
+
+class ClientSettings(NamedTuple):
+    """HTTP pool, timeouts and hedging for every LLM call (see load_client_settings)"""
+    pool_size: int = 20
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    max_retries: int = 2
+    agent_timeout: float = 60.0
+    agent_timeouts: Dict[str, float] = {}
+    hedge: bool = False
+    hedge_delay_ms: Optional[float] = None
+    hedge_min_delay_ms: float = 250.0
+    hedge_min_samples: int = 20
+
+
+def _parse_timeouts(value: str) -> Dict[str, float]:
+    """'trigger_detective=15,nutritionist_agent=45' -> {agent: seconds}"""
+    timeouts = {}
+    for item in value.split(","):
+        if "=" in item:
+            agent, seconds = item.split("=", 1)
+            timeouts[agent.strip()] = float(seconds)
+    return timeouts
+
+
+def load_client_settings(env: Mapping[str, str] = os.environ) -> ClientSettings:
+    """
+    Reads LLM_POOL_SIZE, LLM_CONNECT_TIMEOUT / LLM_READ_TIMEOUT (seconds),
+    LLM_MAX_RETRIES, LLM_AGENT_TIMEOUT (seconds per call) with per-agent
+    LLM_AGENT_TIMEOUTS ("agent=seconds,..."), and LLM_HEDGE (on/off) with
+    LLM_HEDGE_DELAY_MS (unset: the agent's rolling p95 latency),
+    LLM_HEDGE_MIN_DELAY_MS and LLM_HEDGE_MIN_SAMPLES.
+    """
+    defaults = ClientSettings()
+    delay = env.get("LLM_HEDGE_DELAY_MS")
+    return ClientSettings(
+        pool_size=int(env.get("LLM_POOL_SIZE", defaults.pool_size)),
+        connect_timeout=float(env.get("LLM_CONNECT_TIMEOUT", defaults.connect_timeout)),
+        read_timeout=float(env.get("LLM_READ_TIMEOUT", defaults.read_timeout)),
+        max_retries=int(env.get("LLM_MAX_RETRIES", defaults.max_retries)),
+        agent_timeout=float(env.get("LLM_AGENT_TIMEOUT", defaults.agent_timeout)),
+        agent_timeouts=_parse_timeouts(env.get("LLM_AGENT_TIMEOUTS", "")),
+        hedge=env.get("LLM_HEDGE", "off").lower() in ("on", "true", "1"),
+        hedge_delay_ms=float(delay) if delay else None,
+        hedge_min_delay_ms=float(env.get("LLM_HEDGE_MIN_DELAY_MS", defaults.hedge_min_delay_ms)),
+        hedge_min_samples=int(env.get("LLM_HEDGE_MIN_SAMPLES", defaults.hedge_min_samples)),
+    )
+
+
+class LLMClientFactory:
+    """
+    Shared, connection-pooled HTTP clients for the chat models. Every model
+    built from options() reuses the same keep-alive pool (sized by
+    pool_size) and the same connect/read timeouts, instead of each model
+    opening its own unbounded client with no timeout.
+    """
+
+    def __init__(self, settings: ClientSettings):
+        self.settings = settings
+        self._clients = None
+        self._lock = threading.Lock()
+
+    def _http_clients(self) -> tuple:
+        import httpx  # imported here so app.py can use with_deadline without it
+
+        with self._lock:
+            if self._clients is None:
+                limits = httpx.Limits(
+                    max_connections=self.settings.pool_size,
+                    max_keepalive_connections=self.settings.pool_size,
+                )
+                timeout = self.timeout()
+                self._clients = (
+                    httpx.Client(limits=limits, timeout=timeout),
+                    httpx.AsyncClient(limits=limits, timeout=timeout),
+                )
+            return self._clients
+
+    def timeout(self):
+        import httpx
+
+        return httpx.Timeout(self.settings.read_timeout, connect=self.settings.connect_timeout)
+
+    def options(self) -> Dict[str, Any]:
+        """Constructor arguments for a chat model (ChatGroq) using the shared pool"""
+        http_client, http_async_client = self._http_clients()
+        return {
+            "timeout": self.timeout(),
+            "max_retries": self.settings.max_retries,
+            "http_client": http_client,
+            "http_async_client": http_async_client,
+        }
+
+
+def with_deadline(config: Optional[Dict], seconds: float, hedge: bool = True) -> Dict:
+    """
+    Graph config carrying an absolute deadline `seconds` from now. Every
+    LLM call in the run is bounded by what is left of it, so the request's
+    total latency is too. hedge=False turns hedged requests off for the run
+    (e.g. when tokens are streamed to the client).
+    """
+    config = dict(config or {})
+    configurable = dict(config.get("configurable") or {})
+    configurable["deadline"] = time.monotonic() + seconds
+    if not hedge:
+        configurable["llm_hedge"] = False
+    config["configurable"] = configurable
+    return config
+
+
+class LLMCaller:
+    """
+    Runs one LLM call under its agent's timeout, cut short by the run's
+    deadline (see with_deadline), and optionally hedged: when the call has
+    not answered after the hedge delay, a duplicate is fired and whichever
+    answers first wins. Sync calls run on a worker pool so the caller can
+    stop waiting; async calls are cancelled outright.
+    """
+
+    def __init__(self, settings: ClientSettings):
+        self.settings = settings
+        self._executor = ThreadPoolExecutor(max_workers=settings.pool_size * 2, thread_name_prefix="llm-call")
+
+    def call_timeout(self, agent: str, config: Optional[Dict] = None) -> float:
+        """Seconds this agent's call may take; raises DeadlineExceeded if none are left"""
+        timeout = self.settings.agent_timeouts.get(agent, self.settings.agent_timeout)
+        deadline = ((config or {}).get("configurable") or {}).get("deadline")
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        if timeout <= 0:
+            metrics.inc("nutrition_llm_deadline_exceeded_total", agent=agent)
+            raise DeadlineExceeded(f"{agent}: request deadline already passed")
+        return timeout
+
+    def hedge_delay(self, agent: str, config: Optional[Dict] = None) -> Optional[float]:
+        """Seconds to wait before hedging, or None to not hedge this call"""
+        if not self.settings.hedge or ((config or {}).get("configurable") or {}).get("llm_hedge") is False:
+            return None
+        if self.settings.hedge_delay_ms is not None:
+            return self.settings.hedge_delay_ms / 1000
+        histogram = metrics.histogram("nutrition_llm_call_duration_seconds", agent=agent)
+        if histogram is None or histogram.snapshot()[2] < self.settings.hedge_min_samples:
+            return None
+        return max(histogram.quantile(0.95), self.settings.hedge_min_delay_ms / 1000)
+
+    def _timed_out(self, agent: str, timeout: float) -> DeadlineExceeded:
+        metrics.inc("nutrition_llm_deadline_exceeded_total", agent=agent)
+        return DeadlineExceeded(f"{agent}: no LLM response within {timeout:.1f}s")
+
+    def invoke(self, agent: str, fn: Callable[[], Any], config: Optional[Dict] = None, hedge: bool = True) -> Any:
+        """Runs fn() under the agent's timeout, hedging it if enabled"""
+        timeout = self.call_timeout(agent, config)
+        delay = self.hedge_delay(agent, config) if hedge else None
+        give_up_at = time.monotonic() + timeout
+
+        # Calls run in a copy of the caller's context so LangChain callbacks
+        # (token streaming, tracing) still see the graph run they belong to
+        futures = {self._executor.submit(contextvars.copy_context().run, fn): "primary"}
+        if delay is not None and delay < timeout and not wait(futures, timeout=delay).done:
+            futures[self._executor.submit(contextvars.copy_context().run, fn)] = "hedge"
+            metrics.inc("nutrition_llm_hedges_total", agent=agent)
+
+        error = None
+        while futures:
+            done, _ = wait(futures, timeout=max(0.0, give_up_at - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise self._timed_out(agent, timeout)
+            for future in done:
+                attempt = futures.pop(future)
+                if future.exception() is None:
+                    if attempt == "hedge":
+                        metrics.inc("nutrition_llm_hedge_wins_total", agent=agent)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def ainvoke(self, agent: str, fn: Callable[[], Awaitable[Any]], config: Optional[Dict] = None, hedge: bool = True) -> Any:
+        """Async twin of invoke(); fn returns an awaitable and losers are cancelled"""
+        timeout = self.call_timeout(agent, config)
+        delay = self.hedge_delay(agent, config) if hedge else None
+        give_up_at = time.monotonic() + timeout
+
+        tasks = {asyncio.ensure_future(fn()): "primary"}
+        try:
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    tasks[asyncio.ensure_future(fn())] = "hedge"
+                    metrics.inc("nutrition_llm_hedges_total", agent=agent)
+
+            error = None
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=max(0.0, give_up_at - time.monotonic()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise self._timed_out(agent, timeout)
+                for task in done:
+                    attempt = tasks.pop(task)
+                    if task.exception() is None:
+                        if attempt == "hedge":
+                            metrics.inc("nutrition_llm_hedge_wins_total", agent=agent)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,225 @@
+"""
+Offline load test: drives the analyze workflow at several concurrency
+levels against the fake LLM (fake_llm.py) and reports throughput, latency
+percentiles and memory.
+
+Targets:
+    graph        the compiled sync graph, one thread per in-flight request
+    async_graph  the compiled async graph on one event loop
+    flask        POST /api/analyze through the Flask app (in process)
+    asgi         POST /api/analyze through the ASGI app (in process)
+    --url URL    POST /api/analyze on a running server (e.g. uvicorn started
+                 with LLM_PROVIDER=fake)
+
+Run with:
+    python loadtest.py --target async_graph --concurrency 1,8,32 --requests 200
+    FAKE_LLM_TTFT_MS=50 python loadtest.py --target flask --concurrency 4,16
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+TARGETS = ("graph", "async_graph", "flask", "asgi")
+
+
+def load_journals() -> List[str]:
+    with open(os.path.join(FIXTURES, "trigger_journals.jsonl")) as f:
+        return [json.loads(line)["text"] for line in f if line.strip()]
+
+
+def use_fake_llm(cache: bool = False) -> None:
+    """Points the workflow at the fake LLM; must run before main is imported"""
+    if "main" in sys.modules:
+        raise RuntimeError("main is already imported; set LLM_PROVIDER=fake before loading the workflow")
+    os.environ["LLM_PROVIDER"] = "fake"
+    os.environ.setdefault("LLM_CACHE", "memory" if cache else "off")
+    os.environ.setdefault("SEMANTIC_CACHE", "off")
+
+
+def _request_body(journal: str) -> Dict:
+    return {"journal_entry": journal, "health_data": {"glucose_trend": "Normal", "energy_level": "Low"}}
+
+
+def _graph_call(asynchronous: bool) -> Callable:
+    from app import build_initial_state, workflow
+
+    graph = workflow().async_app if asynchronous else workflow().app
+    if asynchronous:
+        async def call(journal: str) -> bool:
+            result = await graph.ainvoke(build_initial_state(_request_body(journal)))
+            return bool(result.get("final_plan"))
+    else:
+        def call(journal: str) -> bool:
+            return bool(graph.invoke(build_initial_state(_request_body(journal))).get("final_plan"))
+    return call
+
+
+def _flask_call() -> Callable:
+    from app import flask_app
+
+    def call(journal: str) -> bool:
+        response = flask_app.test_client().post("/api/analyze", json=_request_body(journal))
+        return response.status_code == 200
+    return call
+
+
+def _asgi_call() -> Callable:
+    from api.asgi import app
+
+    async def call(journal: str) -> bool:
+        body = json.dumps(_request_body(journal)).encode("utf-8")
+        scope = {
+            "type": "http", "method": "POST", "path": "/api/analyze", "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        status = []
+
+        async def receive():
+            return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        await app(scope, receive, send)
+        return status == [200]
+    return call
+
+
+def _http_call(url: str, client) -> Callable:
+    async def call(journal: str) -> bool:
+        response = await client.post(url.rstrip("/") + "/api/analyze", json=_request_body(journal))
+        return response.status_code == 200
+    return call
+
+
+def _run_threads(call: Callable, journals: List[str], concurrency: int) -> List[tuple]:
+    def timed(journal: str) -> tuple:
+        start = time.perf_counter()
+        try:
+            ok = call(journal)
+        except Exception:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, journals))
+
+
+async def _run_tasks(call: Callable, journals: List[str], concurrency: int) -> List[tuple]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(journal: str) -> tuple:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = await call(journal)
+            except Exception:
+                ok = False
+            return time.perf_counter() - start, ok
+
+    return await asyncio.gather(*(timed(journal) for journal in journals))
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_load(target: str, concurrency: int, requests: int, url: Optional[str] = None,
+             trace_memory: bool = False) -> Dict:
+    """
+    Sends `requests` journals through the target with at most `concurrency`
+    in flight; returns throughput, latency percentiles (ms), errors and
+    memory (peak RSS of the process, plus the traced Python heap peak
+    during the run with trace_memory)
+    """
+    journals = load_journals()
+    batch = [journals[n % len(journals)] for n in range(requests)]
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    if url:
+        import httpx
+
+        async def over_http():
+            async with httpx.AsyncClient(timeout=None, limits=httpx.Limits(max_connections=concurrency)) as client:
+                return await _run_tasks(_http_call(url, client), batch, concurrency)
+        results = asyncio.run(over_http())
+    elif target == "graph":
+        results = _run_threads(_graph_call(asynchronous=False), batch, concurrency)
+    elif target == "flask":
+        results = _run_threads(_flask_call(), batch, concurrency)
+    elif target == "async_graph":
+        results = asyncio.run(_run_tasks(_graph_call(asynchronous=True), batch, concurrency))
+    elif target == "asgi":
+        results = asyncio.run(_run_tasks(_asgi_call(), batch, concurrency))
+    else:
+        raise ValueError(f"Unknown load test target: {target!r} (expected one of {', '.join(TARGETS)})")
+    elapsed = time.perf_counter() - start
+
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+
+    latencies = np.array([seconds for seconds, _ in results]) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        "target": url or target,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for _, ok in results if not ok),
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(float(p50), 1),
+        "p95_ms": round(float(p95), 1),
+        "p99_ms": round(float(p99), 1),
+        "max_rss_mb": round(_max_rss_mb(), 1),
+        "traced_peak_mb": round(traced_peak, 1) if traced_peak is not None else None,
+    }
+
+
+def format_report(rows: List[Dict]) -> str:
+    header = f"{'target':<12} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>7} {'heap MB':>8}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        heap = f"{row['traced_peak_mb']:>8.1f}" if row["traced_peak_mb"] is not None else f"{'-':>8}"
+        lines.append(
+            f"{row['target']:<12} {row['concurrency']:>5} {row['requests']:>5} {row['errors']:>4} {row['throughput_rps']:>8.2f} "
+            f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['max_rss_mb']:>7.1f} {heap}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", choices=TARGETS, default="async_graph")
+    parser.add_argument("--url", help="load a running server instead of the in-process app")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--cache", action="store_true", help="keep the LLM response cache on (off by default)")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the Python heap peak (slower)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON lines")
+    args = parser.parse_args()
+
+    if not args.url:
+        use_fake_llm(cache=args.cache)
+    rows = [
+        run_load(args.target, int(level), args.requests, url=args.url, trace_memory=args.tracemalloc)
+        for level in args.concurrency.split(",")
+    ]
+    print("\n".join(json.dumps(row) for row in rows) if args.json else format_report(rows))
@@ -1,52 +1,463 @@
 import os
+import re
 import json
-import operator
-from typing import Annotated, List, Dict, TypedDict, Union
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+import time
+import inspect
+from typing import Annotated, Any, List, Dict, NamedTuple, Optional, TypedDict, Union
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, RemoveMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END
+from langgraph.graph.message import REMOVE_ALL_MESSAGES, add_messages
 
 from dotenv import load_dotenv
 load_dotenv()
 
+from logs import configure_logging
+from metrics import metrics, record_llm_call, record_parse_failure, record_prompt_tokens
+
+# Agent progress goes through logging; LOG_LEVEL=INFO/DEBUG to see it
+logger = configure_logging().getChild("agents")
+
 from langchain_groq import ChatGroq
+from llm_cache import build_llm_cache
+from llm_client import LLMCaller, LLMClientFactory, load_client_settings
+from model_registry import ModelRegistry, load_model_config
+from fake_llm import build_fake_llm
 
-llm = ChatGroq(
-    model="openai/gpt-oss-120b",
-    temperature=0,
-    max_tokens=None,
-    reasoning_format="parsed",
-    timeout=None,
-    max_retries=2,
+# Response cache in front of every LLM call (temperature=0 makes identical
+# prompts give effectively identical answers). LLM_CACHE: off | memory | sqlite
+llm_cache = build_llm_cache(
+    os.getenv("LLM_CACHE", "memory"),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+    sqlite_path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite"),
 )
 
+# One pooled HTTP client with connect/read timeouts shared by every model,
+# and the per-agent timeouts, request deadline and hedging applied to each
+# call (LLM_POOL_SIZE, LLM_*_TIMEOUT, LLM_HEDGE..., see llm_client.py)
+llm_client = LLMClientFactory(load_client_settings())
+llm_caller = LLMCaller(llm_client.settings)
+
+# Admission control and priority scheduling in front of every agent LLM
+# call: global concurrency/tokens-per-minute budget, per-tenant quotas,
+# interactive before batch, fast rejection when overloaded (LLM_SCHEDULER,
+# LLM_MAX_CONCURRENCY, LLM_TOKENS_PER_MINUTE, ..., see scheduler.py)
+from scheduler import Overloaded, build_scheduler, load_scheduler_settings
+llm_scheduler = build_scheduler(load_scheduler_settings(pool_size=llm_client.settings.pool_size))
+
+# Model id per tier and tier per node (LLM_MODEL_LARGE / LLM_MODEL_SMALL /
+# LLM_NODE_MODELS, see model_registry.py)
+MODEL_IDS, NODE_MODELS = load_model_config()
+
+# LLM_PROVIDER=fake swaps every model for the local stand-in in fake_llm.py
+# (canned replies, simulated latency, no API calls) for load tests
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "groq").lower()
+
+def build_llm(**overrides) -> ChatGroq:
+    """A chat model for the agents (the large one by default); overrides tweak individual settings"""
+    if LLM_PROVIDER == "fake":
+        return build_fake_llm(overrides.get("model", MODEL_IDS["large"]), cache=overrides.get("cache", llm_cache))
+    settings = dict(
+        model=MODEL_IDS["large"],
+        temperature=0,
+        max_tokens=None,
+        reasoning_format="parsed",
+        cache=llm_cache,
+        **llm_client.options(),
+    )
+    settings.update(overrides)
+    return ChatGroq(**settings)
+
+# The models each agent calls: the large one unless LLM_NODE_MODELS moves a
+# node to the small tier
+models = ModelRegistry(lambda model_id: build_llm(model=model_id), MODEL_IDS, NODE_MODELS)
+llm = models.get("large")
+
+_batch_models = None
+
+def get_batch_models() -> ModelRegistry:
+    """
+    Models for batch runs: same assignment, but no client-side retries,
+    because rate limits are retried through the batch's SharedBackoff
+    instead (see batch.py)
+    """
+    global _batch_models
+    if _batch_models is None:
+        _batch_models = ModelRegistry(lambda model_id: build_llm(model=model_id, max_retries=0), MODEL_IDS, NODE_MODELS)
+    return _batch_models
+
 from safety import SafetyGuard
+from json_extract import parse_json, PROFILE_SCHEMA, TRIGGERS_SCHEMA, LOGISTICS_SCHEMA, MEAL_PLAN_SCHEMA
+from triggers import TriggerClassifier, TRIGGERS
+from semantic_cache import build_semantic_cache, context_key
+from history import HistoryPolicy, count_tokens, extractive_summary, load_policy, render_transcript, split_history, summary_budget, summary_message
+
+# Precompiled prompt templates: static instructions first, request data last
+from prompts import (LOGISTICS_PROMPT, MEAL_PLANNER_PROMPT, NUTRITIONIST_PROMPT, PREFERENCE_PROMPT,
+                     SUMMARY_TEMPLATE, TRIGGER_PROMPT, count_prompt_tokens)
 
 # Initialize Safety Guard
 safety = SafetyGuard()
 
+# Local trigger classifier. TRIGGER_MODE: "llm" always asks the model,
+# "local" never does, "hybrid" asks only when the local confidence is low
+trigger_classifier = TriggerClassifier()
+TRIGGER_MODE = os.getenv("TRIGGER_MODE", "hybrid").lower()
+TRIGGER_CONFIDENCE_THRESHOLD = float(os.getenv("TRIGGER_CONFIDENCE_THRESHOLD", "0.8"))
+
+# Near-duplicate journal cache. SEMANTIC_CACHE: off | memory | file. A
+# journal similar enough to an earlier one sent with the same profile and
+# health data reuses its triggers and plan (see semantic_cache.py)
+semantic_cache = build_semantic_cache(
+    os.getenv("SEMANTIC_CACHE", "off"),
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400")),
+    path=os.getenv("SEMANTIC_CACHE_PATH", ".semantic_cache.npz"),
+)
+
+# Graph mode: "route" sends a request down a single extraction branch,
+# "parallel" fans journal requests out to both extraction agents at once
+GRAPH_MODE = os.getenv("GRAPH_MODE", "route").lower()
+
+# Speculative planning. SPECULATIVE_PLAN: off | on. When the trigger
+# detective has to ask the LLM, the plan agent starts alongside it with the
+# locally predicted triggers; its plan is kept if the detected triggers
+# (and profile and health data) match, otherwise the plan agent runs again
+SPECULATIVE_PLAN = os.getenv("SPECULATIVE_PLAN", "off").lower() == "on"
+
+def merge_dicts(left: Dict, right: Dict) -> Dict:
+    """Reducer that merges partial updates into a dict channel"""
+    return {**(left or {}), **(right or {})}
+
+def merge_timings(left: Dict, right: Dict) -> Dict:
+    """
+    Reducer that lets parallel branches each record their own timing.
+    A None update resets the timings; each new request passes one so a
+    resumed thread does not report the previous visit's nodes.
+    """
+    if right is None:
+        return {}
+    return merge_dicts(left, right)
+
+# Per-user persistence: when a request carries a user id, the graph resumes
+# that user's checkpointed thread. PROFILE_STORE: off | memory | sqlite
+from profile_store import aclose_checkpointer, build_checkpointer
+PROFILE_STORE = os.getenv("PROFILE_STORE", "memory").lower()
+PROFILE_STORE_PATH = os.getenv("PROFILE_STORE_PATH", ".profile_store.sqlite")
+
+# Conversation budgets (HISTORY_MAX_TOKENS / HISTORY_WINDOW / HISTORY_SUMMARY,
+# see history.py): "thread" bounds a user's stored conversation, the others
+# the history a given agent sends to the LLM
+HISTORY_POLICIES = {
+    "thread": load_policy("thread", defaults=HistoryPolicy(max_tokens=3000, window=12)),
+    "preference": load_policy("preference"),
+}
+
+# Graph mode for planning: "two_step" runs nutritionist_agent then
+# logistics_agent, "single_shot" asks meal_planner_agent for both at once
+PLAN_MODE = os.getenv("PLAN_MODE", "two_step").lower()
+
+# Local recipe index (see recipes.py). RECIPE_MODE: "off" lets the model
+# invent the meal, "ground" has it choose among and explain the indexed
+# candidates, "template" writes the plan from the best candidate without
+# the LLM. Either way a chosen recipe's grocery list comes from the index.
+from recipes import describe_candidates, load_recipe_index
+RECIPE_MODE = os.getenv("RECIPE_MODE", "off").lower()
+recipe_index = load_recipe_index(os.getenv("RECIPE_DATA_PATH")) if RECIPE_MODE != "off" else None
+
+class LLMRequest(NamedTuple):
+    """
+    A prompt plus extra invocation options (e.g. response_format). `schema`
+    is the JSON shape the reply must fit: a reply from a smaller model that
+    does not is asked again of the large model. `tier` picks a model tier
+    instead of the node's assigned one.
+    """
+    prompt: Any
+    options: Dict = {}
+    schema: Any = None
+    tier: Any = None
+
+def _unpack_request(request) -> LLMRequest:
+    return request if isinstance(request, LLMRequest) else LLMRequest(request)
+
+def _llm_for(config) -> tuple:
+    """
+    The models and optional shared rate-limit backoff for this run (see
+    batch.py). The run may supply a ModelRegistry or a single chat model
+    used for every node.
+    """
+    configurable = (config or {}).get("configurable") or {}
+    return configurable.get("llm") or models, configurable.get("rate_limit_backoff")
+
+def _model_for(source, name: str, request: LLMRequest):
+    if isinstance(source, ModelRegistry):
+        return source.for_node(name, request.tier)
+    return source
+
+def _escalation(source, name: str, request: LLMRequest, response):
+    """
+    The request to send to the large model when a smaller model's reply
+    does not fit the request's schema, else None
+    """
+    if request.schema is None or request.tier or not isinstance(source, ModelRegistry) or not source.escalates(name):
+        return None
+    try:
+        parse_json(response.content, request.schema)
+        return None
+    except ValueError as e:
+        logger.info("Escalating %s to the %s model: %s", name, source.default_tier, e)
+        metrics.inc("nutrition_llm_escalations_total", agent=name)
+        return request._replace(tier=source.default_tier)
+
+# --- AGENT NODE ADAPTER ---
+# Each agent is written once as a generator that yields the prompt it wants
+# sent to the LLM (or an LLMRequest) and receives the response back (or the
+# raised exception). The decorator turns it into a regular sync LangGraph node
+# that drives it with llm.invoke, and exposes an async twin as `.async_node`
+# that drives the same logic with llm.ainvoke. Agents that never yield are
+# plain functions. Each node calls the model its tier is assigned in the
+# run's ModelRegistry, escalating to the large model on replies that fail
+# the request's schema. A run's config may swap the models and add a shared
+# rate-limit backoff (batch runs do both). Every call goes through
+# llm_caller: bounded by the agent's timeout and the run's deadline, and
+# hedged when enabled (never under a batch backoff, where duplicates would
+# only eat into the shared rate limit), after llm_scheduler admits it.
+# Overloaded is not thrown into the agent: it fails the run with a 429
+# rather than being degraded around.
+def _count_prompt(name: str, prompt, response, sent: Dict[str, int]) -> None:
+    """Adds a sent prompt's static-prefix and variable tokens to `sent` and the metrics"""
+    if (getattr(response, "response_metadata", None) or {}).get("cache_hit"):
+        return
+    static, variable = count_prompt_tokens(prompt)
+    record_prompt_tokens(name, static, variable)
+    sent["static"] = sent.get("static", 0) + static
+    sent["variable"] = sent.get("variable", 0) + variable
+
+def _admission(name: str, request: LLMRequest, config) -> Dict[str, Any]:
+    """Scheduler arguments for one call: the run's priority class and tenant, estimated tokens and time left"""
+    configurable = (config or {}).get("configurable") or {}
+    priority = configurable.get("priority", "interactive")
+    return {
+        "priority": priority,
+        "tenant": configurable.get("tenant", ""),
+        "tokens": llm_scheduler.estimate_tokens(name, sum(count_prompt_tokens(request.prompt))),
+        # Batch runs have no deadline and wait as long as it takes
+        "timeout": None if priority == "batch" else llm_caller.call_timeout(name, config),
+    }
+
+def check_admission(config) -> None:
+    """
+    Raises Overloaded if the run's LLM calls would be turned away right now.
+    Streaming endpoints call it before their response starts, so overload is
+    answered with a 429 instead of an error event after a 200.
+    """
+    if llm_scheduler is None:
+        return
+    configurable = (config or {}).get("configurable") or {}
+    deadline = configurable.get("deadline")
+    llm_scheduler.check(
+        priority=configurable.get("priority", "interactive"),
+        tenant=configurable.get("tenant", ""),
+        tokens=llm_scheduler.estimate_tokens("", 0),
+        timeout=None if deadline is None else deadline - time.monotonic(),
+    )
+
+def _settle(name: str, ticket, response) -> None:
+    """Releases a scheduler ticket with the tokens the call actually used"""
+    if (getattr(response, "response_metadata", None) or {}).get("cache_hit"):
+        llm_scheduler.release(ticket, name, used_tokens=0)
+        return
+    usage = getattr(response, "usage_metadata", None) or {}
+    llm_scheduler.release(ticket, name, used_tokens=usage.get("total_tokens"), completion_tokens=usage.get("output_tokens"))
+
+def _scheduled(name: str, request: LLMRequest, config, call):
+    """call() once the scheduler admits it; raises Overloaded when it will not"""
+    if llm_scheduler is None:
+        return call()
+    ticket = llm_scheduler.acquire(**_admission(name, request, config))
+    response = None
+    try:
+        response = call()
+        return response
+    finally:
+        _settle(name, ticket, response)
+
+async def _ascheduled(name: str, request: LLMRequest, config, call):
+    """Async twin of _scheduled; call() returns an awaitable"""
+    if llm_scheduler is None:
+        return await call()
+    ticket = await llm_scheduler.aacquire(**_admission(name, request, config))
+    response = None
+    try:
+        response = await call()
+        return response
+    finally:
+        _settle(name, ticket, response)
+
+def _clocked(started: Dict[str, float], call):
+    """call(), noting when it started: LLM latency excludes scheduler queueing and backoff waits"""
+    started["at"] = time.perf_counter()
+    return call()
+
+def _elapsed(started: Dict[str, float]) -> Optional[float]:
+    return time.perf_counter() - started["at"] if "at" in started else None
+
+def agent_node(agent):
+    name = agent.__name__
+
+    def sync_node(state, config=None):
+        steps = agent(state)
+        if not inspect.isgenerator(steps):
+            return steps
+        source, backoff = _llm_for(config)
+        sent = {}
+        try:
+            request = next(steps)
+            while True:
+                started = {}
+                try:
+                    request = _unpack_request(request)
+                    model = _model_for(source, name, request)
+                    call = lambda: _clocked(started, lambda: llm_caller.invoke(name, lambda: model.invoke(request.prompt, **request.options), config, hedge=backoff is None))
+                    # Each attempt is admitted on its own, so a call waiting out
+                    # a rate-limit window holds no scheduler slot
+                    scheduled = lambda: _scheduled(name, request, config, call)
+                    response = backoff.call(scheduled) if backoff is not None else scheduled()
+                except Overloaded:
+                    raise
+                except Exception as e:
+                    record_llm_call(name, _elapsed(started), error=e)
+                    request = steps.throw(e)
+                else:
+                    record_llm_call(name, _elapsed(started), response)
+                    _count_prompt(name, request.prompt, response, sent)
+                    request = _escalation(source, name, request, response) or steps.send(response)
+        except StopIteration as done:
+            return {**done.value, "prompt_tokens": {name: sent}} if sent else done.value
+
+    async def async_node(state, config=None):
+        steps = agent(state)
+        if not inspect.isgenerator(steps):
+            return steps
+        source, backoff = _llm_for(config)
+        sent = {}
+        try:
+            request = next(steps)
+            while True:
+                started = {}
+                try:
+                    request = _unpack_request(request)
+                    model = _model_for(source, name, request)
+                    call = lambda: _clocked(started, lambda: llm_caller.ainvoke(name, lambda: model.ainvoke(request.prompt, **request.options), config, hedge=backoff is None))
+                    scheduled = lambda: _ascheduled(name, request, config, call)
+                    response = await (backoff.acall(scheduled) if backoff is not None else scheduled())
+                except Overloaded:
+                    raise
+                except Exception as e:
+                    record_llm_call(name, _elapsed(started), error=e)
+                    request = steps.throw(e)
+                else:
+                    record_llm_call(name, _elapsed(started), response)
+                    _count_prompt(name, request.prompt, response, sent)
+                    request = _escalation(source, name, request, response) or steps.send(response)
+        except StopIteration as done:
+            return {**done.value, "prompt_tokens": {name: sent}} if sent else done.value
+
+    sync_node.__name__ = name
+    sync_node.__doc__ = agent.__doc__
+    async_node.__name__ = f"async_{name}"
+    sync_node.async_node = async_node
+    return sync_node
+
+def safe_turns(messages: List) -> List:
+    """
+    Messages without the user turns the input safety check refuses. A
+    refused journal stays in the checkpointed thread (safety_agent only
+    checks the newest turn), so nothing built from history may send it on.
+    """
+    return [m for m in messages if not isinstance(m, HumanMessage) or safety.validate_input(m.content)[0]]
+
+def compact_history(scope: str, messages: List):
+    """
+    Sub-step for agents (use with `yield from`): fits `messages` into the
+    scope's history policy, summarising older turns extractively or with
+    an extra LLM call. Returns (compacted_messages, older_messages_folded).
+    """
+    policy = HISTORY_POLICIES[scope]
+    older, recent = split_history(messages, policy)
+    if not older or policy.summary == "off":
+        return recent, older
+
+    budget = summary_budget(policy)
+    # Older turns may include input the safety agent refused at the time
+    allowed = safe_turns(older)
+    summary = None
+    if policy.summary == "llm":
+        prompt = SUMMARY_TEMPLATE.format_messages(max_words=budget * 3 // 4, transcript=render_transcript(allowed))
+        try:
+            response = yield prompt
+            summary = response.content
+        except Exception as e:
+            logger.warning("History summary failed, using extractive summary: %s", e)
+    if not summary:
+        summary = extractive_summary(allowed, budget)
+    return [summary_message(summary)] + recent, older
+
 # --- THE SHARED STATE ---
 # This dictionary holds all data flowing between agents
 class AgentState(TypedDict):
-    messages: Annotated[List[Union[HumanMessage, AIMessage]], operator.add]
-    user_profile: Dict  # Stores likes/dislikes, allergies
-    health_data: Dict   # Stores glucose, energy levels
+    messages: Annotated[List[Union[HumanMessage, AIMessage, SystemMessage]], add_messages]
+    user_profile: Annotated[Dict, merge_dicts]  # Stores likes/dislikes, allergies
+    health_data: Dict   # Stores glucose, energy levels (and a CGM summary, see cgm.py)
     journal_entry: str  # Current journal text being analyzed
     detected_triggers: List[str] # Output from Trigger Detective
     final_plan: str     # The output recommendation
     safety_flag: str    # "safe" or "unsafe"
+    timings: Annotated[Dict[str, float], merge_timings]  # Wall time per node in ms
+    profile_message_count: int  # Messages already folded into user_profile
+    history_tokens: Annotated[Dict[str, Dict[str, int]], merge_timings]  # Tokens before/after history compaction
+    prompt_tokens: Annotated[Dict[str, Dict[str, int]], merge_timings]  # Static-prefix and variable prompt tokens sent per node
+    semantic_cache: Dict  # Semantic cache lookup: hit, similarity (and the context key on a miss)
+    recipe_id: str  # Indexed recipe the plan is built on (RECIPE_MODE), if any
+    speculation: Dict  # Speculative plan and the plan inputs it was made from
+
+# --- HISTORY AGENT ---
+# Keeps a user's checkpointed conversation within the "thread" budget by
+# folding older turns into a summary message, so stored state (and any
+# prompt built from it) stops growing with every visit
+@agent_node
+def history_agent(state: AgentState):
+    messages = state['messages']
+    compacted, folded = yield from compact_history("thread", messages)
+    if not folded:
+        return {}
+
+    before, after = count_tokens(messages), count_tokens(compacted)
+    logger.info("History compacted", extra={"agent": "history_agent", "folded": len(folded), "tokens_before": before, "tokens_after": after})
+    # Messages already seen by the preference agent stay accounted for;
+    # the summary itself counts as seen
+    processed = state.get('profile_message_count', 0)
+    return {
+        "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)] + compacted,
+        "profile_message_count": max(processed - len(folded), 0) + (len(compacted) - len(messages) + len(folded)),
+        "history_tokens": {"history_agent": {"before": before, "after": after}},
+    }
 
 # --- 0. SAFETY AGENT ---
 # Checks input for malicious intent or harmful content
+@agent_node
 def safety_agent(state: AgentState):
-    print("--- SAFETY GUARD WORKING ---")
+    logger.debug("Safety guard working")
     messages = state['messages']
     last_message = messages[-1].content
     
     is_safe, reason = safety.validate_input(last_message)
     
     if not is_safe:
-        print(f"!!! SAFETY VIOLATION: {reason} !!!")
+        logger.warning("Input safety violation: %s", reason)
         return {
             "safety_flag": "unsafe", 
             "messages": [AIMessage(content=f"I cannot process this request. {reason}")]
@@ -56,205 +467,167 @@ def safety_agent(state: AgentState):
 
 # --- 1. PREFERENCE AGENT ---
 # Updates the user profile based on conversation
+
+# Words that suggest a message says something about food preferences
+PREFERENCE_CUES = re.compile(
+    r"\b(?:likes?|liked|loves?|loved|hates?|hated|dislikes?|prefers?|favou?rite|"
+    r"allerg\w*|intoleran\w*|vegan|vegetarian|pescatarian|keto|paleo|gluten|lactose|"
+    r"dairy|halal|kosher|diet|can't eat|cannot eat|don't eat|won't eat|avoid|"
+    r"my name is|call me)\b",
+    re.IGNORECASE,
+)
+
+@agent_node
 def preference_agent(state: AgentState):
-    print("--- PREFERENCE AGENT WORKING ---")
+    logger.debug("Preference agent working")
     messages = state['messages']
     current_profile = state.get('user_profile', {})
     
-    # Prompt to extract preferences
-    system_msg = f"""
-    You are a Preference Learning Agent. 
-    Current Profile: {json.dumps(current_profile)}
-    
-    Analyze the conversation history. If the user mentions food likes, dislikes, or dietary restrictions, 
-    extract and update the profile.
+    # Only messages not yet folded into the profile are sent; the profile
+    # itself carries everything learned from earlier turns
+    processed = state.get('profile_message_count', 0)
+    if processed > len(messages):
+        processed = 0
+    new_messages = safe_turns(messages[processed:])
     
-    Return ONLY a valid JSON object with this structure:
-    {{
-        "name": "user name",
-        "diet": "dietary preference",
-        "allergies": ["list", "of", "allergies"],
-        "likes": ["foods they like"],
-        "dislikes": ["foods they dislike"]
-    }}
+    # Skip the LLM call when the new turns say nothing about preferences
+    if not any(PREFERENCE_CUES.search(m.content) for m in new_messages if isinstance(m, HumanMessage)):
+        logger.debug("No preference cues in new messages, keeping current profile")
+        return {"profile_message_count": len(messages)}
     
-    Keep existing profile data and only update what's mentioned.
-    """
+    # Bound the history sent along; older turns are summarised
+    history, folded = yield from compact_history("preference", new_messages)
+    profile_json = json.dumps(current_profile)
+    prompt = PREFERENCE_PROMPT.format_messages(history=history, profile=profile_json)
+    prompt_tokens = {
+        "before": count_tokens(PREFERENCE_PROMPT.format_messages(history=new_messages, profile=profile_json)),
+        "after": count_tokens(prompt),
+    }
+    if folded:
+        logger.info("History compacted", extra={"agent": "preference_agent", "folded": len(folded), "tokens_before": prompt_tokens["before"], "tokens_after": prompt_tokens["after"]})
     
     try:
-        response = llm.invoke([SystemMessage(content=system_msg)] + messages)
-        # Try to parse JSON from response
-        content = response.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        
-        updated_profile = json.loads(content.strip())
-        print(f"Updated profile: {updated_profile}")
-        return {"user_profile": updated_profile}
-    except json.JSONDecodeError:
-        print("Could not parse profile update, keeping current profile")
-        return {"user_profile": current_profile}
+        response = yield LLMRequest(prompt, schema=PROFILE_SCHEMA)
+        # Extract and validate the JSON profile from the response
+        updated_profile = parse_json(response.content, PROFILE_SCHEMA)
+        logger.info("Updated profile: %s", updated_profile)
+        return {
+            "user_profile": updated_profile,
+            "profile_message_count": len(messages),
+            "history_tokens": {"preference_agent": prompt_tokens},
+        }
+    except ValueError:
+        logger.warning("Could not parse profile update, keeping current profile")
+        record_parse_failure("preference_agent")
+        return {"user_profile": current_profile, "history_tokens": {"preference_agent": prompt_tokens}}
 
 
 # --- 2. TRIGGER DETECTIVE ---
 # Analyzes journal entries for emotional/environmental triggers
+@agent_node
 def trigger_detective(state: AgentState):
-    print("--- TRIGGER DETECTIVE WORKING ---")
+    logger.debug("Trigger detective working")
     journal = state.get('journal_entry', "")
     
     if not journal:
         return {"detected_triggers": []}
 
-    prompt = f"""
-    Analyze this journal entry for eating triggers.
-    Journal: "{journal}"
-    
-    Identify any of these triggers present:
-    - Stress
-    - Anxiety
-    - Boredom
-    - Social pressure
-    - Low Energy
-    - Fatigue
-    - Emotional eating
-    - Sleep deprivation
-    - Time pressure
-    - Loneliness
-    - Celebration/Reward seeking
-    - Procrastination
-    - Depression
-    - Anger/Frustration
-    - Comfort seeking
-    
-    Return ONLY a JSON array of detected triggers, for example: ["Stress", "Low Energy", "Time pressure"]
-    If no triggers are found, return an empty array: []
-    Be specific and only include triggers that are clearly evident in the journal.
-    """
-    
+    # Fast path: obvious entries are classified locally without an LLM call
+    if TRIGGER_MODE != "llm":
+        local_triggers, confidence = trigger_classifier.classify(journal)
+        if TRIGGER_MODE == "local" or confidence >= TRIGGER_CONFIDENCE_THRESHOLD:
+            logger.info("Detected triggers locally: %s", local_triggers, extra={"confidence": confidence})
+            return {"detected_triggers": local_triggers}
+
+    response = yield LLMRequest(TRIGGER_PROMPT.format_messages(journal=journal), schema=TRIGGERS_SCHEMA)
     try:
-        response = llm.invoke(prompt)
-        content = response.content.strip()
-        # Remove markdown code blocks if present
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        
-        triggers = json.loads(content.strip())
-        print(f"Detected triggers: {triggers}")
+        triggers = parse_json(response.content, TRIGGERS_SCHEMA)
+        logger.info("Detected triggers: %s", triggers)
         return {"detected_triggers": triggers}
-    except json.JSONDecodeError:
-        # Fallback to simple parsing
-        triggers = [t.strip() for t in response.content.split(',') if t.strip()]
-        print(f"Detected triggers (fallback): {triggers}")
+    except ValueError:
+        # Fallback: pick known trigger names out of the free text
+        lower_content = response.content.lower()
+        triggers = [t for t in TRIGGERS if t.lower() in lower_content]
+        logger.info("Detected triggers (fallback): %s", triggers)
+        record_parse_failure("trigger_detective")
         return {"detected_triggers": triggers}
 
 
+# --- RECIPE INDEX ---
+# Candidate meals for the plan agents when RECIPE_MODE is on
+def recipe_candidates(state: AgentState) -> list:
+    """The best indexed recipes for this request ([] when RECIPE_MODE is off)"""
+    if recipe_index is None:
+        return []
+    return recipe_index.candidates(state.get('user_profile', {}), state.get('health_data', {}), state.get('detected_triggers', []))
+
+def glucose_trend(health: Dict) -> str:
+    """The glucose trend, with the CGM summary when readings were sent (see cgm.py)"""
+    trend = health.get('glucose_trend', 'Normal')
+    summary = health.get('glucose_summary')
+    return f"{trend} ({summary})" if summary else trend
+
+def plan_context(state: AgentState, candidates: list) -> Dict[str, str]:
+    """Request data for the nutritionist and meal planner prompts"""
+    profile = state.get('user_profile', {})
+    health = state.get('health_data', {})
+    triggers = state.get('detected_triggers', [])
+    return {
+        "name": profile.get('name', 'User'),
+        "diet": profile.get('diet', 'No specific diet'),
+        "allergies": profile.get('allergies', []),
+        "likes": profile.get('likes', []),
+        "dislikes": profile.get('dislikes', []),
+        "glucose_trend": glucose_trend(health),
+        "energy_level": health.get('energy_level', 'Normal'),
+        "triggers": ', '.join(triggers) if triggers else 'None',
+        "candidates": f"\nCANDIDATE MEALS (from our recipe index; all fit the diet and allergies):\n{describe_candidates(candidates)}" if candidates else "",
+    }
+
+def indexed_recipe(state: AgentState):
+    """The indexed recipe the plan was built on, if any"""
+    if recipe_index is None or not state.get('recipe_id'):
+        return None
+    return recipe_index.by_id.get(state['recipe_id'])
+
+# Returned instead of a plan that fails the output safety check
+UNSAFE_PLAN_RESPONSE = "I cannot provide a recommendation at this time due to safety concerns with the generated advice. Please consult a healthcare professional."
+
 # --- 3. NUTRITIONIST AGENT ---
 # Adjusts meal suggestions based on health data and triggers
+@agent_node
 def nutritionist_agent(state: AgentState):
-    print("--- NUTRITIONIST AGENT WORKING ---")
-    profile = state.get('user_profile', {})
-    health = state.get('health_data', {})
+    logger.debug("Nutritionist agent working")
     triggers = state.get('detected_triggers', [])
     
-    prompt = f"""
-    You are an expert Nutritionist and Dietitian.
+    candidates = recipe_candidates(state)
+    if candidates and RECIPE_MODE == "template":
+        recipe = candidates[0]
+        logger.info("Nutrition recommendation from the recipe index: %s", recipe.name)
+        return {"final_plan": recipe_index.template_plan(recipe, triggers), "recipe_id": recipe.id}
     
-    USER PROFILE:
-    - Name: {profile.get('name', 'User')}
-    - Diet: {profile.get('diet', 'No specific diet')}
-    - Allergies: {profile.get('allergies', [])}
-    - Likes: {profile.get('likes', [])}
-    - Dislikes: {profile.get('dislikes', [])}
-    
-    HEALTH DATA:
-    - Glucose Trend: {health.get('glucose_trend', 'Normal')}
-    - Energy Level: {health.get('energy_level', 'Normal')}
-    
-    DETECTED TRIGGERS: {', '.join(triggers) if triggers else 'None'}
-    
-    TASK: Create a specific, actionable meal recommendation.
-    
-    Your response should include:
-    1. A specific meal name
-    2. Key ingredients (3-5 items)
-    3. Why this meal addresses their current state (glucose/energy/triggers)
-    4. Nutritional benefits
-    
-    Be specific and practical. Consider their dietary restrictions and preferences.
-    Format your response clearly with sections.
-    """
-    
-    response = llm.invoke(prompt)
+    response = yield NUTRITIONIST_PROMPT.format_messages(**plan_context(state, candidates))
     
     # SAFETY CHECK ON OUTPUT
     is_safe_output, reason = safety.validate_output(response.content)
     if not is_safe_output:
-        print(f"!!! OUTPUT SAFETY VIOLATION: {reason} !!!")
-        safe_response = "I cannot provide a recommendation at this time due to safety concerns with the generated advice. Please consult a healthcare professional."
+        logger.warning("Output safety violation: %s", reason)
+        safe_response = UNSAFE_PLAN_RESPONSE
         return {"final_plan": safe_response, "messages": [AIMessage(content=safe_response)]}
         
-    print(f"\nNutrition recommendation:\n{response.content}\n")
-    return {"final_plan": response.content}
+    logger.info("Nutrition recommendation:\n%s", response.content)
+    recipe = recipe_index.match(response.content, candidates) if candidates else None
+    return {"final_plan": response.content, "recipe_id": recipe.id if recipe else None}
 
 
-# --- 4. LOGISTICS AGENT ---
-# Handles the "doing" part (Scheduling/Groceries)
-def logistics_agent(state: AgentState):
-    print("--- LOGISTICS AGENT WORKING ---")
-    plan = state.get('final_plan', "")
-    
-    # Skip logistics if plan was flagged as unsafe
-    if "safety concerns" in plan:
-        return {"messages": [AIMessage(content=plan)]}
-        
-    triggers = state.get('detected_triggers', [])
-    
-    # Use LLM to create comprehensive logistics plan
-    logistics_prompt = f"""
-    You are a meal planning logistics expert. Based on the meal recommendation and triggers, create a detailed action plan.
-    
-    MEAL RECOMMENDATION:
-    {plan}
+# --- LOGISTICS FORMATTING ---
+# Shared by the logistics agent and the single-shot meal planner
+def format_logistics(logistics: Dict) -> str:
+    """Renders a logistics JSON object as the formatted LOGISTICS PLAN block"""
+    grocery_list = "\n".join([f"  • {item}" for item in logistics.get('grocery_items', [])])
+    tips_list = "\n".join([f"  {i+1}. {tip}" for i, tip in enumerate(logistics.get('meal_prep_tips', []))])
     
-    DETECTED TRIGGERS:
-    {', '.join(triggers) if triggers else 'None'}
-    
-    Create a JSON response with this structure:
-    {{
-        "grocery_items": ["item 1 with quantity", "item 2 with quantity", ...],
-        "prep_time_minutes": 30,
-        "best_prep_day": "Sunday",
-        "best_prep_time": "5:00 PM",
-        "meal_prep_tips": ["tip 1", "tip 2", "tip 3"],
-        "trigger_specific_advice": "advice based on triggers",
-        "storage_instructions": "how to store the meal",
-        "serving_suggestions": "how to serve/portion"
-    }}
-    
-    Be specific with quantities in grocery items (e.g., "2 chicken breasts", "1 cup spinach").
-    Consider the triggers when giving advice.
-    """
-    
-    try:
-        response = llm.invoke(logistics_prompt)
-        content = response.content.strip()
-        if content.startswith("```"):
-            content = content.split("```")[1]
-            if content.startswith("json"):
-                content = content[4:]
-        
-        logistics = json.loads(content.strip())
-        
-        # Build formatted output
-        grocery_list = "\n".join([f"  • {item}" for item in logistics.get('grocery_items', [])])
-        tips_list = "\n".join([f"  {i+1}. {tip}" for i, tip in enumerate(logistics.get('meal_prep_tips', []))])
-        
-        logistics_output = f"""
+    return f"""
 
 {'='*60}
 📋 LOGISTICS PLAN
@@ -279,11 +652,25 @@ def logistics_agent(state: AgentState):
 🍽️ SERVING:
   {logistics.get('serving_suggestions', 'Portion according to your dietary needs')}
 """
-        
-    except Exception as e:
-        print(f"Error in logistics extraction: {e}")
-        # Fallback to simpler extraction
-        logistics_output = f"""
+
+def format_meal_plan(result: Dict) -> str:
+    """Renders the structured single-shot response as the markdown meal plan"""
+    ingredients = "\n".join(f"- {item}" for item in result.get('ingredients', []))
+    benefits_list = "\n".join(f"- {item}" for item in result.get('nutritional_benefits', []))
+    
+    return f"""## {result.get('meal', 'Recommended Meal')}
+
+### Key Ingredients
+{ingredients}
+
+### Why This Meal
+{result.get('rationale', '')}
+
+### Nutritional Benefits
+{benefits_list}"""
+
+# Used when the logistics JSON cannot be produced or parsed
+FALLBACK_LOGISTICS = f"""
 
 {'='*60}
 📋 LOGISTICS PLAN
@@ -302,12 +689,88 @@ def logistics_agent(state: AgentState):
   3. Set a reminder for meal prep
   4. Prepare ingredients in advance for easier cooking
 """
+
+# --- 4. LOGISTICS AGENT ---
+# Handles the "doing" part (Scheduling/Groceries)
+@agent_node
+def logistics_agent(state: AgentState):
+    logger.debug("Logistics agent working")
+    plan = state.get('final_plan', "")
+    
+    # Skip logistics if plan was flagged as unsafe
+    if "safety concerns" in plan:
+        return {"messages": [AIMessage(content=plan)]}
+        
+    triggers = state.get('detected_triggers', [])
+    
+    # A plan built on an indexed recipe takes its groceries and prep
+    # details from the index instead of another LLM call
+    recipe = indexed_recipe(state)
+    if recipe is not None:
+        logistics_output = format_logistics(recipe_index.logistics(recipe, triggers))
+        return {"messages": [AIMessage(content=f"{plan}\n{logistics_output}")]}
+    
+    # Use LLM to create comprehensive logistics plan
+    logistics_prompt = LOGISTICS_PROMPT.format_messages(plan=plan, triggers=', '.join(triggers) if triggers else 'None')
+    
+    try:
+        response = yield LLMRequest(logistics_prompt, schema=LOGISTICS_SCHEMA)
+        logistics = parse_json(response.content, LOGISTICS_SCHEMA)
+        
+        logistics_output = format_logistics(logistics)
+        
+    except Exception as e:
+        logger.warning("Error in logistics extraction: %s", e)
+        record_parse_failure("logistics_agent")
+        # Fallback to simpler extraction
+        logistics_output = FALLBACK_LOGISTICS
     
     final_output = f"{plan}\n{logistics_output}"
-    print(logistics_output)
+    logger.debug("Logistics plan:\n%s", logistics_output)
     
     return {"messages": [AIMessage(content=final_output)]}
 
+# --- 3+4. SINGLE-SHOT MEAL PLANNER ---
+# Replaces nutritionist + logistics with one structured-output LLM call
+@agent_node
+def meal_planner_agent(state: AgentState):
+    logger.debug("Meal planner agent working")
+    triggers = state.get('detected_triggers', [])
+    
+    candidates = recipe_candidates(state)
+    if candidates and RECIPE_MODE == "template":
+        recipe = candidates[0]
+        plan = recipe_index.template_plan(recipe, triggers)
+        logistics_output = format_logistics(recipe_index.logistics(recipe, triggers))
+        logger.info("Nutrition recommendation from the recipe index: %s", recipe.name)
+        return {"final_plan": plan, "recipe_id": recipe.id, "messages": [AIMessage(content=f"{plan}\n{logistics_output}")]}
+    
+    prompt = MEAL_PLANNER_PROMPT.format_messages(**plan_context(state, candidates))
+    response = yield LLMRequest(prompt, {"response_format": {"type": "json_object"}}, schema=MEAL_PLAN_SCHEMA)
+    
+    # SAFETY CHECK ON OUTPUT (covers the plan and the logistics fields)
+    is_safe_output, reason = safety.validate_output(response.content)
+    if not is_safe_output:
+        logger.warning("Output safety violation: %s", reason)
+        safe_response = UNSAFE_PLAN_RESPONSE
+        return {"final_plan": safe_response, "messages": [AIMessage(content=safe_response)]}
+    
+    recipe = None
+    try:
+        result = parse_json(response.content, MEAL_PLAN_SCHEMA)
+        plan = format_meal_plan(result)
+        # A chosen indexed recipe supplies the groceries and prep details
+        recipe = recipe_index.match(result["meal"], candidates) if candidates else None
+        logistics_output = format_logistics(recipe_index.logistics(recipe, triggers) if recipe else result)
+    except ValueError as e:
+        logger.warning("Error in meal plan extraction: %s", e)
+        record_parse_failure("meal_planner_agent")
+        plan = response.content
+        logistics_output = FALLBACK_LOGISTICS
+    
+    logger.info("Nutrition recommendation:\n%s\n%s", plan, logistics_output)
+    return {"final_plan": plan, "recipe_id": recipe.id if recipe else None, "messages": [AIMessage(content=f"{plan}\n{logistics_output}")]}
+
 def router(state: AgentState):
     # Check safety flag first
     if state.get("safety_flag") == "unsafe":
@@ -322,39 +785,345 @@ def router(state: AgentState):
     else:
         return "preference_agent"
 
-workflow = StateGraph(AgentState)
+def parallel_router(state: AgentState):
+    # Same decision as router, but journal requests fan out to both
+    # extraction agents; LangGraph runs them in the same step concurrently
+    # and nutritionist_agent only starts once every branch has finished.
+    route = router(state)
+    if route == "trigger_detective":
+        return ["trigger_detective", "preference_agent"]
+    return route
+
+# --- SEMANTIC CACHE ---
+# Journal requests first look for a near-duplicate journal answered before
+# with the same profile and health data; on a hit its triggers and plan are
+# returned and the rest of the graph is skipped. Misses are stored once the
+# plan is done.
+def semantic_context(state: AgentState) -> str:
+    namespace = f"{PLAN_MODE}:{MODEL_IDS['large']}"
+    return context_key(state.get("user_profile", {}), state.get("health_data", {}), namespace)
+
+@agent_node
+def semantic_cache_lookup(state: AgentState):
+    journal = state.get("journal_entry", "")
+    # Unsafe input, plain chat and journals that update the profile take the full path
+    if router(state) != "trigger_detective" or not journal or PREFERENCE_CUES.search(journal):
+        return {}
+    context = semantic_context(state)
+    cached, similarity = semantic_cache.lookup(journal, context)
+    if cached is None:
+        return {"semantic_cache": {"hit": False, "similarity": round(similarity, 3), "context": context}}
+    logger.info("Semantic cache hit", extra={"similarity": round(similarity, 3)})
+    return {
+        "detected_triggers": cached["detected_triggers"],
+        "final_plan": cached["final_plan"],
+        "messages": [AIMessage(content=cached["response"])],
+        "semantic_cache": {"hit": True, "similarity": round(similarity, 3)},
+    }
+
+@agent_node
+def semantic_cache_store(state: AgentState):
+    lookup = state.get("semantic_cache") or {}
+    plan = state.get("final_plan", "")
+    if "context" in lookup and plan and plan != UNSAFE_PLAN_RESPONSE:
+        semantic_cache.store(state["journal_entry"], lookup["context"], {
+            "detected_triggers": state.get("detected_triggers", []),
+            "final_plan": plan,
+            "response": state["messages"][-1].content,
+        })
+    return {}
+
+def skip_on_cache_hit(route):
+    """Wraps a router so a semantic cache hit ends the run"""
+    def routed(state: AgentState):
+        if (state.get("semantic_cache") or {}).get("hit"):
+            return END
+        return route(state)
+    return routed
+
+# --- SPECULATIVE PLANNING ---
+# The plan prompt only depends on the profile, the health data and the
+# triggers. Journals the local classifier is unsure about start the plan
+# agent on its guess in the same step as the trigger detective's LLM call;
+# the plan agent then reuses that plan if its real inputs are the same.
+# Speculative output only reaches the user through the plan agent, after
+# the same output safety check.
+def predict_triggers(journal: str) -> tuple:
+    """(locally classified triggers, whether trigger_detective will still ask the LLM)"""
+    triggers, confidence = trigger_classifier.classify(journal)
+    asks_llm = TRIGGER_MODE == "llm" or (TRIGGER_MODE != "local" and confidence < TRIGGER_CONFIDENCE_THRESHOLD)
+    return triggers, asks_llm
+
+def plan_inputs(state: AgentState) -> str:
+    """Everything the plan prompt is built from (trigger order aside)"""
+    return json.dumps({
+        "profile": state.get("user_profile", {}),
+        "health": state.get("health_data", {}),
+        "triggers": sorted(state.get("detected_triggers", [])),
+    }, sort_keys=True, default=str)
+
+def speculate(agent):
+    """The speculative_plan node: runs a plan agent on the predicted triggers"""
+    def guess(state: AgentState) -> Dict:
+        triggers, _ = predict_triggers(state.get("journal_entry", ""))
+        return {**state, "detected_triggers": triggers}
+
+    def recorded(state: AgentState, update: Dict) -> Dict:
+        messages = update.get("messages") or []
+        return {"speculation": {
+            "inputs": plan_inputs(state),
+            "update": {key: value for key, value in update.items() if key != "messages"},
+            "response": messages[-1].content if messages else None,
+        }}
+
+    # Speculation is the first work shed when the LLM scheduler is overloaded
+    def node(state, config=None):
+        state = guess(state)
+        try:
+            return recorded(state, agent(state, config))
+        except Overloaded:
+            return {"speculation": None}
+
+    async def async_node(state, config=None):
+        state = guess(state)
+        try:
+            return recorded(state, await agent.async_node(state, config))
+        except Overloaded:
+            return {"speculation": None}
+
+    node.__name__ = "speculative_plan"
+    node.async_node = async_node
+    return node
+
+def reuse_speculation(agent):
+    """Wraps a plan agent so a speculative plan made from the same inputs replaces its LLM call"""
+    def reused(state: AgentState) -> Optional[Dict]:
+        speculation = state.get("speculation")
+        if not speculation:
+            return None
+        if speculation["inputs"] != plan_inputs(state):
+            metrics.inc("nutrition_speculative_plans_total", outcome="discarded")
+            logger.info("Speculative plan discarded", extra={"triggers": state.get("detected_triggers", [])})
+            return None
+        metrics.inc("nutrition_speculative_plans_total", outcome="used")
+        update = dict(speculation["update"])
+        if speculation["response"] is not None:
+            update["messages"] = [AIMessage(content=speculation["response"])]
+        return update
+
+    def node(state, config=None):
+        return reused(state) or agent(state, config)
+
+    async def async_node(state, config=None):
+        return reused(state) or await agent.async_node(state, config)
+
+    node.__name__ = agent.__name__
+    node.async_node = async_node
+    return node
+
+def with_speculation(route):
+    """Wraps a router so journals whose triggers need the LLM also start speculative_plan"""
+    def routed(state: AgentState):
+        branches = route(state)
+        branches = branches if isinstance(branches, list) else [branches]
+        journal = state.get("journal_entry", "")
+        if "trigger_detective" not in branches or not journal or not predict_triggers(journal)[1]:
+            return branches if len(branches) > 1 else branches[0]
+        return branches + ["speculative_plan"]
+    return routed
+
+def _record_node(name: str, start: float, update=None) -> Dict:
+    elapsed = time.perf_counter() - start
+    metrics.observe("nutrition_node_duration_seconds", elapsed, node=name)
+    if update is None:
+        metrics.inc("nutrition_node_errors_total", node=name)
+        return {}
+    return {**update, "timings": {name: round(elapsed * 1000, 1)}}
+
+def _profile_for(config):
+    """The request's Profile (see profiler.py), or None when it is not being profiled"""
+    return ((config or {}).get("configurable") or {}).get("profile")
+
+def timed(name: str, node):
+    """
+    Wraps a node so its wall time is recorded in state['timings'] and in
+    the node latency histogram (failures are counted as node errors).
+    In a profiled request (see profiler.py) it also labels the node's samples.
+    """
+    if inspect.iscoroutinefunction(node):
+        async def async_wrapper(state: AgentState, config: RunnableConfig):
+            profile = _profile_for(config)
+            if profile is not None:
+                # The event loop thread is shared with other requests: time the node, do not sample it
+                with profile.watch(name, sample=False):
+                    return await timed_async(state, config)
+            return await timed_async(state, config)
+
+        async def timed_async(state, config):
+            start = time.perf_counter()
+            try:
+                update = await node(state, config)
+            except Exception:
+                _record_node(name, start)
+                raise
+            return _record_node(name, start, update)
+        return async_wrapper
+
+    def wrapper(state: AgentState, config: RunnableConfig):
+        profile = _profile_for(config)
+        if profile is not None:
+            with profile.watch(name):
+                return timed_sync(state, config)
+        return timed_sync(state, config)
 
-# Add Nodes
-workflow.add_node("safety_agent", safety_agent)
-workflow.add_node("preference_agent", preference_agent)
-workflow.add_node("trigger_detective", trigger_detective)
-workflow.add_node("nutritionist_agent", nutritionist_agent)
-workflow.add_node("logistics_agent", logistics_agent)
+    def timed_sync(state, config):
+        start = time.perf_counter()
+        try:
+            update = node(state, config)
+        except Exception:
+            _record_node(name, start)
+            raise
+        return _record_node(name, start, update)
+    return wrapper
 
-# Set Entry Point
-workflow.set_entry_point("safety_agent")
+def parallel_saving_ms(timings: Dict[str, float]) -> float:
+    """
+    Wall-clock time saved by running the extraction agents side by side:
+    the serial sum of both branches minus the slower of the two.
+    """
+    branches = [timings[name] for name in ("preference_agent", "trigger_detective") if name in timings]
+    if len(branches) < 2:
+        return 0.0
+    return round(sum(branches) - max(branches), 1)
+
+AGENT_NODES = {
+    "history_agent": history_agent,
+    "safety_agent": safety_agent,
+    "preference_agent": preference_agent,
+    "trigger_detective": trigger_detective,
+    "nutritionist_agent": nutritionist_agent,
+    "logistics_agent": logistics_agent,
+    "meal_planner_agent": meal_planner_agent,
+    "semantic_cache_lookup": semantic_cache_lookup,
+    "semantic_cache_store": semantic_cache_store,
+}
+
+def build_workflow(asynchronous: bool = False, checkpointer=None):
+    """
+    Builds and compiles the agent graph.
+    With asynchronous=True every node is the agent's async twin, so the
+    compiled graph should be driven with ainvoke/astream. With a
+    checkpointer, each invocation resumes the thread named in its config.
+    """
+    workflow = StateGraph(AgentState)
+
+    # Planning runs as one structured call or as nutritionist -> logistics
+    extraction_nodes = ["preference_agent", "trigger_detective"]
+    if PLAN_MODE == "single_shot":
+        plan_nodes = ["meal_planner_agent"]
+    else:
+        plan_nodes = ["nutritionist_agent", "logistics_agent"]
+
+    # Checkpointed threads grow with every visit, so they start by compacting
+    # the stored conversation
+    entry_nodes = ["history_agent", "safety_agent"] if checkpointer is not None else ["safety_agent"]
+
+    route = parallel_router if GRAPH_MODE == "parallel" else router
+    if SPECULATIVE_PLAN:
+        route = with_speculation(route)
+
+    # The semantic cache looks journals up before routing and stores plans after
+    if semantic_cache is not None:
+        entry_nodes.append("semantic_cache_lookup")
+        plan_nodes = plan_nodes + ["semantic_cache_store"]
+        route = skip_on_cache_hit(route)
+
+    # Add Nodes
+    nodes = {name: AGENT_NODES[name] for name in entry_nodes + extraction_nodes + plan_nodes}
+    if SPECULATIVE_PLAN:
+        nodes["speculative_plan"] = speculate(nodes[plan_nodes[0]])
+        nodes[plan_nodes[0]] = reuse_speculation(nodes[plan_nodes[0]])
+    for name, node in nodes.items():
+        workflow.add_node(name, timed(name, node.async_node if asynchronous else node))
+
+    # Set Entry Point
+    workflow.set_entry_point(entry_nodes[0])
+    for current, following in zip(entry_nodes, entry_nodes[1:]):
+        workflow.add_edge(current, following)
 
-# Set Conditional Edges from Safety Agent
-workflow.add_conditional_edges(
-    "safety_agent",
-    router,
-    {
+    # Set Conditional Edges from Safety Agent (or the cache lookup after it)
+    routes = {
         "trigger_detective": "trigger_detective",
         "preference_agent": "preference_agent",
         END: END
     }
-)
+    if SPECULATIVE_PLAN:
+        routes["speculative_plan"] = "speculative_plan"
+    workflow.add_conditional_edges(entry_nodes[-1], route, routes)
+
+    # Define other Edges
+    for name in extraction_nodes + (["speculative_plan"] if SPECULATIVE_PLAN else []):
+        workflow.add_edge(name, plan_nodes[0])
+    for current, following in zip(plan_nodes, plan_nodes[1:]):
+        workflow.add_edge(current, following)
+    workflow.add_edge(plan_nodes[-1], END)
+
+    # Compile
+    return workflow.compile(checkpointer=checkpointer)
+
+app = build_workflow()
+async_app = build_workflow(asynchronous=True)
 
-# Define other Edges
-workflow.add_edge("preference_agent", "nutritionist_agent")
-workflow.add_edge("trigger_detective", "nutritionist_agent")
-workflow.add_edge("nutritionist_agent", "logistics_agent")
-workflow.add_edge("logistics_agent", END)
+# Per-user variant used when a request carries a user id
+checkpointer = build_checkpointer(PROFILE_STORE, PROFILE_STORE_PATH)
+profile_app = build_workflow(checkpointer=checkpointer) if checkpointer else None
 
-# Compile
-app = workflow.compile()
+_async_profile_app = None
+
+def get_async_profile_app():
+    """
+    Async per-user graph, built on first use because the async SQLite
+    checkpointer has to be created inside the running event loop.
+    """
+    global _async_profile_app
+    if _async_profile_app is None and PROFILE_STORE != "off":
+        async_checkpointer = build_checkpointer(PROFILE_STORE, PROFILE_STORE_PATH, asynchronous=True)
+        _async_profile_app = build_workflow(asynchronous=True, checkpointer=async_checkpointer)
+    return _async_profile_app
+
+# Nodes job mode (see app.py) leaves to a background job once the plan is ready
+DEFERRABLE_NODES = ["logistics_agent"]
+
+def deferrable_nodes(graph) -> List[str]:
+    """The deferrable nodes this compiled graph has (none in single_shot mode)"""
+    return [name for name in DEFERRABLE_NODES if name in graph.nodes]
+
+# Job mode stops a run before its deferrable nodes and resumes it later,
+# which needs a checkpointer; anonymous requests get a throwaway thread here
+job_checkpointer = None
+_job_apps = {}
+
+def get_job_app(asynchronous: bool = False):
+    """Checkpointed graph for anonymous job-mode requests, built on first use"""
+    global job_checkpointer
+    if asynchronous not in _job_apps:
+        if job_checkpointer is None:
+            from langgraph.checkpoint.memory import InMemorySaver
+            job_checkpointer = InMemorySaver()
+        _job_apps[asynchronous] = build_workflow(asynchronous=asynchronous, checkpointer=job_checkpointer)
+    return _job_apps[asynchronous]
+
+async def close_async_profile_app():
+    """Releases the async checkpointer's connection (call on server shutdown)"""
+    global _async_profile_app
+    if _async_profile_app is not None:
+        await aclose_checkpointer(_async_profile_app.checkpointer)
+        _async_profile_app = None
 
 if __name__ == "__main__":
+    # Show agent progress on the command line unless told otherwise
+    configure_logging(os.getenv("LOG_LEVEL", "INFO"))
+
     # --- SCENARIO 1: JOURNAL ENTRY WITH STRESS & LOW ENERGY ---
     print("\n\n### SCENARIO: Stress Eating Detection ###")
     
@@ -369,4 +1138,6 @@ if __name__ == "__main__":
     
     print("\n--- FINAL AGENT RESPONSE ---")
     print(result['messages'][-1].content)
+    print(f"\nNode timings (ms): {result.get('timings', {})}")
+    print(f"Parallel saving (ms): {parallel_saving_ms(result.get('timings', {}))}")
 
@@ -0,0 +1,270 @@
+import bisect
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from local fast paths up to slow LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# USD per million tokens, for the spend counters (Groq list price for
+# openai/gpt-oss-120b at the time of writing; override for other models)
+PROMPT_PRICE_PER_MTOK = float(os.getenv("LLM_PROMPT_PRICE_PER_MTOK", "0.15"))
+COMPLETION_PRICE_PER_MTOK = float(os.getenv("LLM_COMPLETION_PRICE_PER_MTOK", "0.75"))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class RollingHistogram:
+    """
+    Bucketed observations over the last `window_seconds`, kept as `slots`
+    rotating sub-windows so old observations age out without storing them.
+    Cumulative totals since start are kept alongside for Prometheus, whose
+    histogram buckets, count and sum must never go down.
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS, window_seconds: float = 600, slots: int = 10):
+        self.buckets = tuple(buckets)
+        self.slot_seconds = window_seconds / slots
+        # Per slot: [slot_id, counts per bucket (+Inf last), sum]
+        self._slots: List[list] = [[-1, [0] * (len(self.buckets) + 1), 0.0] for _ in range(slots)]
+        self._total_counts = [0] * (len(self.buckets) + 1)
+        self._total_sum = 0.0
+        self._lock = threading.Lock()
+
+    def _slot(self, now: float) -> list:
+        slot_id = int(now // self.slot_seconds)
+        slot = self._slots[slot_id % len(self._slots)]
+        if slot[0] != slot_id:
+            slot[0], slot[1], slot[2] = slot_id, [0] * (len(self.buckets) + 1), 0.0
+        return slot
+
+    def observe(self, value: float, now: Optional[float] = None) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            slot = self._slot(time.time() if now is None else now)
+            slot[1][index] += 1
+            slot[2] += value
+            self._total_counts[index] += 1
+            self._total_sum += value
+
+    def snapshot(self, now: Optional[float] = None) -> Tuple[List[int], float, int]:
+        """(per-bucket counts with +Inf last, sum, count) over the live window"""
+        now = time.time() if now is None else now
+        oldest = int(now // self.slot_seconds) - len(self._slots) + 1
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        with self._lock:
+            for slot_id, slot_counts, slot_sum in self._slots:
+                if slot_id >= oldest:
+                    counts = [a + b for a, b in zip(counts, slot_counts)]
+                    total += slot_sum
+        return counts, total, sum(counts)
+
+    def cumulative(self) -> Tuple[List[int], float, int]:
+        """(per-bucket counts with +Inf last, sum, count) since start"""
+        with self._lock:
+            counts = list(self._total_counts)
+            total = self._total_sum
+        return counts, total, sum(counts)
+
+    def quantile(self, q: float, now: Optional[float] = None) -> float:
+        """Estimated q-quantile, interpolated linearly inside its bucket"""
+        counts, _, count = self.snapshot(now)
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    In-process counters and rolling histograms with labels, rendered in the
+    Prometheus text exposition format. Everything exported is cumulative
+    since start; the rolling window only feeds summary() and hedging.
+    """
+
+    def __init__(self, window_seconds: float = 600):
+        self.window_seconds = window_seconds
+        self._meta: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], RollingHistogram] = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, RollingHistogram(window_seconds=self.window_seconds))
+        histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, name: str, **labels: str) -> Optional[RollingHistogram]:
+        return self._histograms.get((name, tuple(sorted(labels.items()))))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """p50/p95/p99 in ms and count per histogram series, for /api/debug"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (name, labels), histogram in sorted(self._histograms.items()):
+            series = ",".join(value for _, value in labels) or "all"
+            result.setdefault(name, {})[series] = {
+                "count": histogram.snapshot()[2],
+                "p50_ms": round(histogram.quantile(0.5) * 1000, 1),
+                "p95_ms": round(histogram.quantile(0.95) * 1000, 1),
+                "p99_ms": round(histogram.quantile(0.99) * 1000, 1),
+            }
+        return result
+
+    def render_prometheus(self, gauges: Iterable[Tuple[str, Dict[str, str], float]] = (),
+                          counters: Iterable[Tuple[str, Dict[str, str], float]] = ()) -> str:
+        """
+        Prometheus text format; `gauges` and `counters` (totals kept
+        elsewhere, e.g. by the LLM cache) are (name, labels, value) read at
+        scrape time
+        """
+        lines: List[str] = []
+        described = set()
+
+        def header(name, default_kind):
+            if name in described:
+                return
+            described.add(name)
+            kind, help_text = self._meta.get(name, (default_kind, ""))
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            own_counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+
+        for (name, labels), value in own_counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            counts, total, count = histogram.cumulative()
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name, labels, value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+        for name, labels, value in gauges:
+            header(name, "gauge")
+            lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+metrics = MetricsRegistry(window_seconds=float(os.getenv("METRICS_WINDOW_SECONDS", "600")))
+
+metrics.describe("nutrition_node_duration_seconds", "histogram", "Wall time per graph node")
+metrics.describe("nutrition_node_errors_total", "counter", "Graph node runs that raised")
+metrics.describe("nutrition_llm_call_duration_seconds", "histogram", "Wall time per LLM call by agent, from admission to reply (cache hits excluded)")
+metrics.describe("nutrition_llm_calls_total", "counter", "LLM calls by agent and outcome (ok, cache_hit, error)")
+metrics.describe("nutrition_llm_prompt_tokens_total", "counter", "Prompt tokens sent to the provider (cache hits excluded)")
+metrics.describe("nutrition_llm_completion_tokens_total", "counter", "Completion tokens received from the provider (cache hits excluded)")
+metrics.describe("nutrition_llm_cached_prompt_tokens_total", "counter", "Prompt tokens the provider reported as served from its prompt cache")
+metrics.describe("nutrition_prompt_tokens_total", "counter", "Approximate prompt tokens sent per agent, split into the static template prefix and the per-request part")
+metrics.describe("nutrition_llm_cost_usd_total", "counter", "Estimated LLM spend from token counts and configured prices")
+metrics.describe("nutrition_llm_retries_total", "counter", "LLM calls retried, by reason")
+metrics.describe("nutrition_llm_deadline_exceeded_total", "counter", "LLM calls cut off by their agent timeout or the request deadline")
+metrics.describe("nutrition_llm_hedges_total", "counter", "Duplicate LLM calls fired after the hedge delay")
+metrics.describe("nutrition_llm_hedge_wins_total", "counter", "Hedged LLM calls where the duplicate answered first")
+metrics.describe("nutrition_llm_escalations_total", "counter", "Small-model replies that failed their schema and were asked again of the large model")
+metrics.describe("nutrition_semantic_cache_lookups_total", "counter", "Semantic journal cache lookups by outcome (hit, miss)")
+metrics.describe("nutrition_semantic_cache_evictions_total", "counter", "Semantic journal cache entries evicted to make room")
+metrics.describe("nutrition_speculative_plans_total", "counter", "Speculative plans by outcome (used, discarded because the real inputs differed)")
+metrics.describe("nutrition_llm_admissions_total", "counter", "LLM calls by priority class and admission outcome (admitted, or turned away: quota, queue_full, wait, timeout)")
+metrics.describe("nutrition_llm_queue_wait_seconds", "histogram", "Time LLM calls waited in the scheduler queue by priority class")
+metrics.describe("nutrition_coalesced_requests_total", "counter", "Analyze requests that joined an identical request already in flight instead of running")
+metrics.describe("nutrition_profiled_requests_total", "counter", "Requests whose graph run was profiled and written to PROFILING_DIR, by endpoint")
+metrics.describe("nutrition_jobs_total", "counter", "Background analyze jobs by outcome (done, error, rejected because the queue was full)")
+metrics.describe("nutrition_job_duration_seconds", "histogram", "Time from queueing a background job to its result")
+metrics.describe("nutrition_parse_failures_total", "counter", "LLM outputs that could not be parsed into the expected structure")
+metrics.describe("nutrition_llm_cache_lookups_total", "counter", "LLM response cache lookups by result (hit, miss)")
+
+
+def record_llm_call(agent: str, seconds: Optional[float], response: Any = None, error: Optional[BaseException] = None) -> None:
+    """
+    Records one LLM call: outcome, and latency and tokens/cost unless served
+    from cache. The latency histogram drives the hedge delay, so it only
+    holds calls that reached the provider (`seconds` is None for calls that
+    never got past the scheduler).
+    """
+    if (getattr(response, "response_metadata", None) or {}).get("cache_hit"):
+        metrics.inc("nutrition_llm_calls_total", agent=agent, outcome="cache_hit")
+        return
+    if seconds is not None:
+        metrics.observe("nutrition_llm_call_duration_seconds", seconds, agent=agent)
+    if error is not None:
+        metrics.inc("nutrition_llm_calls_total", agent=agent, outcome="error")
+        return
+
+    metrics.inc("nutrition_llm_calls_total", agent=agent, outcome="ok")
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens", 0)
+    completion_tokens = usage.get("output_tokens", 0)
+    if prompt_tokens or completion_tokens:
+        metrics.inc("nutrition_llm_prompt_tokens_total", prompt_tokens, agent=agent)
+        metrics.inc("nutrition_llm_completion_tokens_total", completion_tokens, agent=agent)
+        cached_tokens = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        if cached_tokens:
+            metrics.inc("nutrition_llm_cached_prompt_tokens_total", cached_tokens, agent=agent)
+        cost = (prompt_tokens * PROMPT_PRICE_PER_MTOK + completion_tokens * COMPLETION_PRICE_PER_MTOK) / 1e6
+        metrics.inc("nutrition_llm_cost_usd_total", cost, agent=agent)
+
+
+def record_prompt_tokens(agent: str, static: int, variable: int) -> None:
+    """Records the (approximate) tokens of a sent prompt's static prefix and of the rest"""
+    metrics.inc("nutrition_prompt_tokens_total", static, agent=agent, part="static")
+    metrics.inc("nutrition_prompt_tokens_total", variable, agent=agent, part="variable")
+
+
+def record_parse_failure(agent: str) -> None:
+    metrics.inc("nutrition_parse_failures_total", agent=agent)
@@ -0,0 +1,210 @@
+"""
+Accuracy and latency of model assignments for the extraction agents.
+
+Each assignment (which tier preference_agent and trigger_detective run on)
+is evaluated over the labelled fixtures: accuracy of the final output,
+replies that failed their schema on the first try (and were escalated to
+the large model), calls made and per-case latency.
+
+Record model replies once against the live API, then replay them offline:
+    python model_eval.py --record   # needs GROQ_API_KEY
+    python model_eval.py            # replays fixtures/model_eval_cassette.jsonl
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import main
+from model_registry import ModelRegistry
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CASSETTE_PATH = os.path.join(FIXTURES, "model_eval_cassette.jsonl")
+EVAL_AGENTS = ("preference_agent", "trigger_detective")
+
+# Assignments compared by default: everything on the large model, the
+# configured routing (LLM_NODE_MODELS) and every extraction agent on the
+# small model
+ASSIGNMENTS = {
+    "all_large": {},
+    "configured": {node: tier for node, tier in main.NODE_MODELS.items() if node in EVAL_AGENTS},
+    "all_small": {node: "small" for node in EVAL_AGENTS},
+}
+
+
+def _load_jsonl(name: str) -> List[Dict]:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_cases() -> Dict[str, List[Dict]]:
+    return {
+        "preference_agent": _load_jsonl("profile_messages.jsonl"),
+        "trigger_detective": _load_jsonl("trigger_journals.jsonl"),
+    }
+
+
+def prompt_key(messages: List) -> str:
+    """Stable hash of a rendered prompt"""
+    rendered = json.dumps([(message.type, message.content) for message in messages])
+    return hashlib.sha256(rendered.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded replies keyed by (model id, prompt hash), with the latency
+    each took. `log` lists the (model_id, latency_ms) of every call served
+    since it was last cleared.
+    """
+
+    def __init__(self, entries: Optional[Dict] = None):
+        self.entries: Dict[tuple, Dict] = entries or {}
+        self.log: List[tuple] = []
+
+    @classmethod
+    def load(cls, path: str = CASSETTE_PATH) -> "Cassette":
+        with open(path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return cls({(row["model"], row["key"]): row for row in rows})
+
+    def save(self, path: str = CASSETTE_PATH) -> None:
+        with open(path, "w") as f:
+            for row in self.entries.values():
+                f.write(json.dumps(row) + "\n")
+
+    def add(self, model_id: str, messages: List, content: str, latency_ms: float) -> None:
+        key = prompt_key(messages)
+        self.entries.setdefault((model_id, key), {"model": model_id, "key": key, "content": content, "latency_ms": latency_ms})
+
+    def lookup(self, model_id: str, messages: List) -> Dict:
+        try:
+            return self.entries[(model_id, prompt_key(messages))]
+        except KeyError:
+            raise KeyError(f"No recorded reply from {model_id} for this prompt; re-run with --record") from None
+
+
+class CassetteChatModel(BaseChatModel):
+    """Replays a model's recorded replies, or records them when given the live model as `inner`"""
+
+    model_id: str
+    cassette: Any
+    inner: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.inner is not None:
+            start = time.perf_counter()
+            content = self.inner.invoke(messages, **kwargs).content
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.cassette.add(self.model_id, messages, content, latency_ms)
+        else:
+            row = self.cassette.lookup(self.model_id, messages)
+            content, latency_ms = row["content"], row["latency_ms"]
+        self.cassette.log.append((self.model_id, latency_ms))
+        message = AIMessage(content=content, response_metadata={"model_name": self.model_id})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def _same(expected: Any, actual: Any) -> bool:
+    if isinstance(expected, list):
+        return isinstance(actual, list) and {str(v).lower() for v in expected} == {str(v).lower() for v in actual}
+    return str(expected).strip().lower() == str(actual).strip().lower()
+
+
+def _run_case(agent: str, case: Dict, config: Dict) -> bool:
+    """Runs one agent node on a fixture case; True if its output matches the labels"""
+    if agent == "trigger_detective":
+        state = {"journal_entry": case["text"], "messages": [HumanMessage(content=case["text"])]}
+        return _same(case["triggers"], main.trigger_detective(state, config)["detected_triggers"])
+    state = {
+        "messages": [HumanMessage(content=f"Here is my journal: {case['text']}")],
+        "user_profile": {"name": "User", "diet": "No specific diet", "allergies": []},
+    }
+    profile = main.preference_agent(state, config).get("user_profile", {})
+    return all(_same(value, profile.get(field)) for field, value in case["profile"].items())
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+def evaluate(cassette: Cassette, assignments: Dict[str, Dict[str, str]] = ASSIGNMENTS,
+             cases: Optional[Dict[str, List[Dict]]] = None, inner_factory=None) -> Dict[str, Dict[str, Dict]]:
+    """
+    {assignment: {agent: stats}} over the fixture cases. With inner_factory
+    (model_id -> live chat model) replies are recorded into the cassette,
+    otherwise they are replayed from it. The trigger detective always asks
+    the model here (TRIGGER_MODE=llm), so the model is what gets measured.
+    """
+    cases = cases or load_cases()
+    results: Dict[str, Dict[str, Dict]] = {}
+    trigger_mode = main.TRIGGER_MODE
+    main.TRIGGER_MODE = "llm"
+    try:
+        for name, assignment in assignments.items():
+            registry = ModelRegistry(
+                lambda model_id: CassetteChatModel(
+                    model_id=model_id, cassette=cassette, cache=False,
+                    inner=inner_factory(model_id) if inner_factory else None,
+                ),
+                main.MODEL_IDS, assignment,
+            )
+            config = {"configurable": {"llm": registry}}
+            for agent in EVAL_AGENTS:
+                correct, calls, escalated, latencies = 0, 0, 0, []
+                for case in cases[agent]:
+                    cassette.log.clear()
+                    correct += _run_case(agent, case, config)
+                    calls += len(cassette.log)
+                    escalated += len({model_id for model_id, _ in cassette.log}) > 1
+                    latencies.append(sum(latency for _, latency in cassette.log))
+                results.setdefault(name, {})[agent] = {
+                    "model": main.MODEL_IDS[registry.tier(agent)],
+                    "cases": len(cases[agent]),
+                    "accuracy": round(correct / len(cases[agent]), 3),
+                    "escalated": escalated,
+                    "calls": calls,
+                    "p50_ms": round(_percentile(latencies, 0.5), 1),
+                    "p95_ms": round(_percentile(latencies, 0.95), 1),
+                    "total_ms": round(sum(latencies), 1),
+                }
+    finally:
+        main.TRIGGER_MODE = trigger_mode
+    return results
+
+
+def format_report(results: Dict[str, Dict[str, Dict]]) -> str:
+    header = f"{'assignment':<12} {'agent':<18} {'model':<22} {'acc':>6} {'esc':>4} {'calls':>5} {'p50 ms':>8} {'p95 ms':>8}"
+    lines = [header, "-" * len(header)]
+    for name, agents in results.items():
+        for agent, stats in agents.items():
+            lines.append(
+                f"{name:<12} {agent:<18} {stats['model']:<22} {stats['accuracy']:>6.1%} {stats['escalated']:>4} "
+                f"{stats['calls']:>5} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f}"
+            )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="call the live models and (re)write the cassette")
+    parser.add_argument("--cassette", default=CASSETTE_PATH)
+    args = parser.parse_args()
+
+    if args.record:
+        cassette = Cassette()
+        results = evaluate(cassette, inner_factory=lambda model_id: main.build_llm(model=model_id, cache=False))
+        cassette.save(args.cassette)
+    else:
+        results = evaluate(Cassette.load(args.cassette))
+    print(format_report(results))
@@ -0,0 +1,86 @@
+import os
+import threading
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+# Model ids per tier (Groq ids; override with LLM_MODEL_LARGE / LLM_MODEL_SMALL)
+DEFAULT_MODELS = {"large": "openai/gpt-oss-120b", "small": "openai/gpt-oss-20b"}
+
+# Every node runs the large model unless LLM_NODE_MODELS moves it to the
+# small tier: a smaller model changes what users get back, so routing to it
+# is opt-in (see model_eval.py for measuring a candidate assignment)
+DEFAULT_ASSIGNMENTS: Dict[str, str] = {}
+
+
+def _parse_assignments(value: str) -> Dict[str, str]:
+    """'trigger_detective=small,logistics_agent=large' -> {node: tier}"""
+    assignments = {}
+    for item in value.split(","):
+        if "=" in item:
+            node, tier = item.split("=", 1)
+            assignments[node.strip()] = tier.strip()
+    return assignments
+
+
+def load_model_config(env: Mapping[str, str] = os.environ) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    (models, assignments) from LLM_MODEL_LARGE / LLM_MODEL_SMALL and
+    LLM_NODE_MODELS ("node=tier,..."). Without LLM_NODE_MODELS every node
+    runs the large model.
+    """
+    models = {
+        "large": env.get("LLM_MODEL_LARGE", DEFAULT_MODELS["large"]),
+        "small": env.get("LLM_MODEL_SMALL", DEFAULT_MODELS["small"]),
+    }
+    if "LLM_NODE_MODELS" in env:
+        assignments = _parse_assignments(env["LLM_NODE_MODELS"])
+    else:
+        assignments = dict(DEFAULT_ASSIGNMENTS)
+    return models, assignments
+
+
+class ModelRegistry:
+    """
+    Chat models by tier with a per-node assignment. Models are built on
+    first use by `factory(model_id)` and shared afterwards. Nodes on a
+    tier other than the default (large) one may escalate to it when their
+    output does not validate (see agent_node in main.py).
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], Any],
+        models: Optional[Dict[str, str]] = None,
+        assignments: Optional[Dict[str, str]] = None,
+        default_tier: str = "large",
+    ):
+        self.factory = factory
+        self.models = dict(DEFAULT_MODELS if models is None else models)
+        self.assignments = dict(DEFAULT_ASSIGNMENTS if assignments is None else assignments)
+        self.default_tier = default_tier
+        for node, tier in [(None, default_tier)] + list(self.assignments.items()):
+            if tier not in self.models:
+                raise ValueError(f"Unknown model tier {tier!r}" + (f" for {node}" if node else ""))
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def tier(self, node: str) -> str:
+        return self.assignments.get(node, self.default_tier)
+
+    def get(self, tier: str) -> Any:
+        """The shared model instance for a tier"""
+        with self._lock:
+            if tier not in self._instances:
+                self._instances[tier] = self.factory(self.models[tier])
+            return self._instances[tier]
+
+    def for_node(self, node: str, tier: Optional[str] = None) -> Any:
+        """The model a node should call (its assigned tier unless one is given)"""
+        return self.get(tier or self.tier(node))
+
+    def escalates(self, node: str) -> bool:
+        """True if the node runs on a smaller tier and can fall back to the default one"""
+        return self.tier(node) != self.default_tier
+
+    def describe(self) -> Dict[str, str]:
+        """Model id per assigned node, for /api/debug"""
+        return {node: self.models[tier] for node, tier in sorted(self.assignments.items())}
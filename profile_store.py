@@ -0,0 +1,49 @@
+import inspect
+import sqlite3
+from typing import Any, Optional
+
+# One in-process saver shared by the sync and async graphs in "memory" mode
+_memory_saver = None
+
+
+def build_checkpointer(mode: str, path: str = ".profile_store.sqlite", asynchronous: bool = False) -> Optional[Any]:
+    """
+    Builds the LangGraph checkpointer that persists each user's thread
+    (profile, conversation and bookkeeping) between requests.
+    "off" -> None, "memory" -> a shared in-process saver,
+    "sqlite" -> SqliteSaver, or AsyncSqliteSaver when asynchronous=True
+    (which must be built inside the running event loop).
+    """
+    global _memory_saver
+    mode = (mode or "off").lower()
+    if mode == "off":
+        return None
+
+    if mode == "memory":
+        from langgraph.checkpoint.memory import InMemorySaver
+        if _memory_saver is None:
+            _memory_saver = InMemorySaver()
+        return _memory_saver
+
+    if mode == "sqlite":
+        # Requires langgraph-checkpoint-sqlite (and aiosqlite for the async graph)
+        if asynchronous:
+            import aiosqlite
+            from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+            return AsyncSqliteSaver(aiosqlite.connect(path))
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        return SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+
+    raise ValueError(f"Unknown profile store mode: {mode!r} (expected off, memory or sqlite)")
+
+
+async def aclose_checkpointer(saver: Any):
+    """Closes the connection behind an async SQLite checkpointer (no-op for the others)"""
+    conn = getattr(saver, "conn", None)
+    if conn is not None and inspect.iscoroutinefunction(getattr(conn, "close", None)):
+        await conn.close()
+
+
+def thread_config(user_id: str) -> dict:
+    """Graph config that resumes the given user's checkpointed thread"""
+    return {"configurable": {"thread_id": user_id}}
@@ -0,0 +1,376 @@
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from metrics import metrics
+
+# Samples not taken inside an agent node: LangGraph scheduling, state merges, routing
+GRAPH_LABEL = "graph"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class ProfilingSettings(NamedTuple):
+    """When requests are profiled and where the output goes (see load_profiling_settings)"""
+    sample_rate: float = 0.0    # fraction of requests profiled without asking
+    header: bool = True         # honour X-Profiling: 1 on a request
+    interval_ms: float = 5.0    # time between stack samples
+    directory: str = ".profiles"
+    keep: int = 100             # newest profiles kept on disk
+    admin_token: str = ""       # required (X-Admin-Token) to list/download profiles or use the header; unset disables both
+
+
+def load_profiling_settings(env: Mapping[str, str] = os.environ) -> ProfilingSettings:
+    """
+    Reads PROFILING_SAMPLE_RATE (0-1), PROFILING_HEADER (on/off),
+    PROFILING_INTERVAL_MS, PROFILING_DIR, PROFILING_KEEP and
+    PROFILING_ADMIN_TOKEN.
+    """
+    defaults = ProfilingSettings()
+    return ProfilingSettings(
+        sample_rate=min(max(float(env.get("PROFILING_SAMPLE_RATE", defaults.sample_rate)), 0.0), 1.0),
+        header=env.get("PROFILING_HEADER", "on").lower() in ("on", "true", "1"),
+        interval_ms=max(float(env.get("PROFILING_INTERVAL_MS", defaults.interval_ms)), 0.5),
+        directory=env.get("PROFILING_DIR", defaults.directory),
+        keep=int(env.get("PROFILING_KEEP", defaults.keep)),
+        admin_token=env.get("PROFILING_ADMIN_TOKEN", defaults.admin_token),
+    )
+
+
+def _stack_depth(frame) -> int:
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+class _Watch:
+    """Context manager marking the calling thread as running `label` for a Profile"""
+
+    def __init__(self, profile: "Profile", label: str, sample: bool):
+        self.profile = profile
+        self.label = label
+        self.sample = sample
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.sample:
+            # Samples keep only the frames below the `with` statement
+            self.profile._push(threading.get_ident(), self.label, _stack_depth(sys._getframe(1)))
+        return self
+
+    def __exit__(self, *exc):
+        if self.sample:
+            self.profile._pop(threading.get_ident())
+        self.profile._span(self.label, self.started, time.perf_counter())
+        return False
+
+
+class Profile:
+    """
+    Stack samples and node timings for one request. Threads taking part
+    register with watch(); the shared sampler records the current stack
+    of each registered thread, attributed to the innermost label (a graph
+    node, else GRAPH_LABEL), weighted by the wall time since the last
+    sample.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.created = time.time()
+        # Sorts by creation time: UTC to the millisecond, then a random suffix
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(self.created))
+        self.id = f"{stamp}{int(self.created * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self._lock = threading.Lock()
+        self._threads: Dict[int, List[Tuple[str, int]]] = {}
+        self._stacks: Dict[tuple, List[float]] = defaultdict(lambda: [0, 0.0])
+        self._spans: List[Tuple[str, float, float]] = []
+
+    def watch(self, label: str = GRAPH_LABEL, sample: bool = True) -> _Watch:
+        """
+        Times `label` and, with sample=True, samples the calling thread while
+        inside it. Async code shares its thread with other requests, so it
+        passes sample=False and only gets node timings.
+        """
+        return _Watch(self, label, sample)
+
+    def _push(self, thread_id: int, label: str, depth: int) -> None:
+        with self._lock:
+            self._threads.setdefault(thread_id, []).append((label, depth))
+
+    def _pop(self, thread_id: int) -> None:
+        with self._lock:
+            labels = self._threads[thread_id]
+            labels.pop()
+            if not labels:
+                del self._threads[thread_id]
+
+    def _span(self, label: str, start: float, end: float) -> None:
+        if label != GRAPH_LABEL:
+            with self._lock:
+                self._spans.append((label, start - self.started, end - self.started))
+
+    def _sample(self, frames: Dict[int, Any], elapsed: float) -> None:
+        with self._lock:
+            for thread_id, labels in self._threads.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                label, depth = labels[-1]
+                codes = []
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                totals = self._stacks[(label, tuple(codes[depth:]))]
+                totals[0] += 1
+                totals[1] += elapsed
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+
+    def duration(self) -> float:
+        return (self.finished or time.perf_counter()) - self.started
+
+    def summary(self) -> Dict[str, Any]:
+        """Wall time per node (exact) and sampled time per label"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+            spans = list(self._spans)
+        nodes: Dict[str, Dict[str, float]] = {}
+        for label, start, end in spans:
+            node = nodes.setdefault(label, {"calls": 0, "wall_s": 0.0, "sampled_s": 0.0})
+            node["calls"] += 1
+            node["wall_s"] += end - start
+        for (label, _), (_, seconds) in stacks:
+            nodes.setdefault(label, {"calls": 0, "wall_s": 0.0, "sampled_s": 0.0})["sampled_s"] += seconds
+        return {
+            "id": self.id,
+            "name": self.name,
+            "created": round(self.created, 3),
+            "duration_s": round(self.duration(), 4),
+            "samples": int(sum(count for _, (count, _) in stacks)),
+            "nodes": {label: {key: round(value, 4) for key, value in node.items()} for label, node in nodes.items()},
+        }
+
+    def to_folded(self) -> str:
+        """Collapsed stacks ('label;frame;frame count') for flamegraph.pl / inferno"""
+        with self._lock:
+            stacks = list(self._stacks.items())
+        lines = []
+        for (label, codes), (count, _) in stacks:
+            names = [label] + [f"{_code_name(code)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})" for code in codes]
+            lines.append(f"{';'.join(name.replace(';', ',') for name in names)} {int(count)}")
+        return "\n".join(sorted(lines)) + "\n"
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """
+        A speedscope file: one sampled profile whose roots are the node
+        labels, plus the node timeline as evented profiles (one lane per
+        set of non-overlapping node runs).
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+            spans = sorted(self._spans, key=lambda span: span[1])
+        frames: List[Dict[str, Any]] = []
+        index: Dict[Any, int] = {}
+
+        def frame_for(key, **frame) -> int:
+            if key not in index:
+                index[key] = len(frames)
+                frames.append(frame)
+            return index[key]
+
+        def node_frame(label: str) -> int:
+            return frame_for(("node", label), name=label, file="graph node")
+
+        profiles = []
+        if stacks:
+            samples, weights = [], []
+            for (label, codes), (_, seconds) in stacks:
+                samples.append([node_frame(label)] + [
+                    frame_for(code, name=_code_name(code), file=code.co_filename, line=code.co_firstlineno)
+                    for code in codes
+                ])
+                weights.append(seconds)
+            profiles.append({
+                "type": "sampled", "name": f"{self.name} samples", "unit": "seconds",
+                "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+            })
+
+        lanes: List[List[Tuple[str, float, float]]] = []
+        for span in spans:
+            lane = next((lane for lane in lanes if lane[-1][2] <= span[1]), None)
+            if lane is None:
+                lanes.append([span])
+            else:
+                lane.append(span)
+        for number, lane in enumerate(lanes, 1):
+            events = []
+            for label, start, end in lane:
+                events.append({"type": "O", "frame": node_frame(label), "at": start})
+                events.append({"type": "C", "frame": node_frame(label), "at": end})
+            profiles.append({
+                "type": "evented", "name": f"{self.name} nodes" + (f" ({number})" if len(lanes) > 1 else ""),
+                "unit": "seconds", "startValue": 0, "endValue": max(self.duration(), lane[-1][2]), "events": events,
+            })
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": f"{self.name} {self.id}",
+            "exporter": "nutrition-assistant profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+def _code_name(code) -> str:
+    return getattr(code, "co_qualname", code.co_name)
+
+
+class _Sampler:
+    """
+    One background thread that samples every active Profile. It starts
+    with the first profile and exits once none are left, so nothing runs
+    while no request is being profiled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: List[Profile] = []
+        self._thread: Optional[threading.Thread] = None
+        self.interval = 0.005
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.append(profile)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: Profile) -> None:
+        with self._lock:
+            self._profiles.remove(profile)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                if not self._profiles:
+                    self._thread = None
+                    return
+                profiles = list(self._profiles)
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()
+            for profile in profiles:
+                profile._sample(frames, elapsed)
+            del frames
+
+
+_sampler = _Sampler()
+
+
+class RequestProfiler:
+    """
+    Decides which requests are profiled, samples them while their graph
+    runs and writes the result to settings.directory as
+    <id>.speedscope.json (open in https://www.speedscope.app) and
+    <id>.folded (flamegraph.pl / inferno input). Requests that are not
+    profiled cost one header lookup and, with a sample rate, one random().
+    """
+
+    def __init__(self, settings: ProfilingSettings):
+        self.settings = settings
+        self._recent: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def authorized(self, headers) -> bool:
+        """Whether the request may list/download profiles or ask for one (never without PROFILING_ADMIN_TOKEN)"""
+        token = self.settings.admin_token
+        return bool(token) and hmac.compare_digest(headers.get("X-Admin-Token", ""), token)
+
+    def wanted(self, headers) -> bool:
+        """Whether this request should be profiled (X-Profiling header or the sample rate)"""
+        settings = self.settings
+        if settings.header and headers.get("X-Profiling", "").lower() in ("1", "on", "true"):
+            return self.authorized(headers)
+        return settings.sample_rate > 0 and random.random() < settings.sample_rate
+
+    def start(self, name: str) -> Profile:
+        profile = Profile(name)
+        _sampler.interval = self.settings.interval_ms / 1000
+        _sampler.add(profile)
+        return profile
+
+    def finish(self, profile: Profile) -> Dict[str, Any]:
+        """Stops sampling `profile`, writes its files and returns its summary"""
+        _sampler.remove(profile)
+        profile.finish()
+        summary = profile.summary()
+        os.makedirs(self.settings.directory, exist_ok=True)
+        base = os.path.join(self.settings.directory, profile.id)
+        with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+            json.dump(profile.to_speedscope(), f, separators=(",", ":"))
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            f.write(profile.to_folded())
+        summary["files"] = [profile.id + ".speedscope.json", profile.id + ".folded"]
+        with self._lock:
+            self._recent[profile.id] = summary
+        self._prune()
+        metrics.inc("nutrition_profiled_requests_total", endpoint=profile.name)
+        return summary
+
+    def _prune(self) -> None:
+        """Removes all but the newest `keep` profiles"""
+        ids = sorted({name.split(".", 1)[0] for name in self._files()}, reverse=True)
+        for stale in ids[self.settings.keep:]:
+            for suffix in (".speedscope.json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.settings.directory, stale + suffix))
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self._recent.pop(stale, None)
+
+    def _files(self) -> List[str]:
+        try:
+            return [name for name in os.listdir(self.settings.directory) if name.endswith((".speedscope.json", ".folded"))]
+        except FileNotFoundError:
+            return []
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Profiles on disk, newest first, with their summaries if written by this process"""
+        profiles: Dict[str, Dict[str, Any]] = {}
+        for name in self._files():
+            profile_id = name.split(".", 1)[0]
+            entry = profiles.setdefault(profile_id, {"id": profile_id, "files": []})
+            entry["files"].append(name)
+            entry["bytes"] = entry.get("bytes", 0) + os.path.getsize(os.path.join(self.settings.directory, name))
+        with self._lock:
+            for profile_id, entry in profiles.items():
+                if profile_id in self._recent:
+                    entry.update({key: value for key, value in self._recent[profile_id].items() if key != "files"})
+        for entry in profiles.values():
+            entry["files"].sort(reverse=True)
+        return [profiles[profile_id] for profile_id in sorted(profiles, reverse=True)]
+
+
+def with_profile(config: Optional[Dict], profile: Optional[Profile]) -> Optional[Dict]:
+    """Graph config whose nodes report to `profile` (unchanged for None)"""
+    if profile is None:
+        return config
+    config = dict(config or {})
+    config["configurable"] = {**(config.get("configurable") or {}), "profile": profile}
+    return config
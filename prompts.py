@@ -0,0 +1,152 @@
+"""
+Agent prompts, compiled once at import.
+
+Every template starts with a static system message (role, instructions,
+trigger vocabulary, JSON shapes) that is the same object on every call, so
+the prompt prefix is byte-identical across requests and providers that
+cache prompt prefixes can reuse it. Everything that varies per request
+(profile, health data, journal, history) comes after it.
+"""
+from typing import Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from history import SUMMARY_PROMPT, count_tokens
+from triggers import TRIGGERS
+
+TRIGGER_LIST = "\n".join(f"- {trigger}" for trigger in TRIGGERS)
+
+PROFILE_JSON = """{
+    "name": "user name",
+    "diet": "dietary preference",
+    "allergies": ["list", "of", "allergies"],
+    "likes": ["foods they like"],
+    "dislikes": ["foods they dislike"]
+}"""
+
+LOGISTICS_JSON = """{
+    "grocery_items": ["item 1 with quantity", "item 2 with quantity", ...],
+    "prep_time_minutes": 30,
+    "best_prep_day": "Sunday",
+    "best_prep_time": "5:00 PM",
+    "meal_prep_tips": ["tip 1", "tip 2", "tip 3"],
+    "trigger_specific_advice": "advice based on triggers",
+    "storage_instructions": "how to store the meal",
+    "serving_suggestions": "how to serve/portion"
+}"""
+
+MEAL_PLAN_JSON = """{
+    "meal": "specific meal name",
+    "ingredients": ["3-5 key ingredients"],
+    "rationale": "why this meal addresses their current state (glucose/energy/triggers)",
+    "nutritional_benefits": ["benefit 1", "benefit 2"],
+""" + LOGISTICS_JSON[2:]
+
+CANDIDATES_RULE = (
+    'If CANDIDATE MEALS are listed, choose the candidate that best fits their current state, name it exactly '
+    'as listed (start with "**Meal: <name>**") and use its ingredients. Explain why it fits.'
+)
+
+# Per-request user data shared by the nutritionist and meal planner
+USER_CONTEXT = """USER PROFILE:
+- Name: {name}
+- Diet: {diet}
+- Allergies: {allergies}
+- Likes: {likes}
+- Dislikes: {dislikes}
+
+HEALTH DATA:
+- Glucose Trend: {glucose_trend}
+- Energy Level: {energy_level}
+
+DETECTED TRIGGERS: {triggers}
+{candidates}"""
+
+PREFERENCE_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=f"""You are a Preference Learning Agent.
+
+Analyze the latest conversation messages. If the user mentions food likes, dislikes, or dietary restrictions,
+extract and update the profile given after the conversation.
+
+Return ONLY a valid JSON object with this structure:
+{PROFILE_JSON}
+
+Keep existing profile data and only update what's mentioned."""),
+    MessagesPlaceholder("history"),
+    ("system", "Current Profile: {profile}"),
+])
+
+TRIGGER_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=f"""You analyze journal entries for eating triggers.
+
+Identify any of these triggers present:
+{TRIGGER_LIST}
+
+Return ONLY a JSON array of detected triggers, for example: ["Stress", "Low Energy", "Time pressure"]
+If no triggers are found, return an empty array: []
+Be specific and only include triggers that are clearly evident in the journal."""),
+    ("human", 'Journal: "{journal}"'),
+])
+
+NUTRITIONIST_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=f"""You are an expert Nutritionist and Dietitian.
+
+TASK: Create a specific, actionable meal recommendation for the user described next.
+
+Your response should include:
+1. A specific meal name
+2. Key ingredients (3-5 items)
+3. Why this meal addresses their current state (glucose/energy/triggers)
+4. Nutritional benefits
+
+Be specific and practical. Consider their dietary restrictions and preferences.
+Format your response clearly with sections.
+{CANDIDATES_RULE}"""),
+    ("human", USER_CONTEXT),
+])
+
+LOGISTICS_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=f"""You are a meal planning logistics expert. Based on the meal recommendation and triggers, create a detailed action plan.
+
+Create a JSON response with this structure:
+{LOGISTICS_JSON}
+
+Be specific with quantities in grocery items (e.g., "2 chicken breasts", "1 cup spinach").
+Consider the triggers when giving advice."""),
+    ("human", "MEAL RECOMMENDATION:\n{plan}\n\nDETECTED TRIGGERS:\n{triggers}"),
+])
+
+MEAL_PLANNER_PROMPT = ChatPromptTemplate.from_messages([
+    SystemMessage(content=f"""You are an expert Nutritionist and meal planning logistics expert.
+
+TASK: Create a specific, actionable meal recommendation for the user described next, and the plan to prepare it.
+Consider their dietary restrictions and preferences, and the triggers when giving advice.
+{CANDIDATES_RULE}
+
+Return ONLY a JSON object with this structure:
+{MEAL_PLAN_JSON}
+
+Be specific with quantities in grocery items (e.g., "2 chicken breasts", "1 cup spinach")."""),
+    ("human", USER_CONTEXT),
+])
+
+SUMMARY_TEMPLATE = ChatPromptTemplate.from_messages([
+    ("system", SUMMARY_PROMPT),
+    ("human", "{transcript}"),
+])
+
+
+def count_prompt_tokens(prompt) -> Tuple[int, int]:
+    """
+    Approximate (static, variable) tokens of a prompt: the leading system
+    message of a template prompt is its static prefix. Plain string
+    prompts count as all variable.
+    """
+    if isinstance(prompt, str):
+        return 0, count_tokens([SystemMessage(content=prompt)])
+    messages: Sequence[BaseMessage] = prompt
+    if not messages:
+        return 0, 0
+    static = count_tokens(messages[:1]) if isinstance(messages[0], SystemMessage) else 0
+    return static, count_tokens(messages) - static
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "recipes.json")
+
+# Diet tags a recipe may carry. A vegan recipe is also vegetarian and
+# pescatarian, so those are implied rather than repeated in the data.
+DIETS = ("vegan", "vegetarian", "pescatarian", "gluten_free", "dairy_free", "low_carb", "halal")
+IMPLIED_DIETS = {"vegan": ("vegetarian", "pescatarian"), "vegetarian": ("pescatarian",)}
+
+# Free-text diet descriptions -> required tags ("No specific diet" -> none)
+DIET_WORDS = [
+    (r"\bvegan|plant[- ]based", "vegan"),
+    (r"\bvegetarian|veggie", "vegetarian"),
+    (r"\bpesc[ae]tarian", "pescatarian"),
+    (r"gluten|co?eliac", "gluten_free"),
+    (r"dairy[- ]free|lactose", "dairy_free"),
+    (r"\bketo|low[- ]carb", "low_carb"),
+    (r"\bhalal", "halal"),
+]
+DIET_WORDS = [(re.compile(pattern, re.IGNORECASE), tag) for pattern, tag in DIET_WORDS]
+
+# Allergy words -> allergen tags; other allergies are matched against
+# ingredient names
+ALLERGEN_WORDS = [
+    (r"peanut", ("peanut",)),
+    (r"\bnuts?\b", ("peanut", "tree_nut")),
+    (r"tree nut|almond|cashew|walnut|pecan|hazelnut|pistachio", ("tree_nut",)),
+    (r"dairy|milk|lactose|cheese|whey|casein", ("dairy",)),
+    (r"gluten|wheat|co?eliac", ("gluten",)),
+    (r"\beggs?\b", ("egg",)),
+    (r"\bsoy|soya", ("soy",)),
+    (r"shellfish|shrimp|prawn|crab|lobster", ("shellfish",)),
+    (r"\bfish\b|salmon|tuna|cod", ("fish",)),
+    (r"sesame|tahini", ("sesame",)),
+]
+ALLERGEN_WORDS = [(re.compile(pattern, re.IGNORECASE), tags) for pattern, tags in ALLERGEN_WORDS]
+
+# Glucose trends that call for a low glycemic meal, and ones where a
+# medium one is welcome
+RISING_GLUCOSE = re.compile(r"high|spik|ris|elevat", re.IGNORECASE)
+FALLING_GLUCOSE = re.compile(r"low|drop|fall|dip", re.IGNORECASE)
+
+# Per trigger: why a suitable meal helps, and the advice for the logistics block
+TRIGGER_NOTES = {
+    "Stress": ("Protein with slow carbohydrates keeps blood sugar level, which takes the edge off stress-driven cravings.",
+               "Keep a portion ready for high-stress days so the easy option is also a good one."),
+    "Anxiety": ("A calm, regular meal with omega-3 fats and magnesium avoids the glucose swings that can feed anxious feelings.",
+                "Eat at regular times; a planned meal removes one decision on anxious days."),
+    "Boredom": ("Crunch, colour and a little sweetness satisfy the urge for something interesting without a sugar crash.",
+                "When boredom hits, check in with a glass of water and a short walk before reaching for food."),
+    "Social pressure": ("It is easy to share and enjoy with others, so you can join in without abandoning your plan.",
+                        "Bring this dish to shared meals so there is always something that works for you."),
+    "Low Energy": ("Protein and fibre release energy gradually, lifting low energy without the crash that sugary snacks bring.",
+                   "Eat this before the afternoon slump rather than after it."),
+    "Fatigue": ("Iron, B vitamins and steady carbohydrates support a tired body better than caffeine and sugar.",
+                "Prepare it on a rested day so there is nothing to cook when you are exhausted."),
+    "Emotional eating": ("It is satisfying and portioned, so it comforts without tipping into a binge.",
+                         "Pause for a minute before eating and name what you are feeling; then enjoy the portion slowly."),
+    "Sleep deprivation": ("After poor sleep, protein and slow carbohydrates blunt the extra hunger and cravings that tiredness brings.",
+                          "Keep it ready for mornings after a bad night, when cravings are strongest."),
+    "Time pressure": ("It is quick to make or ready in advance, so a busy day does not end in takeaway.",
+                      "Batch-prepare it so a healthy meal takes less time than ordering food."),
+    "Loneliness": ("A warm, homemade meal is nourishing and comforting, and easy to share with someone.",
+                   "Consider cooking it with or for a friend, or calling someone while you eat."),
+    "Celebration/Reward seeking": ("It feels like a treat while staying balanced, so rewarding yourself does not undo your progress.",
+                                   "Plate it nicely and make the meal the reward; non-food rewards work well too."),
+    "Procrastination": ("It is quick and needs little thought, so food does not become another way to put things off.",
+                        "Have it ready before you sit down to work so snacking is not an escape route."),
+    "Depression": ("Omega-3 fats, folate and a warm, regular meal support mood on difficult days.",
+                   "Keep some portions in the freezer for days when cooking feels impossible."),
+    "Anger/Frustration": ("A hearty, filling meal steadies blood sugar, which helps when frustration makes you reach for food.",
+                          "Step away for five minutes before eating; the meal will be there when you have cooled down."),
+    "Comfort seeking": ("It is warm and comforting, giving the feeling you are looking for with far better nutrition.",
+                        "Make a big batch so a comforting bowl is always a few minutes away."),
+}
+GLYCEMIC_NOTES = {
+    "low": "Its low glycemic load releases energy slowly and keeps glucose steady.",
+    "medium": "Its moderate glycemic load gives some quick energy balanced by protein and fibre.",
+    "high": "It provides quick energy, so pair it with protein if glucose tends to spike.",
+}
+
+
+class Recipe(NamedTuple):
+    id: str
+    name: str
+    diets: frozenset
+    allergens: frozenset
+    glycemic: str
+    triggers: frozenset
+    ingredients: Tuple[str, ...]
+    prep_time_minutes: int
+    benefits: Tuple[str, ...]
+    tips: Tuple[str, ...]
+    storage: str
+    serving: str
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Recipe":
+        diets = set(data.get("diets", []))
+        for diet in list(diets):
+            diets.update(IMPLIED_DIETS.get(diet, ()))
+        return cls(
+            id=data["id"],
+            name=data["name"],
+            diets=frozenset(diets),
+            allergens=frozenset(data.get("allergens", [])),
+            glycemic=data.get("glycemic", "medium"),
+            triggers=frozenset(data.get("triggers", [])),
+            ingredients=tuple(data["ingredients"]),
+            prep_time_minutes=int(data.get("prep_time_minutes", 30)),
+            benefits=tuple(data.get("benefits", [])),
+            tips=tuple(data.get("tips", [])),
+            storage=data.get("storage", ""),
+            serving=data.get("serving", ""),
+        )
+
+
+def diet_tags(diet: str) -> List[str]:
+    """Diet tags a free-text diet requires"""
+    return [tag for pattern, tag in DIET_WORDS if pattern.search(diet or "")]
+
+
+def allergen_tags(allergy: str) -> Tuple[List[str], bool]:
+    """(allergen tags, whether the allergy was recognised) for one free-text allergy"""
+    tags = [tag for pattern, found in ALLERGEN_WORDS if pattern.search(allergy) for tag in found]
+    return sorted(set(tags)), bool(tags)
+
+
+class RecipeIndex:
+    """
+    The recipe dataset with a bitmask per diet tag, allergen, glycemic
+    level and trigger (bit i = recipe i), so filtering candidates for a
+    profile is a few integer ANDs. `candidates` ranks what is left by
+    trigger fit, glycemic fit and likes/dislikes; it takes microseconds.
+    """
+
+    def __init__(self, recipes: List[Recipe]):
+        self.recipes = recipes
+        self.by_id = {recipe.id: recipe for recipe in recipes}
+        self.all = (1 << len(recipes)) - 1
+        self.diet_masks: Dict[str, int] = {}
+        self.allergen_masks: Dict[str, int] = {}
+        self.glycemic_masks: Dict[str, int] = {}
+        self.trigger_masks: Dict[str, int] = {}
+        for bit, recipe in enumerate(recipes):
+            for diet in recipe.diets:
+                self.diet_masks[diet] = self.diet_masks.get(diet, 0) | 1 << bit
+            for allergen in recipe.allergens:
+                self.allergen_masks[allergen] = self.allergen_masks.get(allergen, 0) | 1 << bit
+            self.glycemic_masks[recipe.glycemic] = self.glycemic_masks.get(recipe.glycemic, 0) | 1 << bit
+            for trigger in recipe.triggers:
+                self.trigger_masks[trigger] = self.trigger_masks.get(trigger, 0) | 1 << bit
+        self._lowered = [(recipe.name + " " + " ".join(recipe.ingredients)).lower() for recipe in recipes]
+
+    def __len__(self) -> int:
+        return len(self.recipes)
+
+    def allowed(self, profile: Dict) -> int:
+        """Bitmask of recipes that fit the profile's diet and avoid its allergens"""
+        mask = self.all
+        for tag in diet_tags(profile.get("diet", "")):
+            mask &= self.diet_masks.get(tag, 0)
+        for allergy in profile.get("allergies") or []:
+            tags, known = allergen_tags(str(allergy))
+            for tag in tags:
+                mask &= ~self.allergen_masks.get(tag, 0)
+            if not known:
+                # Unrecognised allergies exclude recipes that mention them
+                word = str(allergy).lower().strip().rstrip("s")
+                for bit, text in enumerate(self._lowered):
+                    if word and word in text:
+                        mask &= ~(1 << bit)
+        return mask
+
+    def candidates(self, profile: Dict, health: Dict, triggers: List[str], limit: int = 3) -> List[Recipe]:
+        """The best `limit` recipes for this profile, health data and triggers"""
+        mask = self.allowed(profile or {})
+        glucose = str((health or {}).get("glucose_trend", ""))
+        preferred = "low"
+        if RISING_GLUCOSE.search(glucose):
+            # Only low glycemic meals when glucose is climbing
+            mask &= self.glycemic_masks.get("low", 0)
+        elif FALLING_GLUCOSE.search(glucose):
+            preferred = "medium"
+        if not mask:
+            return []
+
+        trigger_masks = [self.trigger_masks.get(trigger, 0) for trigger in triggers]
+        preferred_mask = self.glycemic_masks.get(preferred, 0)
+        likes = [str(like).lower() for like in (profile or {}).get("likes") or []]
+        dislikes = [str(dislike).lower() for dislike in (profile or {}).get("dislikes") or []]
+        scored = []
+        for bit, recipe in enumerate(self.recipes):
+            if not mask >> bit & 1:
+                continue
+            score = 2 * sum(trigger_mask >> bit & 1 for trigger_mask in trigger_masks) + (preferred_mask >> bit & 1)
+            text = self._lowered[bit]
+            score += sum(1 for like in likes if like and like in text)
+            score -= sum(3 for dislike in dislikes if dislike and dislike in text)
+            scored.append((-score, bit, recipe))
+        scored.sort()
+        return [recipe for _, _, recipe in scored[:limit]]
+
+    def match(self, text: str, candidates: List[Recipe]) -> Optional[Recipe]:
+        """The candidate a model reply chose (the first one it names), if any"""
+        lowered = text.lower()
+        named = [(lowered.find(recipe.name.lower()), recipe) for recipe in candidates]
+        named = [(position, recipe) for position, recipe in named if position >= 0]
+        return min(named, key=lambda item: item[0])[1] if named else None
+
+    def logistics(self, recipe: Recipe, triggers: List[str]) -> Dict:
+        """A logistics object (LOGISTICS_SCHEMA) built from the indexed recipe"""
+        advice = [TRIGGER_NOTES[trigger][1] for trigger in triggers if trigger in TRIGGER_NOTES]
+        quick = recipe.prep_time_minutes <= 15
+        return {
+            "grocery_items": list(recipe.ingredients),
+            "prep_time_minutes": recipe.prep_time_minutes,
+            "best_prep_day": "The day you eat it" if quick else "Sunday",
+            "best_prep_time": "Just before the meal" if quick else "5:00 PM",
+            "meal_prep_tips": list(recipe.tips),
+            "trigger_specific_advice": " ".join(advice[:2]) or "Stay consistent with your meal planning",
+            "storage_instructions": recipe.storage,
+            "serving_suggestions": recipe.serving,
+        }
+
+    def template_plan(self, recipe: Recipe, triggers: List[str]) -> str:
+        """A meal plan written from the recipe alone, without the LLM"""
+        reasons = [TRIGGER_NOTES[trigger][0] for trigger in triggers if trigger in recipe.triggers and trigger in TRIGGER_NOTES]
+        reasons.append(GLYCEMIC_NOTES.get(recipe.glycemic, ""))
+        ingredients = "\n".join(f"- {item}" for item in recipe.ingredients)
+        benefits = "\n".join(f"- {item}" for item in recipe.benefits)
+        return (
+            f"**Meal: {recipe.name}**\n\n"
+            f"**Key ingredients**\n{ingredients}\n\n"
+            f"**Why this meal fits right now**\n{' '.join(reason for reason in reasons if reason)}\n\n"
+            f"**Nutritional benefits**\n{benefits}"
+        )
+
+
+def describe_candidates(candidates: List[Recipe]) -> str:
+    """Candidate list for a prompt that asks the model to choose and explain"""
+    return "\n".join(
+        f"{n}. {recipe.name} (glycemic load: {recipe.glycemic}; suits: {', '.join(sorted(recipe.triggers))}; "
+        f"ingredients: {', '.join(recipe.ingredients)})"
+        for n, recipe in enumerate(candidates, 1)
+    )
+
+
+def load_recipe_index(path: Optional[str] = None) -> RecipeIndex:
+    """The index over a recipe JSON file (data/recipes.json by default)"""
+    with open(path or DEFAULT_PATH) as f:
+        return RecipeIndex([Recipe.from_dict(item) for item in json.load(f)])
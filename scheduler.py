@@ -0,0 +1,340 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
+
+from llm_client import DeadlineExceeded
+from metrics import metrics
+
+# Priority classes, most urgent first: people waiting on a response, then bulk work
+PRIORITIES = ("interactive", "batch")
+
+
+class Overloaded(Exception):
+    """An LLM call turned away at admission; answer 429 and retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class SchedulerSettings(NamedTuple):
+    """Budgets and queue limits for LLM calls (see load_scheduler_settings)"""
+    enabled: bool = True
+    max_concurrency: int = 20
+    tokens_per_minute: float = 0          # 0: no global token budget
+    tenant_tokens_per_minute: float = 0   # 0: no per-tenant quota
+    tenant_quotas: Dict[str, float] = {}  # per-tenant overrides
+    max_queue: Dict[str, int] = {"interactive": 64, "batch": 1024}
+    completion_tokens: float = 300        # completion estimate before any call has been seen
+
+
+def _parse_quotas(value: str) -> Dict[str, float]:
+    """'key-a=20000,key-b=5000' -> {tenant: tokens per minute}"""
+    quotas = {}
+    for item in value.split(","):
+        if "=" in item:
+            tenant, tokens = item.rsplit("=", 1)
+            quotas[tenant.strip()] = float(tokens)
+    return quotas
+
+
+def load_scheduler_settings(env: Mapping[str, str] = os.environ, pool_size: int = 20) -> SchedulerSettings:
+    """
+    Reads LLM_SCHEDULER (on/off), LLM_MAX_CONCURRENCY (default: the HTTP
+    pool size), LLM_TOKENS_PER_MINUTE, LLM_TENANT_TOKENS_PER_MINUTE with
+    per-tenant LLM_TENANT_QUOTAS ("tenant=tokens,..."), and
+    LLM_QUEUE_MAX_INTERACTIVE / LLM_QUEUE_MAX_BATCH.
+    """
+    defaults = SchedulerSettings()
+    return SchedulerSettings(
+        enabled=env.get("LLM_SCHEDULER", "on").lower() in ("on", "true", "1"),
+        max_concurrency=int(env.get("LLM_MAX_CONCURRENCY", pool_size)),
+        tokens_per_minute=float(env.get("LLM_TOKENS_PER_MINUTE", defaults.tokens_per_minute)),
+        tenant_tokens_per_minute=float(env.get("LLM_TENANT_TOKENS_PER_MINUTE", defaults.tenant_tokens_per_minute)),
+        tenant_quotas=_parse_quotas(env.get("LLM_TENANT_QUOTAS", "")),
+        max_queue={
+            "interactive": int(env.get("LLM_QUEUE_MAX_INTERACTIVE", defaults.max_queue["interactive"])),
+            "batch": int(env.get("LLM_QUEUE_MAX_BATCH", defaults.max_queue["batch"])),
+        },
+    )
+
+
+def with_tenant(config: Optional[Dict], tenant: str) -> Optional[Dict]:
+    """Graph config whose LLM calls count against `tenant`'s quota (unchanged for '')"""
+    if not tenant:
+        return config
+    config = dict(config or {})
+    config["configurable"] = {**(config.get("configurable") or {}), "tenant": tenant}
+    return config
+
+
+class TokenBucket:
+    """Tokens-per-minute budget refilled continuously; may go negative when calls use more than estimated"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def seconds_until(self, tokens: float) -> float:
+        """Seconds until `tokens` (capped at capacity) are available"""
+        return max(0.0, min(tokens, self.capacity) - self.tokens) / self.rate
+
+
+class Ticket:
+    """One LLM call waiting for, or holding, a slot"""
+
+    def __init__(self, priority: str, tenant: str, tokens: float):
+        self.priority = priority
+        self.tenant = tenant
+        self.tokens = tokens
+        self.queued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.cancelled = False
+        self.event = threading.Event()
+        self.future: Optional[asyncio.Future] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+class LLMScheduler:
+    """
+    Admission control and priority scheduling for the agents' LLM calls.
+    A call takes a slot out of max_concurrency and its estimated tokens out
+    of the global tokens-per-minute budget before it starts. Calls that
+    have to wait queue by priority class (interactive before batch, FIFO
+    within a class). A call is turned away at once with Overloaded when its
+    tenant (API key or user) is over quota, its class's queue is full, or
+    the estimated wait exceeds the time its request has left, so overload
+    turns into fast 429s instead of everyone slowing down together.
+    """
+
+    def __init__(self, settings: SchedulerSettings):
+        self.settings = settings
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._order = itertools.count()
+        self._waiting = {priority: 0 for priority in PRIORITIES}
+        self._bucket = TokenBucket(settings.tokens_per_minute) if settings.tokens_per_minute else None
+        self._tenants: Dict[str, TokenBucket] = {}
+        # Moving averages of how long a call holds its slot and how many
+        # completion tokens each agent's calls use
+        self._hold_seconds = 1.0
+        self._completion: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, agent: str, prompt_tokens: int) -> float:
+        return prompt_tokens + self._completion.get(agent, self.settings.completion_tokens)
+
+    def _tenant_bucket(self, tenant: str) -> Optional[TokenBucket]:
+        quota = self.settings.tenant_quotas.get(tenant, self.settings.tenant_tokens_per_minute)
+        if not tenant or not quota:
+            return None
+        bucket = self._tenants.get(tenant)
+        if bucket is None:
+            bucket = self._tenants[tenant] = TokenBucket(quota)
+        return bucket
+
+    def _estimated_wait(self, priority: str, tokens: float, now: float) -> float:
+        """Seconds a call of this class arriving now would wait for a slot and its tokens"""
+        rank = PRIORITIES.index(priority)
+        ahead = sum(self._waiting[other] for other in PRIORITIES[:rank + 1])
+        free = self.settings.max_concurrency - self.in_flight
+        slot_wait = 0.0 if ahead < free else (ahead - free + 1) / self.settings.max_concurrency * self._hold_seconds
+        token_wait = 0.0
+        if self._bucket is not None:
+            self._bucket.refill(now)
+            queued = sum(entry[2].tokens for entry in self._queue if not entry[2].cancelled and entry[0] <= rank)
+            token_wait = max(0.0, queued + tokens - self._bucket.tokens) / self._bucket.rate
+        return max(slot_wait, token_wait)
+
+    def _reject(self, ticket: Ticket, reason: str, retry_after: float, message: str) -> Overloaded:
+        metrics.inc("nutrition_llm_admissions_total", priority=ticket.priority, outcome=reason)
+        return Overloaded(message, round(retry_after, 2), reason)
+
+    def _screen(self, ticket: Ticket, timeout: Optional[float]) -> Optional[TokenBucket]:
+        """Raises Overloaded if the call should be turned away now; returns its tenant's bucket"""
+        if ticket.priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {ticket.priority!r} (expected one of {', '.join(PRIORITIES)})")
+        priority, tenant, tokens, now = ticket.priority, ticket.tenant, ticket.tokens, ticket.queued_at
+        tenant_bucket = self._tenant_bucket(tenant)
+        if tenant_bucket is not None:
+            tenant_bucket.refill(now)
+            if tenant_bucket.tokens < min(tokens, tenant_bucket.capacity):
+                raise self._reject(ticket, "quota", tenant_bucket.seconds_until(tokens), f"Token quota exceeded for {tenant}")
+        wait = self._estimated_wait(priority, tokens, now)
+        if wait > 0 and self._waiting[priority] >= self.settings.max_queue[priority]:
+            raise self._reject(ticket, "queue_full", wait, f"Too many queued {priority} LLM calls")
+        if timeout is not None and wait > timeout:
+            raise self._reject(ticket, "wait", wait, f"Estimated wait {wait:.1f}s exceeds the {timeout:.1f}s left for the request")
+        return tenant_bucket
+
+    def check(self, priority: str = "interactive", tenant: str = "", tokens: float = 0, timeout: Optional[float] = None) -> None:
+        """Raises Overloaded if a call like this would be turned away right now; takes no slot or tokens"""
+        with self._lock:
+            self._screen(Ticket(priority, tenant, tokens), timeout)
+
+    def _admit(self, priority: str, tenant: str, tokens: float, timeout: Optional[float]) -> Ticket:
+        """Takes the tenant's tokens and grants or queues the call; raises Overloaded to turn it away"""
+        ticket = Ticket(priority, tenant, tokens)
+        now = ticket.queued_at
+        tenant_bucket = self._screen(ticket, timeout)
+
+        if tenant_bucket is not None:
+            tenant_bucket.tokens -= tokens
+        self._waiting[priority] += 1
+        heapq.heappush(self._queue, (PRIORITIES.index(priority), next(self._order), ticket))
+        self._dispatch(now)
+        return ticket
+
+    def _dispatch(self, now: float) -> None:
+        """Grants queued calls, most urgent first, while slots and tokens last"""
+        if self._bucket is not None:
+            self._bucket.refill(now)
+        while self._queue and self.in_flight < self.settings.max_concurrency:
+            ticket = self._queue[0][2]
+            if ticket.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if self._bucket is not None and self._bucket.tokens < min(ticket.tokens, self._bucket.capacity):
+                break
+            heapq.heappop(self._queue)
+            self._waiting[ticket.priority] -= 1
+            self.in_flight += 1
+            if self._bucket is not None:
+                self._bucket.tokens -= ticket.tokens
+            ticket.granted_at = now
+            metrics.inc("nutrition_llm_admissions_total", priority=ticket.priority, outcome="admitted")
+            metrics.observe("nutrition_llm_queue_wait_seconds", now - ticket.queued_at, priority=ticket.priority)
+            if ticket.future is not None:
+                ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+            ticket.event.set()
+
+    def _poll_seconds(self) -> float:
+        """How long a waiter sleeps before re-checking: until the head of the queue could have its tokens"""
+        if self._bucket is None or not self._queue:
+            return 1.0
+        return max(0.01, min(1.0, self._bucket.seconds_until(self._queue[0][2].tokens)))
+
+    def _abandon(self, ticket: Ticket) -> None:
+        """Drops a ticket its caller stopped waiting for: frees its slot if granted, else leaves the queue"""
+        with self._lock:
+            if ticket.granted_at is not None:
+                self._release(ticket, ticket.tokens)
+            elif not ticket.cancelled:
+                ticket.cancelled = True
+                self._waiting[ticket.priority] -= 1
+                self._refund_tenant(ticket, ticket.tokens)
+
+    def _give_up(self, ticket: Ticket, timeout: float) -> None:
+        """Drops a ticket whose request ran out of time while it waited"""
+        self._abandon(ticket)
+        metrics.inc("nutrition_llm_admissions_total", priority=ticket.priority, outcome="timeout")
+        raise DeadlineExceeded(f"no LLM slot within {timeout:.1f}s")
+
+    def acquire(self, priority: str = "interactive", tenant: str = "", tokens: float = 0, timeout: Optional[float] = None) -> Ticket:
+        """Waits for a slot (up to `timeout` seconds); returns the ticket to release()"""
+        with self._lock:
+            ticket = self._admit(priority, tenant, tokens, timeout)
+        give_up_at = None if timeout is None else ticket.queued_at + timeout
+        try:
+            while not ticket.event.is_set():
+                with self._lock:
+                    poll = self._poll_seconds()
+                left = None if give_up_at is None else give_up_at - time.monotonic()
+                if left is not None and left <= 0:
+                    self._give_up(ticket, timeout)
+                if not ticket.event.wait(poll if left is None else min(poll, left)):
+                    with self._lock:
+                        self._dispatch(time.monotonic())
+        except DeadlineExceeded:
+            raise
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    async def aacquire(self, priority: str = "interactive", tenant: str = "", tokens: float = 0, timeout: Optional[float] = None) -> Ticket:
+        """Async twin of acquire()"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            ticket = self._admit(priority, tenant, tokens, timeout)
+            if ticket.granted_at is None:
+                ticket.loop, ticket.future = loop, loop.create_future()
+        give_up_at = None if timeout is None else ticket.queued_at + timeout
+        try:
+            while ticket.granted_at is None:
+                with self._lock:
+                    poll = self._poll_seconds()
+                left = None if give_up_at is None else give_up_at - time.monotonic()
+                if left is not None and left <= 0:
+                    self._give_up(ticket, timeout)
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket.future), poll if left is None else min(poll, left))
+                except asyncio.TimeoutError:
+                    with self._lock:
+                        self._dispatch(time.monotonic())
+        except DeadlineExceeded:
+            raise
+        except BaseException:
+            # Cancelled (client gone, outer timeout, sibling branch failed):
+            # a queued ticket must not be granted a slot nobody releases
+            self._abandon(ticket)
+            raise
+        return ticket
+
+    def _refund_tenant(self, ticket: Ticket, tokens: float) -> None:
+        bucket = self._tenants.get(ticket.tenant)
+        if bucket is not None:
+            bucket.tokens += tokens
+
+    def _release(self, ticket: Ticket, refund: float) -> None:
+        now = time.monotonic()
+        self.in_flight -= 1
+        self._hold_seconds += 0.2 * ((now - ticket.granted_at) - self._hold_seconds)
+        if self._bucket is not None:
+            self._bucket.tokens += refund
+        self._refund_tenant(ticket, refund)
+        self._dispatch(now)
+
+    def release(self, ticket: Ticket, agent: str = "", used_tokens: Optional[int] = None, completion_tokens: Optional[int] = None) -> None:
+        """Frees the ticket's slot and settles its token estimate against what the call used"""
+        with self._lock:
+            if completion_tokens is not None and agent:
+                previous = self._completion.get(agent, self.settings.completion_tokens)
+                self._completion[agent] = previous + 0.2 * (completion_tokens - previous)
+            self._release(ticket, 0 if used_tokens is None else ticket.tokens - used_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            stats = {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.settings.max_concurrency,
+                "queued": dict(self._waiting),
+                "estimated_wait_s": {
+                    priority: round(self._estimated_wait(priority, self.settings.completion_tokens, now), 2)
+                    for priority in PRIORITIES
+                },
+            }
+            if self._bucket is not None:
+                stats["tokens_available"] = round(self._bucket.tokens)
+            return stats
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def build_scheduler(settings: SchedulerSettings) -> Optional[LLMScheduler]:
+    return LLMScheduler(settings) if settings.enabled else None
@@ -0,0 +1,276 @@
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from metrics import metrics
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+# Filler words that say nothing about how the writer feels or eats
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "so", "i", "i'm", "im", "me", "my", "just", "to", "at", "of", "it",
+    "is", "was", "be", "been", "have", "has", "had", "with", "today", "really", "very", "am", "are",
+    "that", "this", "in", "on", "for",
+}
+# Words after one of these are marked as negated ("not stressed" must not
+# look like "stressed")
+NEGATORS = {"not", "no", "never", "don't", "didn't", "isn't", "wasn't", "can't", "cannot", "couldn't", "without", "barely"}
+NEGATION_SCOPE = 3
+
+
+class HashedNgramEmbedder:
+    """
+    Local, model-free text vectors: word unigrams and bigrams plus character
+    trigrams of each word, hashed into `dim` signed buckets and L2
+    normalised, so cosine similarity is a dot product. Stopwords are
+    dropped and negated words marked, so rewordings ("stressed at work,
+    tired, want pizza" / "so stressed at work and tired, I want pizza")
+    land close together while "not stressed" does not.
+    """
+
+    def __init__(self, dim: int = 2048):
+        self.dim = dim
+
+    def tokens(self, text: str) -> List[str]:
+        tokens, negated = [], 0
+        for word in _WORD.findall(text.lower()):
+            if word in NEGATORS:
+                tokens.append(word)
+                negated = NEGATION_SCOPE
+            elif word not in STOPWORDS:
+                tokens.append(f"not_{word}" if negated else word)
+                negated = max(0, negated - 1)
+        return tokens
+
+    def features(self, text: str) -> List[Tuple[str, float]]:
+        words = self.tokens(text)
+        features = [(f"w:{word}", 1.0) for word in words]
+        features += [(f"b:{a} {b}", 1.0) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        features = self.features(text)
+        if not features:
+            return vector
+        hashes = np.fromiter((zlib.crc32(name.encode("utf-8")) for name, _ in features), dtype=np.uint32, count=len(features))
+        weights = np.fromiter((weight for _, weight in features), dtype=np.float32, count=len(features))
+        # The top hash bit picks the sign, so collisions cancel out on average
+        signs = np.where(hashes >> 31, -1.0, 1.0).astype(np.float32)
+        np.add.at(vector, hashes % self.dim, signs * weights)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def context_key(profile: Dict, health: Dict, namespace: str = "") -> str:
+    """
+    Exact-match part of a cache key: journals are only compared with
+    journals sent with the same profile and health data (and namespace,
+    e.g. plan mode and model), since the stored plan was written for them
+    """
+    payload = json.dumps({"ns": namespace, "profile": profile or {}, "health": health or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class VectorIndex:
+    """
+    Brute-force cosine index over unit vectors in one NumPy matrix, with a
+    context key (hex) per row, LRU eviction at max_entries and a per-entry
+    TTL (ttl_seconds=0 disables expiry). A lookup is one matrix-vector
+    product plus a context mask, about a millisecond for 2048 rows.
+    """
+
+    def __init__(self, dim: int, max_entries: int = 2048, ttl_seconds: float = 86400):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._vectors = np.zeros((min(64, max_entries), dim), dtype=np.float32)
+        self._contexts: List[str] = []
+        self._payloads: List[Dict] = []
+        self._context_ids = np.zeros(len(self._vectors), dtype=np.uint64)
+        self._created = np.zeros(len(self._vectors))
+        self._last_used = np.zeros(len(self._vectors))
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def _grow(self) -> None:
+        size = min(self.max_entries, len(self._vectors) * 2)
+        self._vectors = np.resize(self._vectors, (size, self.dim))
+        self._context_ids = np.resize(self._context_ids, size)
+        self._created = np.resize(self._created, size)
+        self._last_used = np.resize(self._last_used, size)
+
+    def _scores(self, vector: np.ndarray, context: str, now: float) -> np.ndarray:
+        count = len(self._payloads)
+        scores = self._vectors[:count] @ vector
+        mask = self._context_ids[:count] == np.uint64(int(context, 16))
+        if self.ttl_seconds:
+            mask &= self._created[:count] > now - self.ttl_seconds
+        return np.where(mask, scores, -1.0)
+
+    def match(self, vector: np.ndarray, context: str, threshold: float, now: Optional[float] = None) -> Tuple[float, Optional[Dict]]:
+        """
+        (best similarity, payload of that row if it reaches `threshold`).
+        Search and fetch share one lock, so a concurrent add() cannot evict
+        the row in between and hand back another context's payload.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            if not self._payloads:
+                return -1.0, None
+            scores = self._scores(vector, context, now)
+            row = int(np.argmax(scores))
+            similarity = float(scores[row])
+            if similarity <= -1.0 or similarity < threshold:
+                return similarity, None
+            self._last_used[row] = now
+            return similarity, self._payloads[row]
+
+    def add(self, vector: np.ndarray, context: str, payload: Dict, now: Optional[float] = None) -> int:
+        """Stores a row (evicting the least recently used one when full); returns its index"""
+        now = time.time() if now is None else now
+        with self._lock:
+            count = len(self._payloads)
+            if count and float(self._scores(vector, context, now).max()) > 0.999:
+                # Same journal and context again: refresh the stored answer
+                row = int(np.argmax(self._scores(vector, context, now)))
+            elif count < self.max_entries:
+                if count == len(self._vectors):
+                    self._grow()
+                row = count
+                self._contexts.append(context)
+                self._payloads.append(payload)
+            else:
+                row = int(np.argmin(self._last_used[:count]))
+                self.evictions += 1
+                metrics.inc("nutrition_semantic_cache_evictions_total")
+            self._vectors[row] = vector
+            self._contexts[row] = context
+            self._context_ids[row] = int(context, 16)
+            self._payloads[row] = payload
+            self._created[row] = now
+            self._last_used[row] = now
+            return row
+
+    def save(self, path: str) -> None:
+        """Writes the index to an .npz file (atomically, via a temporary file)"""
+        with self._lock:
+            count = len(self._payloads)
+            arrays = {
+                "vectors": self._vectors[:count],
+                "created": self._created[:count],
+                "last_used": self._last_used[:count],
+                "contexts": np.array(self._contexts, dtype=str),
+                "payloads": np.array([json.dumps(payload) for payload in self._payloads], dtype=str),
+            }
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    def load(self, path: str) -> None:
+        """Restores rows saved by save(); files from another dimension are ignored"""
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+                return
+            # Most recently used rows last, keeping at most max_entries
+            keep = np.argsort(data["last_used"], kind="stable")[-self.max_entries:]
+            rows = [
+                (vectors[i], str(data["contexts"][i]), json.loads(str(data["payloads"][i])), data["created"][i], data["last_used"][i])
+                for i in keep
+            ]
+        for vector, context, payload, created, last_used in rows:
+            row = self.add(vector, context, payload, now=created)
+            self._last_used[row] = last_used
+
+
+class SemanticCache:
+    """
+    Near-duplicate journal cache: reuses the triggers and plan of an earlier
+    journal whose vector is at least `threshold` cosine-similar and that
+    was sent with the same profile and health data. With a path, the index
+    is loaded at start and saved every `save_every` new entries and at exit.
+    """
+
+    def __init__(self, embedder: HashedNgramEmbedder, index: VectorIndex, threshold: float = 0.85,
+                 path: Optional[str] = None, save_every: int = 20):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.path = path
+        self.save_every = save_every
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+        self._stats_lock = threading.Lock()
+        if path:
+            if os.path.exists(path):
+                index.load(path)
+            atexit.register(self.save)
+
+    def lookup(self, journal: str, context: str) -> Tuple[Optional[Dict], float]:
+        """(stored payload or None, best similarity)"""
+        similarity, payload = self.index.match(self.embedder.embed(journal), context, self.threshold)
+        hit = payload is not None
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.inc("nutrition_semantic_cache_lookups_total", outcome="hit" if hit else "miss")
+        return payload, similarity
+
+    def store(self, journal: str, context: str, payload: Dict) -> None:
+        self.index.add(self.embedder.embed(journal), context, payload)
+        with self._stats_lock:
+            self._unsaved += 1
+            due = self.path and self._unsaved >= self.save_every
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        if self.path:
+            self.index.save(self.path)
+            with self._stats_lock:
+                self._unsaved = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.index),
+            "evictions": self.index.evictions,
+            "threshold": self.threshold,
+        }
+
+
+def build_semantic_cache(mode: str, threshold: float = 0.85, max_entries: int = 2048, ttl_seconds: float = 86400,
+                         path: str = ".semantic_cache.npz", dim: int = 2048) -> Optional[SemanticCache]:
+    """
+    Builds the cache for a mode string:
+    "off" -> no cache, "memory" -> in-process index, "file" -> index persisted to `path`.
+    """
+    mode = (mode or "off").lower()
+    if mode == "off":
+        return None
+    if mode not in ("memory", "file"):
+        raise ValueError(f"Unknown semantic cache mode: {mode!r} (expected off, memory or file)")
+    index = VectorIndex(dim, max_entries=max_entries, ttl_seconds=ttl_seconds)
+    return SemanticCache(HashedNgramEmbedder(dim), index, threshold=threshold, path=path if mode == "file" else None)
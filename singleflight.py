@@ -0,0 +1,103 @@
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+def request_key(*parts: Any) -> str:
+    """Canonical hash of JSON-like request parts (key order and whitespace do not matter)"""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException = None
+
+
+class _LeaderCancelled(Exception):
+    """Ends an async call whose leader was cancelled; its waiters run the work again"""
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight calls: the first caller for a key runs
+    the work, callers arriving with the same key before it finishes wait
+    and get the same result (or exception). Nothing is kept afterwards;
+    this is not a cache.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._async_calls: Dict[Tuple[int, str], "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls) + len(self._async_calls)
+
+    def do(self, key: str, work: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Runs work() or joins the identical call in flight; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = work()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def ado(self, key: str, work: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Async twin of do(); calls coalesce with others on the same event loop.
+        When the leader is cancelled (e.g. its client went away) the waiters
+        do not share that: one of them runs the work again.
+        """
+        slot = (id(asyncio.get_running_loop()), key)
+        while True:
+            with self._lock:
+                future = self._async_calls.get(slot)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[slot] = asyncio.get_running_loop().create_future()
+            if leader:
+                break
+            try:
+                # shield: a waiter that is cancelled must not cancel the leader's result
+                return await asyncio.shield(future), True
+            except _LeaderCancelled:
+                continue
+
+        try:
+            result = await work()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieved here so an unshared failure is not logged as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._async_calls[slot]
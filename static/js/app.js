@@ -1,5 +1,15 @@
-// API endpoint
-const API_URL = 'http://localhost:5000/api/analyze';
+// API endpoint (Server-Sent Events variant of /api/analyze)
+const STREAM_URL = 'http://localhost:5000/api/analyze/stream';
+
+// Stable per-browser id so the server can keep this user's profile between visits
+function getUserId() {
+    let userId = localStorage.getItem('userId');
+    if (!userId) {
+        userId = (crypto.randomUUID && crypto.randomUUID()) || `user-${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        localStorage.setItem('userId', userId);
+    }
+    return userId;
+}
 
 // DOM elements
 const journalForm = document.getElementById('journalForm');
@@ -63,17 +73,65 @@ function updateAgentStep(agent, status) {
     }
 }
 
+// Graph node -> progress steps shown in the UI
+const NODE_STEPS = {
+    history_agent: ['router'],
+    safety_agent: ['router'],
+    semantic_cache_lookup: ['router'],
+    preference_agent: ['detective'],
+    trigger_detective: ['detective'],
+    speculative_plan: ['nutritionist'],
+    nutritionist_agent: ['nutritionist'],
+    logistics_agent: ['logistics'],
+    meal_planner_agent: ['nutritionist', 'logistics']
+};
+
+// Nodes currently running per step (parallel mode runs two extraction nodes)
+let runningNodes = {};
+
+/**
+ * Mark a graph node as started/finished on its progress step
+ */
+function trackNode(node, status) {
+    (NODE_STEPS[node] || []).forEach(agent => {
+        runningNodes[agent] = (runningNodes[agent] || 0) + (status === 'active' ? 1 : -1);
+        updateAgentStep(agent, runningNodes[agent] > 0 ? 'active' : 'complete');
+    });
+}
+
+/**
+ * Show results alongside the progress card while the stream is running
+ */
+function revealResults() {
+    resultsSection.style.display = 'block';
+}
+
 /**
- * Simulate agent progress (for better UX)
+ * Read a Server-Sent Events response body and dispatch each event
  */
-async function simulateAgentProgress() {
-    const agents = ['router', 'detective', 'nutritionist', 'logistics'];
-
-    for (const agent of agents) {
-        updateAgentStep(agent, 'active');
-        // Wait a bit for visual effect
-        await new Promise(resolve => setTimeout(resolve, agent === 'router' ? 500 : 800));
-        updateAgentStep(agent, 'complete');
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) > -1) {
+            const raw = buffer.substring(0, boundary);
+            buffer = buffer.substring(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            raw.split('\n').forEach(line => {
+                if (line.startsWith('event: ')) event = line.substring(7);
+                else if (line.startsWith('data: ')) data += line.substring(6);
+            });
+            onEvent(event, data ? JSON.parse(data) : null);
+        }
     }
 }
 
@@ -336,6 +394,11 @@ function displayError(error) {
 async function handleSubmit(e) {
     e.preventDefault();
 
+    // Ignore a second submit while an analysis is running
+    if (analyzeBtn.disabled) {
+        return;
+    }
+
     // Validate input
     const journal = journalEntry.value.trim();
     if (!journal) {
@@ -354,23 +417,26 @@ async function handleSubmit(e) {
     Object.keys(agentSteps).forEach(agent => {
         updateAgentStep(agent, 'pending');
     });
+    runningNodes = {};
 
-    try {
-        // Start progress animation
-        const progressPromise = simulateAgentProgress();
+    // Reset result cards for progressive rendering
+    triggersContent.innerHTML = '<p>Detecting triggers...</p>';
+    recommendationContent.innerHTML = '<p>Waiting for the nutritionist...</p>';
+    logisticsContent.innerHTML = '<p>Waiting for the logistics planner...</p>';
 
-        // Make API request
-        const response = await fetch(API_URL, {
+    try {
+        // Stream the analysis: agent progress, plan tokens, then the final result
+        const response = await fetch(STREAM_URL, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
                 journal_entry: journal,
+                user_id: getUserId(),
+                // Only the field the form owns; the rest of the stored profile is kept
                 user_profile: {
-                    name: 'User',
-                    diet: dietPreference.value,
-                    allergies: []
+                    diet: dietPreference.value
                 },
                 health_data: {
                     glucose_trend: 'Normal',
@@ -379,20 +445,44 @@ async function handleSubmit(e) {
             })
         });
 
-        // Wait for progress animation to complete
-        await progressPromise;
-
         if (!response.ok) {
             throw new Error(`Server error: ${response.status}`);
         }
 
-        const data = await response.json();
+        let streamedPlan = '';
+        let data = null;
+
+        await readEventStream(response, (event, payload) => {
+            if (event === 'node_start') {
+                trackNode(payload.node, 'active');
+            } else if (event === 'node_end') {
+                trackNode(payload.node, 'complete');
+                if (payload.update.detected_triggers) {
+                    displayTriggers(payload.update.detected_triggers);
+                    revealResults();
+                }
+                // The validated plan replaces whatever was streamed
+                if (payload.update.final_plan) {
+                    displayRecommendation(payload.update.final_plan);
+                }
+            } else if (event === 'token') {
+                streamedPlan += payload.text;
+                displayRecommendation(streamedPlan);
+                revealResults();
+            } else if (event === 'tokens_withheld') {
+                recommendationContent.innerHTML = '<p>Finalising your recommendation...</p>';
+            } else if (event === 'result') {
+                data = payload;
+            } else if (event === 'error') {
+                throw new Error(payload.error || 'Analysis failed');
+            }
+        });
 
-        if (!data.success) {
-            throw new Error(data.error || 'Analysis failed');
+        if (!data || !data.success) {
+            throw new Error((data && data.error) || 'Analysis failed');
         }
 
-        // Display results
+        // Display final results
         displayTriggers(data.results.detected_triggers);
         displayRecommendation(data.results.final_plan);
         displayLogistics(data.results.complete_response);
@@ -437,4 +527,4 @@ document.documentElement.style.scrollBehavior = 'smooth';
 
 // Log ready state
 console.log('✅ NutriMind Frontend Ready');
-console.log('📡 API Endpoint:', API_URL);
+console.log('📡 API Endpoint:', STREAM_URL);
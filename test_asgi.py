@@ -0,0 +1,81 @@
+"""
+Checks for the async graph and the ASGI entry point (api/asgi.py), run on
+the fake LLM.
+
+Run with:  python -m pytest test_asgi.py
+"""
+import asyncio
+import json
+
+import pytest
+
+import main
+from api.asgi import app
+from app import build_initial_state, flask_app
+from fake_llm import FakeChatModel, build_fake_llm
+from model_registry import ModelRegistry
+
+BODY = {"journal_entry": "Feeling stressed at work, skipped lunch and now I want candy"}
+
+
+@pytest.fixture(autouse=True)
+def fake_models(monkeypatch):
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+
+
+def request(method: str, path: str, chunks=(b"",)) -> tuple:
+    """Runs one request through the ASGI app; returns (status, headers, body bytes)"""
+    pending = list(chunks)
+    sent = []
+
+    async def receive():
+        chunk = pending.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(pending)}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": [(b"content-type", b"application/json")],
+             "root_path": "", "scheme": "http", "server": ("test", 80), "http_version": "1.1"}
+    asyncio.run(app(scope, receive, send))
+    start = next(message for message in sent if message["type"] == "http.response.start")
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), body
+
+
+class AsyncOnly(FakeChatModel):
+    def _generate(self, *args, **kwargs):
+        raise AssertionError("the async graph made a blocking LLM call")
+
+
+def test_async_graph_awaits_every_llm_call(monkeypatch):
+    fake = AsyncOnly(model_name="fake", ttft_ms=1, cache=False)
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: fake))
+    result = asyncio.run(main.async_app.ainvoke(build_initial_state(BODY)))
+    assert result["safety_flag"] == "safe" and result["detected_triggers"]
+    assert result["final_plan"].startswith("**Meal:") and "LOGISTICS PLAN" in result["messages"][-1].content
+    assert {"nutritionist_agent", "logistics_agent"} <= set(result["timings"])
+
+
+def test_analyze_matches_the_flask_route():
+    # The body may arrive in several chunks
+    encoded = json.dumps(BODY).encode()
+    status, headers, body = request("POST", "/api/analyze", [encoded[:10], encoded[10:]])
+    assert status == 200 and headers[b"content-type"] == b"application/json" and headers[b"access-control-allow-origin"] == b"*"
+    response = json.loads(body)
+    expected = flask_app.test_client().post("/api/analyze", json=BODY).get_json()
+    assert response["success"] and response["results"]["final_plan"] == expected["results"]["final_plan"]
+    assert response["results"]["detected_triggers"] == expected["results"]["detected_triggers"]
+    assert set(response["timings"]["nodes_ms"]) == set(expected["timings"]["nodes_ms"])
+
+
+@pytest.mark.parametrize("path", ["/api/analyze", "/api/analyze/stream"])
+@pytest.mark.parametrize("chunks", [[b"{not json"], [b""], [b'{"user_profile": {}}']], ids=["bad_json", "empty", "no_journal"])
+def test_bad_bodies_answer_400(path, chunks):
+    status, _, body = request("POST", path, chunks)
+    assert status == 400 and json.loads(body) == {"error": "Missing journal_entry in request body"}
+
+
+def test_other_routes_fall_through_to_flask():
+    status, _, body = request("GET", "/api/health")
+    assert status == 200 and json.loads(body) == flask_app.test_client().get("/api/health").get_json()
@@ -0,0 +1,94 @@
+"""
+Checks for the batch runner's shared rate-limit backoff.
+
+Run with:  python -m pytest test_batch.py
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from batch import SharedBackoff, is_rate_limit
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_rate_limit_detection():
+    assert is_rate_limit(RateLimited())
+    assert not is_rate_limit(ValueError("bad JSON"))
+
+
+def test_retries_rate_limits_then_returns():
+    backoff = SharedBackoff(max_retries=3, base_delay=0.01)
+    failures = [RateLimited(), RateLimited()]
+
+    def call():
+        if failures:
+            raise failures.pop()
+        return "ok"
+
+    assert backoff.call(call) == "ok"
+    assert backoff.rate_limited == 2
+
+
+def test_other_errors_and_exhausted_retries_propagate():
+    backoff = SharedBackoff(max_retries=1, base_delay=0.01)
+    with pytest.raises(ValueError):
+        backoff.call(lambda: (_ for _ in ()).throw(ValueError("boom")))
+    with pytest.raises(RateLimited):
+        backoff.call(lambda: (_ for _ in ()).throw(RateLimited()))
+    assert backoff.rate_limited == 1
+
+
+def test_one_rate_limit_pauses_every_caller():
+    backoff = SharedBackoff(base_delay=0.3)
+    started = []
+
+    def other_call():
+        time.sleep(0.05)
+        backoff.call(lambda: started.append(time.monotonic()))
+
+    first_attempt = [True]
+
+    def limited_call():
+        if first_attempt:
+            first_attempt.pop()
+            raise RateLimited()
+
+    thread = threading.Thread(target=other_call)
+    begin = time.monotonic()
+    thread.start()
+    backoff.call(limited_call)
+    thread.join()
+    # The other caller waited out the window opened by the rate-limited one
+    assert started[0] - begin >= 0.25
+
+
+def test_async_calls_share_the_window():
+    backoff = SharedBackoff(base_delay=0.2)
+    finished = {}
+
+    async def call(name, fail):
+        if fail:
+            fail.pop()
+            raise RateLimited()
+        finished[name] = time.monotonic()
+        return name
+
+    async def later(name):
+        await asyncio.sleep(0.05)
+        return await backoff.acall(lambda: call(name, []))
+
+    async def run():
+        begin = time.monotonic()
+        first_fails = [True]
+        results = await asyncio.gather(backoff.acall(lambda: call("a", first_fails)), later("b"))
+        return results, begin
+
+    results, begin = asyncio.run(run())
+    assert results == ["a", "b"]
+    assert backoff.rate_limited == 1
+    assert finished["b"] - begin >= 0.15
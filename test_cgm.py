@@ -0,0 +1,125 @@
+"""
+Checks and a benchmark for the CGM summaries (cgm.py).
+
+Run with:  python -m pytest test_cgm.py -s
+           python -m pytest test_cgm.py --benchmark-only   (requires pytest-benchmark)
+The benchmark summarises four weeks of readings every ~2.4 s, a million points.
+"""
+import io
+import time
+
+import numpy as np
+
+import cgm
+
+DAY = 86400
+START = 1714550400  # 2024-05-01T08:00:00
+
+
+def meal_day_series(days: int = 2, step: int = 300):
+    """Glucose at 100 mg/dL with three one-hour meal spikes to 200 each day"""
+    times = START + np.arange(0, days * DAY, step, dtype=np.float64)
+    glucose = np.full(times.size, 100.0)
+    hour_of_day = (times - START) % DAY / 3600
+    for meal in (1, 5, 11):
+        glucose[(hour_of_day >= meal) & (hour_of_day < meal + 1)] = 200.0
+    return cgm.Readings(times, glucose)
+
+
+def million_points():
+    rng = np.random.default_rng(7)
+    times = START + np.linspace(0, 28 * DAY, 1_000_000)
+    glucose = 115 + 35 * np.sin(times / DAY * 2 * np.pi * 3) + rng.normal(0, 6, times.size)
+    return cgm.Readings(times, glucose)
+
+
+def test_time_in_range_spikes_and_label():
+    summary = cgm.summarise(meal_day_series())
+    assert summary["readings"] == 576 and summary["days"] == 2.0
+    # 3 of 24 hours a day above range
+    assert summary["time_above_pct"] == 12.5 and summary["time_in_range_pct"] == 87.5
+    assert summary["spikes"] == summary["high_episodes"] == 6 and summary["low_episodes"] == 0
+    assert summary["trend_mg_dl_per_hour"] == 0
+    assert cgm.trend_label(summary) == "Spiking"
+
+
+def test_recent_slope_sets_the_trend():
+    times, glucose = meal_day_series(days=1)
+    ramp = times > times[-1] - 3600
+    glucose[ramp] = 100 + (times[ramp] - times[ramp][0]) / 3600 * 60
+    summary = cgm.summarise(cgm.Readings(times, glucose))
+    assert 55 < summary["trend_mg_dl_per_hour"] < 65
+    health = cgm.to_health_data(summary, {"energy_level": "Low"})
+    assert health["glucose_trend"] == "Rising" and health["energy_level"] == "Low"
+    assert f"{summary['trend_mg_dl_per_hour']:+.0f} mg/dL/h" in health["glucose_summary"]
+
+
+def test_csv_and_json_exports_read_alike():
+    export = io.StringIO(
+        "Index,Timestamp (YYYY-MM-DDThh:mm:ss),Event Type,Glucose Value (mmol/L)\n"
+        "1,2024-05-01T08:10:00,EGV,6.0\n"
+        "2,,Calibration,\n"
+        "3,2024-05-01T08:00:00Z,EGV,5.5\n"
+        "4,2024-05-01T08:05:00,EGV,Low\n"
+        "5,2024-05-01T08:15:00+02:00,EGV,6.5\n"
+    )
+    from_csv = cgm.readings_from_csv(export)
+    assert from_csv.glucose.tolist() == [99.0, 108.0, 117.0]
+    assert np.diff(from_csv.times).tolist() == [600, 300]
+
+    entries = [{"date": 1714550400000 + 300000 * i, "sgv": value} for i, value in enumerate([99, 108, 117])]
+    from_json = cgm.readings_from_json(entries)
+    assert from_json.glucose.tolist() == [99.0, 108.0, 117.0]
+    assert cgm.readings_from_json([[1714550400, 99], [1714550700, 108]]).times.tolist() == [1714550400, 1714550700]
+
+
+def test_summary_endpoint_and_analyze_readings():
+    from app import build_initial_state, flask_app
+
+    times, glucose = meal_day_series(days=1)
+    body = "timestamp,glucose\n" + "\n".join(f"{t:.0f},{g:.0f}" for t, g in zip(times, glucose))
+    response = flask_app.test_client().post("/api/glucose/summary?energy_level=Low", data=body, content_type="text/csv")
+    payload = response.get_json()
+    assert response.status_code == 200 and payload["summary"]["spikes"] == 3
+    assert payload["health_data"]["energy_level"] == "Low"
+
+    bad = flask_app.test_client().post("/api/glucose/summary", json={"timestamps": [1], "glucose": [100]})
+    assert bad.status_code == 400
+
+    readings = {"timestamps": times.tolist(), "glucose": glucose.tolist()}
+    state = build_initial_state({"journal_entry": "tired", "glucose_readings": readings, "health_data": {"energy_level": "Low"}})
+    assert state["health_data"]["glucose_trend"] == "Spiking"
+    assert state["health_data"]["glucose_summary"].startswith("latest 100 mg/dL")
+
+
+def test_repeated_and_unreadable_timestamps():
+    readings = cgm.readings_from_json([[START + 300, 120], [START, 100], [START, 110], [None, 90], ["not a time", 95]])
+    assert readings.times.tolist() == [START, START + 300] and readings.glucose.tolist() == [105.0, 120.0]
+    assert cgm.summarise(readings)["readings"] == 2
+
+    # All readings at one instant: nothing to summarise, and a 400 rather than a crash
+    from app import flask_app
+    client = flask_app.test_client()
+    same_instant = [[1700000000, 100], [1700000000, 120]]
+    response = client.post("/api/glucose/summary", json=same_instant)
+    assert response.status_code == 400 and "at least two" in response.get_json()["error"]
+    response = client.post("/api/analyze", json={"journal_entry": "tired", "glucose_readings": same_instant})
+    assert response.status_code == 400 and "glucose" in response.get_json()["error"]
+    response = client.post("/api/analyze/stream", json={"journal_entry": "tired", "glucose_readings": "garbage"})
+    assert response.status_code == 400
+
+
+def test_million_points_summarise_fast():
+    readings = million_points()
+    started = time.perf_counter()
+    summary = cgm.summarise(readings)
+    elapsed = time.perf_counter() - started
+    print(f"\nSummarised {summary['readings']} readings over {summary['days']} days in {elapsed * 1000:.0f} ms")
+    assert summary["days"] == 28.0 and summary["spikes_per_day"] > 1
+    assert elapsed < 2
+
+
+def test_bench_summarise_million(benchmark):
+    readings = million_points()
+    summary = benchmark(cgm.summarise, readings)
+    assert summary["readings"] == 1_000_000
@@ -0,0 +1,68 @@
+"""
+Cold-start check for the serverless entry point: a fresh interpreter that
+imports api/index.py and answers /api/health must not load the agent
+workflow (main, LangChain, LangGraph, the Groq client) or NumPy.
+
+Run with:  python -m pytest test_cold_start.py -s
+COLD_START_BUDGET_MS (default 800) bounds the entry point's import time as
+reported by `python -X importtime`.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+
+BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "800"))
+HEAVY_MODULES = ("main", "langchain_core", "langchain_groq", "langgraph", "groq", "numpy")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# "import time:  self [us] | cumulative | <two spaces per nesting level>module"
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+HEALTH = """
+import api.index, json, sys
+response = api.index.app.test_client().get("/api/health")
+assert response.status_code == 200, response.status_code
+print(json.dumps(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def _run(*args):
+    env = dict(os.environ, GROQ_API_KEY=os.getenv("GROQ_API_KEY") or "cold-start-probe")
+    return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+
+def import_times(module: str):
+    """(module, nesting depth, self us, cumulative us) for each import `import module` runs, in -X importtime order"""
+    rows = []
+    for line in _run("-X", "importtime", "-c", f"import {module}").stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            rows.append((name, (len(indent) - 1) // 2, int(own), int(cumulative)))
+    return rows
+
+
+def test_import_chain_skips_heavy_modules():
+    rows = import_times("api.index")
+    assert rows and rows[-1][0] == "api.index"
+    loaded = {name.split(".")[0] for name, _, _, _ in rows}
+    assert not set(HEAVY_MODULES) & loaded
+
+
+def test_health_does_not_load_the_workflow():
+    modules = json.loads(_run("-c", HEALTH).stdout.strip().splitlines()[-1])
+    assert not set(HEAVY_MODULES) & set(modules)
+
+
+def test_cold_start_within_budget():
+    def total_ms(rows):
+        return sum(cumulative for _, depth, _, cumulative in rows if depth == 0) / 1000
+
+    lazy = min((import_times("api.index") for _ in range(3)), key=total_ms)
+    eager = import_times("main")
+    slowest = sorted(lazy, key=lambda row: row[2], reverse=True)[:5]
+    print(f"\nimport time of api.index: {total_ms(lazy):.0f} ms lazy, {total_ms(eager):.0f} ms for the workflow (main)")
+    print("slowest (self): " + ", ".join(f"{name} {own / 1000:.0f} ms" for name, _, own, _ in slowest))
+    assert total_ms(lazy) < BUDGET_MS
@@ -0,0 +1,100 @@
+"""
+Checks for the fake LLM and the offline load-test harness.
+
+Run with:  python -m pytest test_fake_llm.py
+"""
+import json
+import threading
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+from fake_llm import FakeChatModel, build_fake_llm, canned_reply
+from loadtest import format_report, run_load
+from model_registry import ModelRegistry
+
+
+def fake_models(ttft_ms: float = 20):
+    return ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=ttft_ms, tokens_per_second=50000, cache=False))
+
+
+def test_same_prompt_same_reply_and_latency():
+    llm = build_fake_llm("m", ttft_ms=300, cache=False)
+    messages = [HumanMessage(content='Identify eating triggers. Journal: "so stressed, want pizza"')]
+    assert llm.plan(messages) == llm.plan(messages)
+    assert json.loads(canned_reply(messages[0].content)[1]) == ["Stress"]
+
+    timings = [build_fake_llm("m", ttft_ms=300, seed=seed, cache=False).plan(messages)[4] for seed in range(200)]
+    assert 0.2 < sorted(timings)[100] < 0.4 and max(timings) > min(timings)
+
+
+def test_workflow_runs_on_the_fake(monkeypatch):
+    import main
+    from app import flask_app
+
+    monkeypatch.setattr(main, "models", fake_models())
+    response = flask_app.test_client().post("/api/analyze", json={"journal_entry": "Exhausted and stressed, want chips"})
+    results = response.get_json()["results"]
+    assert response.status_code == 200
+    assert results["final_plan"] and "2 chicken breasts" in results["complete_response"]
+
+
+class Overlap:
+    """Counts fake LLM calls in progress at once, across threads and tasks"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = self.peak = self.calls = 0
+
+    def enter(self):
+        with self.lock:
+            self.current += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.current)
+
+    def leave(self):
+        with self.lock:
+            self.current -= 1
+
+
+overlap = Overlap()
+
+
+class TrackedFake(FakeChatModel):
+    def _generate(self, *args, **kwargs):
+        overlap.enter()
+        try:
+            return super()._generate(*args, **kwargs)
+        finally:
+            overlap.leave()
+
+    async def _agenerate(self, *args, **kwargs):
+        overlap.enter()
+        try:
+            return await super()._agenerate(*args, **kwargs)
+        finally:
+            overlap.leave()
+
+
+@pytest.mark.parametrize("target", ["graph", "asgi"])
+def test_calls_overlap_under_concurrency(monkeypatch, target):
+    """
+    Concurrent requests wait on the LLM together rather than one after
+    another. Asserted on how many calls were in progress at once, which
+    does not depend on how fast the machine is.
+    """
+    import main
+
+    fake = TrackedFake(model_name="fake", ttft_ms=150, ttft_sigma=0, tokens_per_second=50000, rate_sigma=0, cache=False)
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: fake))
+    runs = []
+    for concurrency in (1, 8):
+        overlap.__init__()
+        runs.append(run_load(target, concurrency=concurrency, requests=8))
+        runs[-1]["peak"], runs[-1]["calls"] = overlap.peak, overlap.calls
+    serial, parallel = runs
+    assert serial["errors"] == parallel["errors"] == 0
+    assert serial["calls"] == parallel["calls"] > 0
+    print(f"\n{target}: peak LLM calls in progress {serial['peak']} serial, {parallel['peak']} at concurrency 8")
+    assert serial["peak"] == 1 and parallel["peak"] >= 4
+    assert "p99 ms" in format_report([serial, parallel])
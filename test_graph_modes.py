@@ -0,0 +1,133 @@
+"""
+Checks for the graph layouts chosen by PLAN_MODE and GRAPH_MODE, run on
+the fake LLM.
+
+Run with:  python -m pytest test_graph_modes.py
+"""
+import asyncio
+import threading
+
+import pytest
+from langchain_core.messages import AIMessage
+
+import main
+from app import build_initial_state
+from fake_llm import LOGISTICS, MEAL_PLAN, FakeChatModel, build_fake_llm, canned_reply
+from model_registry import ModelRegistry
+
+JOURNAL = "Feeling stressed at work, skipped lunch and now I want candy"
+
+
+@pytest.fixture
+def graph_mode(monkeypatch):
+    monkeypatch.setattr(main, "semantic_cache", None)
+    monkeypatch.setattr(main, "SPECULATIVE_PLAN", False)
+    monkeypatch.setattr(main, "RECIPE_MODE", "off")
+
+    def build(plan_mode="two_step", graph_mode="route", model=None, asynchronous=False):
+        model = model or (lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False))
+        monkeypatch.setattr(main, "models", ModelRegistry(model))
+        monkeypatch.setattr(main, "PLAN_MODE", plan_mode)
+        monkeypatch.setattr(main, "GRAPH_MODE", graph_mode)
+        return main.build_workflow(asynchronous=asynchronous)
+    return build
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_single_shot_plans_with_one_call(graph_mode, asynchronous):
+    graph = graph_mode("single_shot", asynchronous=asynchronous)
+    assert "meal_planner_agent" in graph.nodes and not {"nutritionist_agent", "logistics_agent"} & set(graph.nodes)
+    assert main.deferrable_nodes(graph) == []
+
+    state = build_initial_state({"journal_entry": JOURNAL})
+    result = asyncio.run(graph.ainvoke(state)) if asynchronous else graph.invoke(state)
+    assert result["final_plan"] == main.format_meal_plan(MEAL_PLAN)
+    assert result["final_plan"].startswith(f"## {MEAL_PLAN['meal']}")
+    reply = result["messages"][-1].content
+    assert reply.startswith(result["final_plan"]) and "LOGISTICS PLAN" in reply
+    assert all(item in reply for item in LOGISTICS["grocery_items"] + LOGISTICS["meal_prep_tips"])
+    assert f"{LOGISTICS['best_prep_day']} at {LOGISTICS['best_prep_time']}" in reply
+    assert "meal_planner_agent" in result["timings"] and "logistics_agent" not in result["timings"]
+
+
+def test_single_shot_falls_back_when_the_reply_is_not_json(graph_mode):
+    class Prose:
+        def __init__(self, model_id):
+            self.fake = build_fake_llm(model_id, ttft_ms=1, cache=False)
+
+        def invoke(self, prompt, **options):
+            response = self.fake.invoke(prompt, **options)
+            if "response_format" in options:
+                return AIMessage("Try a warm lentil soup tonight.")
+            return response
+
+    result = graph_mode("single_shot", model=Prose).invoke(build_initial_state({"journal_entry": JOURNAL}))
+    assert result["final_plan"] == "Try a warm lentil soup tonight."
+    assert main.FALLBACK_LOGISTICS in result["messages"][-1].content
+
+
+class InFlight:
+    """Records which agents' fake LLM calls were in progress at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = set()
+        self.together = set()
+
+    def enter(self, messages) -> str:
+        agent = canned_reply("\n".join(str(message.content) for message in messages))[0]
+        with self.lock:
+            self.running.add(agent)
+            if len(self.running) > 1:
+                self.together.add(frozenset(self.running))
+        return agent
+
+    def leave(self, agent: str) -> None:
+        with self.lock:
+            self.running.discard(agent)
+
+
+in_flight = InFlight()
+
+
+class TrackedFake(FakeChatModel):
+    def _generate(self, messages, *args, **kwargs):
+        agent = in_flight.enter(messages)
+        try:
+            return super()._generate(messages, *args, **kwargs)
+        finally:
+            in_flight.leave(agent)
+
+    async def _agenerate(self, messages, *args, **kwargs):
+        agent = in_flight.enter(messages)
+        try:
+            return await super()._agenerate(messages, *args, **kwargs)
+        finally:
+            in_flight.leave(agent)
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_parallel_branches_overlap_and_join(graph_mode, monkeypatch, asynchronous):
+    monkeypatch.setattr(main, "TRIGGER_MODE", "llm")
+    body = {"journal_entry": "Feeling stressed at work and I love spicy food", "user_profile": {"name": "Sam", "diet": "Vegan"}}
+    extraction = frozenset({"trigger_detective", "preference_agent"})
+
+    for graph_layout in ("route", "parallel"):
+        in_flight.__init__()
+        fake = TrackedFake(model_name="fake", ttft_ms=100, ttft_sigma=0, rate_sigma=0, cache=False)
+        graph = graph_mode(graph_mode=graph_layout, model=lambda model_id: fake, asynchronous=asynchronous)
+        state = build_initial_state(body)
+        result = asyncio.run(graph.ainvoke(state)) if asynchronous else graph.invoke(state)
+        if graph_layout == "route":
+            # The default layout only runs the trigger detective for a journal
+            assert in_flight.together == set() and "preference_agent" not in result["timings"]
+            continue
+
+        # Both extraction agents waited on the LLM at once, and nothing overlapped the plan
+        assert in_flight.together == {extraction}
+        assert extraction <= set(result["timings"]) and "logistics_agent" in result["timings"]
+        # Both branches' updates are merged before the plan
+        assert result["detected_triggers"] == ["Stress"]
+        assert result["user_profile"]["name"] == "Sam" and result["user_profile"]["diet"] == "Vegan"
+        assert set(result["user_profile"]) >= {"likes", "dislikes", "allergies"}
+        assert result["final_plan"].startswith("**Meal:")
@@ -0,0 +1,106 @@
+"""
+Checks for job mode: /api/analyze answers with the plan and a job, and
+the logistics finish in the background behind /api/jobs/<id>.
+
+Run with:  python -m pytest test_jobs.py
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from fake_llm import build_fake_llm
+from jobs import JobQueue
+from model_registry import ModelRegistry
+
+JOURNAL = {"journal_entry": "Exhausted and stressed, want chips", "job": True}
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+
+
+def test_queue_runs_expires_and_rejects():
+    queue = JobQueue(workers=1, max_pending=1, ttl_seconds=0.05)
+    release = threading.Event()
+    job = queue.submit(lambda: release.wait(5) and "ok", key="thread")
+    assert queue.submit(lambda: "too many") is None
+
+    assert queue.wait(job.id, 0.05).status in ("pending", "running")
+    release.set()
+    queue.wait_for_key("thread", 5)
+    assert queue.get(job.id).to_dict()["result"] == "ok"
+
+    time.sleep(0.1)
+    assert queue.get(job.id) is None
+
+
+def test_failed_job_reports_its_error():
+    queue = JobQueue(workers=1)
+    job = queue.submit(lambda: 1 / 0)
+    assert queue.wait(job.id, 5).to_dict()["status"] == "error"
+
+
+def test_plan_first_then_logistics(fake_models):
+    import main
+    from app import flask_app
+
+    client = flask_app.test_client()
+    response = client.post("/api/analyze", json=JOURNAL).get_json()
+    job = response["job"]
+    assert job["status"] in ("pending", "running") and job["url"] == f"/api/jobs/{job['id']}"
+    assert response["results"]["complete_response"] == response["results"]["final_plan"]
+    assert "logistics_agent" not in response["timings"]["nodes_ms"]
+
+    finished = client.get(f"{job['url']}?wait=10").get_json()
+    assert finished["status"] == "done"
+    assert "2 chicken breasts" in finished["result"]["results"]["complete_response"]
+    assert "logistics_agent" in finished["result"]["timings"]["nodes_ms"]
+    # The anonymous thread is dropped once its result is out
+    assert not main.job_checkpointer.storage
+
+    assert client.get("/api/jobs/unknown").status_code == 404
+
+
+def test_user_requests_wait_for_their_earlier_job(fake_models):
+    from app import flask_app, jobs
+
+    client = flask_app.test_client()
+    body = {**JOURNAL, "user_id": "job-test-user"}
+    first = client.post("/api/analyze", json=body).get_json()["job"]
+    second = client.post("/api/analyze", json=body).get_json()["job"]
+    assert jobs.get(first["id"]).status == "done"
+    assert jobs.wait(second["id"], 10).status == "done"
+
+
+def test_asgi_job_resumes_on_the_event_loop(fake_models):
+    from api.asgi import analyze_with_job
+    from app import jobs
+
+    async def run():
+        response = await analyze_with_job(dict(JOURNAL), {})
+        job = await asyncio.to_thread(jobs.wait, response["job"]["id"], 10)
+        return job.to_dict()
+
+    finished = asyncio.run(run())
+    assert finished["status"] == "done"
+    assert "2 chicken breasts" in finished["result"]["results"]["complete_response"]
+
+
+def test_shutdown_drops_queued_jobs_and_waits_for_running_ones():
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+    running = queue.submit(lambda: release.wait(5) and "ok", key="thread")
+    queued = queue.submit(lambda: "never", key="other")
+    while running.status != "running":
+        time.sleep(0.001)
+
+    threading.Timer(0.05, release.set).start()
+    queue.shutdown(timeout=5)
+    assert running.to_dict()["result"] == "ok"
+    assert queued.to_dict() == {**queued.to_dict(), "status": "error", "error": "server shutting down"}
+    assert queued.done.is_set() and queue.submit(lambda: "late") is None
@@ -0,0 +1,114 @@
+"""
+Corpus benchmark for the shared JSON extractor against the ad-hoc
+``` splitting the agents used before.
+
+Run with:  python -m pytest test_json_extract.py -s
+"""
+import json
+import os
+import time
+
+import pytest
+
+from json_extract import JSONStreamExtractor, LOGISTICS_SCHEMA, PROFILE_SCHEMA, TRIGGERS_SCHEMA, parse_json
+
+CORPUS = os.path.join(os.path.dirname(__file__), "fixtures", "llm_json_outputs.jsonl")
+SCHEMAS = {"triggers": TRIGGERS_SCHEMA, "profile": PROFILE_SCHEMA, "logistics": LOGISTICS_SCHEMA}
+
+with open(CORPUS) as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+
+def legacy_parse(text):
+    """The fence-splitting the agents used before json_extract"""
+    content = text.strip()
+    if content.startswith("```"):
+        content = content.split("```")[1]
+        if content.startswith("json"):
+            content = content[4:]
+    return json.loads(content.strip())
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda case: f"{case['schema']}:{case['text'][:30]}")
+def test_corpus_case(case):
+    assert parse_json(case["text"], SCHEMAS[case["schema"]]) == case["expected"]
+
+
+def test_streamed_tokens_parse_as_soon_as_value_closes():
+    extractor = JSONStreamExtractor()
+    tokens = ["Here ", "you go: ", '["Str', 'ess", ', '"Low Energy"', "]", " - hope", " this helps"]
+    results = [extractor.feed(token) for token in tokens]
+    assert results[:5] == [None] * 5
+    assert results[5] == ["Stress", "Low Energy"]
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda case: f"{case['schema']}:{case['text'][:30]}")
+def test_corpus_case_fed_one_character_at_a_time(case):
+    extractor = JSONStreamExtractor()
+    for character in case["text"]:
+        extractor.feed(character)
+    assert extractor.finish() == parse_json(case["text"])
+
+
+def test_escapes_and_false_starts_split_across_chunks():
+    extractor = JSONStreamExtractor()
+    tokens = ["see [", "sic] then ", '{"tip": "say \\', '"hi\\', '"", "n": [1', ", 2]}"]
+    assert [extractor.feed(token) for token in tokens][-1] == {"tip": 'say "hi"', "n": [1, 2]}
+
+
+def test_many_small_chunks_scan_in_linear_time():
+    tokens = ['{"grocery_items": ['] + ['"oats", '] * 200000 + ['"rice"]}']
+    extractor = JSONStreamExtractor()
+    started = time.perf_counter()
+    for token in tokens:
+        extractor.feed(token)
+    assert len(extractor.value["grocery_items"]) == 200001
+    # Re-concatenating the buffer on every chunk took ~10 s here
+    assert time.perf_counter() - started < 4
+
+
+def _success_and_time(parse):
+    successes = 0
+    start = time.perf_counter()
+    for case in CASES:
+        try:
+            if parse(case) == case["expected"]:
+                successes += 1
+        except ValueError:
+            pass
+    return successes / len(CASES), (time.perf_counter() - start) * 1000
+
+
+def test_parse_success_rate_report():
+    legacy_rate, legacy_ms = _success_and_time(lambda case: legacy_parse(case["text"]))
+    new_rate, new_ms = _success_and_time(lambda case: parse_json(case["text"], SCHEMAS[case["schema"]]))
+    print(
+        f"\nJSON corpus ({len(CASES)} LLM outputs): "
+        f"legacy split {legacy_rate:.0%} in {legacy_ms:.2f} ms, "
+        f"json_extract {new_rate:.0%} in {new_ms:.2f} ms"
+    )
+    assert new_rate == 1.0
+    assert new_rate > legacy_rate
+
+
+def test_bench_parse_logistics(benchmark):
+    case = next(case for case in CASES if case["schema"] == "logistics")
+    assert benchmark(parse_json, case["text"], LOGISTICS_SCHEMA) == case["expected"]
+
+
+def test_stream_sends_logistics_json_before_the_node_ends(monkeypatch):
+    import main
+    from app import flask_app
+    from fake_llm import build_fake_llm
+    from model_registry import ModelRegistry
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+    body = {"journal_entry": "Stressed at work and skipped lunch, feeling like candy"}
+    stream = flask_app.test_client().post("/api/analyze/stream", json=body).get_data(as_text=True)
+    events = [(event[len("event: "):], json.loads(data[len("data: "):])) for event, data in (block.split("\n") for block in stream.strip().split("\n\n"))]
+
+    structured = [index for index, (name, _) in enumerate(events) if name == "structured"]
+    logistics_end = next(index for index, (name, data) in enumerate(events) if name == "node_end" and data["node"] == "logistics_agent")
+    assert len(structured) == 1 and structured[0] < logistics_end
+    node, value = events[structured[0]][1]["node"], events[structured[0]][1]["value"]
+    assert node == "logistics_agent" and value["grocery_items"] and isinstance(value["prep_time_minutes"], int)
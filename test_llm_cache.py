@@ -0,0 +1,69 @@
+import asyncio
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration
+
+from llm_cache import LLMResponseCache, MemoryTier, SQLiteTier, build_llm_cache
+
+
+def test_repeated_prompt_is_served_from_cache():
+    cache = build_llm_cache("memory")
+    model = FakeListChatModel(responses=["first", "second"], cache=cache)
+
+    assert model.invoke("same prompt").content == "first"
+    assert model.invoke("same prompt").content == "first"
+    assert model.invoke("other prompt").content == "second"
+    assert asyncio.run(model.ainvoke("same prompt")).content == "first"
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryTier(max_entries=2, ttl_seconds=0)
+    tier.set("a", 1)
+    tier.set("b", 2)
+    tier.get("a")
+    tier.set("c", 3)
+
+    assert tier.get("b") is None
+    assert tier.get("a") == 1
+    assert tier.get("c") == 3
+
+
+def test_memory_tier_expires_entries():
+    tier = MemoryTier(ttl_seconds=60)
+    tier.set("a", 1)
+    tier._entries["a"] = (1.0, 1)  # already past its expiry time
+
+    assert tier.get("a") is None
+    assert len(tier) == 0
+
+
+def test_sqlite_tier_survives_restart_and_promotes_hits(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    generations = [ChatGeneration(message=AIMessage(content="stored"))]
+    LLMResponseCache([MemoryTier(), SQLiteTier(path)]).update("prompt", "model", generations)
+
+    cache = LLMResponseCache([MemoryTier(), SQLiteTier(path)])
+
+    assert cache.lookup("prompt", "model")[0].message.content == "stored"
+    assert cache.lookup("prompt", "model")[0].message.content == "stored"
+    assert cache.lookup("prompt", "other model") is None
+    assert cache.stats()["tier_hits"] == {"memory": 1, "sqlite": 1}
+
+
+def test_retry_and_timeout_settings_share_cache_entries():
+    import main
+    from llm_cache import cache_key
+    from langchain_core.messages import HumanMessage
+
+    def key(model):
+        return cache_key("same prompt", model._get_llm_string(messages=[HumanMessage("same prompt")]))
+
+    interactive = main.build_llm()
+    # The batch registry's models skip retries (SharedBackoff handles them)
+    assert key(main.build_llm(max_retries=0)) == key(interactive)
+    assert key(interactive.model_copy(update={"request_timeout": 5})) == key(interactive)
+    assert key(main.build_llm(temperature=0.7)) != key(interactive)
+    assert key(main.build_llm(model="llama-3.1-8b-instant")) != key(interactive)
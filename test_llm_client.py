@@ -0,0 +1,124 @@
+"""
+Checks for the LLM call timeouts, request deadlines and hedged requests.
+
+Run with:  python -m pytest test_llm_client.py
+"""
+import asyncio
+import time
+
+import pytest
+
+from llm_client import ClientSettings, DeadlineExceeded, LLMCaller, load_client_settings, with_deadline
+
+
+def slow_then_fast():
+    """A call whose first attempt stalls and whose duplicate answers quickly"""
+    attempts = []
+
+    def call():
+        attempts.append(None)
+        attempt = len(attempts)
+        time.sleep(1.0 if attempt == 1 else 0.02)
+        return attempt
+
+    return call
+
+
+def test_settings_from_environment():
+    settings = load_client_settings({
+        "LLM_POOL_SIZE": "4",
+        "LLM_READ_TIMEOUT": "12",
+        "LLM_AGENT_TIMEOUTS": "trigger_detective=5, nutritionist_agent=30",
+        "LLM_HEDGE": "on",
+    })
+    assert settings.pool_size == 4
+    assert settings.read_timeout == 12
+    assert settings.agent_timeouts == {"trigger_detective": 5, "nutritionist_agent": 30}
+    assert settings.hedge and settings.hedge_delay_ms is None
+
+
+def test_call_timeout_is_capped_by_the_request_deadline():
+    caller = LLMCaller(ClientSettings(agent_timeout=60, agent_timeouts={"fast": 2}))
+    assert caller.call_timeout("fast") == 2
+    assert caller.call_timeout("other", with_deadline(None, 0.5)) <= 0.5
+    with pytest.raises(DeadlineExceeded):
+        caller.call_timeout("other", with_deadline(None, 0))
+
+
+def test_stalled_call_is_abandoned_at_its_timeout():
+    caller = LLMCaller(ClientSettings(agent_timeout=0.1))
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        caller.invoke("agent", lambda: time.sleep(1.0))
+    assert time.monotonic() - start < 0.5
+
+
+def test_hedged_call_takes_the_first_answer():
+    caller = LLMCaller(ClientSettings(hedge=True, hedge_delay_ms=50))
+    start = time.monotonic()
+    assert caller.invoke("agent", slow_then_fast()) == 2
+    assert time.monotonic() - start < 0.5
+
+
+def test_hedging_can_be_turned_off_per_run():
+    caller = LLMCaller(ClientSettings(hedge=True, hedge_delay_ms=50))
+    assert caller.invoke("agent", slow_then_fast(), with_deadline(None, 5, hedge=False)) == 1
+
+
+def test_hedge_waits_for_enough_latency_samples():
+    caller = LLMCaller(ClientSettings(hedge=True, hedge_min_samples=10**6))
+    assert caller.hedge_delay("agent") is None
+
+
+def test_async_hedge_cancels_the_loser():
+    caller = LLMCaller(ClientSettings(hedge=True, hedge_delay_ms=50))
+    cancelled = []
+
+    async def run():
+        attempts = []
+
+        async def call():
+            attempts.append(None)
+            attempt = len(attempts)
+            try:
+                await asyncio.sleep(1.0 if attempt == 1 else 0.02)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return attempt
+
+        result = await caller.ainvoke("agent", call)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == 2
+    assert cancelled == [1]
+
+
+def test_llm_latency_leaves_out_queueing_and_cache_hits(monkeypatch):
+    import threading
+
+    import main
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+    from metrics import metrics
+    from scheduler import LLMScheduler, SchedulerSettings
+
+    flight = LLMScheduler(SchedulerSettings(max_concurrency=1))
+    monkeypatch.setattr(main, "llm_scheduler", flight)
+    metrics.reset()
+
+    @main.agent_node
+    def latency_probe(state):
+        response = yield [HumanMessage(state["journal_entry"])]
+        return {"final_plan": response.content}
+
+    replies = {"hit": AIMessage("cached", response_metadata={"cache_hit": "memory"}), "miss": AIMessage("fresh")}
+    config = {"configurable": {"llm": RunnableLambda(lambda prompt: replies[prompt[0].content])}}
+    held = flight.acquire()
+    threading.Timer(0.3, flight.release, args=(held,)).start()
+    assert latency_probe({"journal_entry": "miss"}, config)["final_plan"] == "fresh"
+    latency_probe({"journal_entry": "hit"}, config)
+
+    counts, total, count = metrics.histogram("nutrition_llm_call_duration_seconds", agent="latency_probe").snapshot()
+    assert count == 1 and total < 0.2
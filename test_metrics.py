@@ -0,0 +1,74 @@
+"""
+Checks for the in-process metrics registry behind /api/metrics.
+
+Run with:  python -m pytest test_metrics.py
+"""
+import time
+
+from langchain_core.messages import AIMessage
+
+from metrics import MetricsRegistry, RollingHistogram, metrics, record_llm_call
+
+
+def test_histogram_quantiles_interpolate_within_buckets():
+    histogram = RollingHistogram(buckets=(0.1, 0.5, 1.0), window_seconds=60)
+    for value in [0.05] * 50 + [0.3] * 45 + [0.8] * 5:
+        histogram.observe(value, now=1000)
+    assert 0.0 < histogram.quantile(0.5, now=1000) <= 0.1
+    assert 0.1 < histogram.quantile(0.95, now=1000) <= 0.5
+    assert 0.5 < histogram.quantile(0.99, now=1000) <= 1.0
+
+
+def test_histogram_forgets_observations_outside_window():
+    histogram = RollingHistogram(buckets=(1.0,), window_seconds=60, slots=6)
+    histogram.observe(0.5, now=1000)
+    histogram.observe(0.5, now=1055)
+    assert histogram.snapshot(now=1055)[2] == 2
+    assert histogram.snapshot(now=1065)[2] == 1
+    assert histogram.snapshot(now=1125)[2] == 0
+
+
+def test_prometheus_rendering():
+    registry = MetricsRegistry()
+    registry.describe("demo_seconds", "histogram", "Demo latency")
+    registry.inc("demo_total", agent='say "hi"')
+    registry.observe("demo_seconds", 0.2, node="a")
+    text = registry.render_prometheus([("demo_entries", {"tier": "memory"}, 3)])
+
+    assert 'demo_total{agent="say \\"hi\\""} 1' in text
+    assert "# HELP demo_seconds Demo latency" in text
+    assert "# TYPE demo_seconds histogram" in text
+    assert 'demo_seconds_bucket{node="a",le="0.1"} 0' in text
+    assert 'demo_seconds_bucket{node="a",le="0.25"} 1' in text
+    assert 'demo_seconds_bucket{node="a",le="+Inf"} 1' in text
+    assert 'demo_seconds_count{node="a"} 1' in text
+    assert "# TYPE demo_entries gauge" in text
+    assert 'demo_entries{tier="memory"} 3' in text
+
+
+def test_llm_call_tokens_skip_cache_hits():
+    metrics.reset()
+    usage = {"input_tokens": 100, "output_tokens": 20, "total_tokens": 120}
+    record_llm_call("agent", 0.5, AIMessage(content="x", usage_metadata=usage))
+    record_llm_call("agent", 0.001, AIMessage(content="x", usage_metadata=usage, response_metadata={"cache_hit": "memory"}))
+    record_llm_call("agent", 1.0, error=TimeoutError())
+
+    assert metrics.counter("nutrition_llm_calls_total", agent="agent", outcome="ok") == 1
+    assert metrics.counter("nutrition_llm_calls_total", agent="agent", outcome="cache_hit") == 1
+    assert metrics.counter("nutrition_llm_calls_total", agent="agent", outcome="error") == 1
+    assert metrics.counter("nutrition_llm_prompt_tokens_total", agent="agent") == 100
+    assert metrics.counter("nutrition_llm_completion_tokens_total", agent="agent") == 20
+    # Cache hits would drag the hedge delay towards 0
+    assert metrics.histogram("nutrition_llm_call_duration_seconds", agent="agent").snapshot()[2] == 2
+
+
+def test_prometheus_histograms_never_go_down():
+    registry = MetricsRegistry(window_seconds=0.02)
+    registry.observe("demo_seconds", 0.2)
+    histogram = registry.histogram("demo_seconds")
+    time.sleep(0.05)
+    # Aged out of the rolling window (summary, hedging) but still exported
+    assert histogram.snapshot()[2] == 0
+    text = registry.render_prometheus(counters=[("demo_lookups_total", {"result": "hit"}, 4)])
+    assert 'demo_seconds_count 1' in text and 'demo_seconds_bucket{le="+Inf"} 1' in text
+    assert "# TYPE demo_lookups_total counter" in text and 'demo_lookups_total{result="hit"} 4' in text
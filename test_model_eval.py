@@ -0,0 +1,88 @@
+"""
+Checks for per-node model routing, schema escalation and the model_eval
+harness. A scripted cassette stands in for recorded replies: the large
+model always answers with the labels, the small one gets one case wrong
+and returns unparseable output for another.
+
+Run with:  python -m pytest test_model_eval.py -s
+"""
+import json
+import os
+
+os.environ.setdefault("GROQ_API_KEY", "offline-eval")
+
+import pytest
+
+from model_eval import Cassette, evaluate, format_report, load_cases
+from model_registry import ModelRegistry, load_model_config
+
+CASES = load_cases()
+CASES = {agent: cases[:6] for agent, cases in CASES.items()}
+LATENCY_MS = {"large": 900.0, "small": 150.0}
+
+
+def _case_for(messages):
+    text = " ".join(message.content for message in messages)
+    for agent, cases in CASES.items():
+        for index, case in enumerate(cases):
+            if case["text"] in text:
+                return agent, index, case
+    raise KeyError(text[:80])
+
+
+class ScriptedCassette(Cassette):
+    def __init__(self, models):
+        super().__init__()
+        self.tiers = {model_id: tier for tier, model_id in models.items()}
+
+    def lookup(self, model_id, messages):
+        agent, index, case = _case_for(messages)
+        tier = self.tiers[model_id]
+        if agent == "trigger_detective":
+            answer = case["triggers"]
+            if tier == "small" and index == 1:
+                answer = ["Boredom"]
+        else:
+            answer = {"name": "User", "diet": "No specific diet", "allergies": [], "likes": [], "dislikes": [], **case["profile"]}
+        content = json.dumps(answer)
+        if tier == "small" and index == 0:
+            content = "Sure! The profile is: name User, likes tofu"
+        return {"content": content, "latency_ms": LATENCY_MS[tier]}
+
+
+def test_model_config_from_environment():
+    models, assignments = load_model_config({"LLM_MODEL_SMALL": "tiny", "LLM_NODE_MODELS": "trigger_detective=small"})
+    assert models["small"] == "tiny"
+    assert assignments == {"trigger_detective": "small"}
+    assert load_model_config({"LLM_NODE_MODELS": ""})[1] == {}
+    # Small-model routing is opt-in: unconfigured, every node runs the large model
+    assert load_model_config({})[1] == {}
+    registry = ModelRegistry(str)
+    assert registry.tier("logistics_agent") == registry.tier("trigger_detective") == "large"
+    with pytest.raises(ValueError):
+        ModelRegistry(str, models, {"trigger_detective": "medium"})
+
+
+def test_registry_routes_nodes_and_shares_instances():
+    registry = ModelRegistry(lambda model_id: object(), {"large": "L", "small": "S"}, {"trigger_detective": "small"})
+    assert registry.for_node("trigger_detective") is registry.get("small")
+    assert registry.for_node("nutritionist_agent") is registry.get("large")
+    assert registry.escalates("trigger_detective") and not registry.escalates("nutritionist_agent")
+
+
+def test_eval_compares_assignments():
+    import main
+
+    cassette = ScriptedCassette(main.MODEL_IDS)
+    results = evaluate(cassette, cases=CASES)
+    print("\n" + format_report(results))
+
+    for agent in ("preference_agent", "trigger_detective"):
+        large, small = results["all_large"][agent], results["all_small"][agent]
+        assert large["accuracy"] == 1.0 and large["escalated"] == 0
+        # The unparseable small reply was escalated and answered correctly
+        assert small["escalated"] == 1
+        assert small["calls"] == small["cases"] + 1
+        assert small["p50_ms"] < large["p50_ms"]
+    assert results["all_small"]["trigger_detective"]["accuracy"] == pytest.approx(5 / 6, abs=0.001)
+    assert results["all_small"]["preference_agent"]["accuracy"] == 1.0
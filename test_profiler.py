@@ -0,0 +1,141 @@
+"""
+Checks for per-request profiling (profiler.py).
+
+Run with:  python -m pytest test_profiler.py
+"""
+import asyncio
+import json
+import threading
+import time
+
+from fake_llm import build_fake_llm
+from model_registry import ModelRegistry
+from profiler import GRAPH_LABEL, Profile, ProfilingSettings, RequestProfiler, load_profiling_settings
+
+
+def busy_parse(seconds: float) -> None:
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        json.loads('{"meal": [1, 2, 3]}')
+
+
+def sampler_running() -> bool:
+    return any(thread.name == "request-profiler" for thread in threading.enumerate())
+
+
+def test_samples_are_attributed_to_nodes(tmp_path):
+    profiler = RequestProfiler(ProfilingSettings(directory=str(tmp_path), interval_ms=2))
+    profile = profiler.start("analyze")
+    with profile.watch():
+        busy_parse(0.05)
+
+        def node():
+            with profile.watch("safety_agent"):
+                busy_parse(0.1)
+        worker = threading.Thread(target=node)
+        worker.start()
+        worker.join()
+    summary = profiler.finish(profile)
+
+    nodes = summary["nodes"]
+    assert nodes["safety_agent"]["calls"] == 1 and nodes["safety_agent"]["wall_s"] >= 0.1
+    assert nodes["safety_agent"]["sampled_s"] > 0.05 and nodes[GRAPH_LABEL]["sampled_s"] > 0.03
+
+    folded = (tmp_path / f"{profile.id}.folded").read_text()
+    assert any(line.startswith("safety_agent;") and "busy_parse (test_profiler.py" in line for line in folded.splitlines())
+    speedscope = json.loads((tmp_path / f"{profile.id}.speedscope.json").read_text())
+    frames = speedscope["shared"]["frames"]
+    sampled, timeline = speedscope["profiles"]
+    assert len(sampled["samples"]) == len(sampled["weights"])
+    assert all(0 <= index < len(frames) for sample in sampled["samples"] for index in sample)
+    assert [frames[event["frame"]]["name"] for event in timeline["events"]] == ["safety_agent", "safety_agent"]
+
+    time.sleep(0.05)
+    assert not sampler_running()
+
+
+def test_overlapping_node_runs_get_their_own_lanes():
+    profile = Profile("analyze")
+
+    def node(label):
+        with profile.watch(label, sample=False):
+            time.sleep(0.03)
+    threads = [threading.Thread(target=node, args=(label,)) for label in ("nutritionist_agent", "speculative_plan")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    profile.finish()
+    assert [entry["type"] for entry in profile.to_speedscope()["profiles"]] == ["evented", "evented"]
+
+
+def test_off_unless_asked():
+    quiet = RequestProfiler(load_profiling_settings({"PROFILING_HEADER": "off", "PROFILING_ADMIN_TOKEN": "secret"}))
+    assert not quiet.wanted({"X-Profiling": "1", "X-Admin-Token": "secret"})
+    # Without an admin token nobody can ask for a profile or read them
+    open_door = RequestProfiler(ProfilingSettings())
+    assert not open_door.wanted({"X-Profiling": "1"}) and not open_door.authorized({"X-Admin-Token": ""})
+
+    guarded = RequestProfiler(ProfilingSettings(admin_token="secret"))
+    assert not guarded.wanted({"X-Profiling": "1"}) and not guarded.wanted({})
+    assert guarded.wanted({"X-Profiling": "1", "X-Admin-Token": "secret"})
+    assert RequestProfiler(ProfilingSettings(header=False, sample_rate=1.0)).wanted({})
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path):
+    profiler = RequestProfiler(ProfilingSettings(directory=str(tmp_path), keep=2))
+    ids = []
+    for _ in range(3):
+        profile = profiler.start("analyze")
+        ids.append(profile.id)
+        profiler.finish(profile)
+        time.sleep(0.002)
+    assert [entry["id"] for entry in profiler.list()] == ids[:0:-1]
+
+
+def test_profiled_analyze_request(monkeypatch, tmp_path):
+    import app
+    import main
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=20, cache=False)))
+    monkeypatch.setattr(app, "profiler", RequestProfiler(ProfilingSettings(directory=str(tmp_path), interval_ms=1, admin_token="secret")))
+    client = app.flask_app.test_client()
+    body = {"journal_entry": "Stressed at work and skipped lunch, now I want candy"}
+    admin = {"X-Admin-Token": "secret"}
+
+    plain = client.post("/api/analyze", json=body).get_json()
+    assert "profile" not in plain and client.get("/api/profiles", headers=admin).get_json()["profiles"] == []
+
+    response = client.post("/api/analyze", json=body, headers={"X-Profiling": "1", **admin}).get_json()
+    profile = response["profile"]
+    assert response["success"] and not response["coalesced"]
+    assert {"safety_agent", "nutritionist_agent"} <= set(profile["nodes"]) and profile["samples"] > 0
+
+    assert client.get("/api/profiles").status_code == 403
+    listed = client.get("/api/profiles", headers=admin).get_json()["profiles"]
+    assert [entry["id"] for entry in listed] == [profile["id"]] and listed[0]["nodes"] == profile["nodes"]
+    download = client.get(f"/api/profiles/{profile['id']}.speedscope.json", headers=admin)
+    assert download.status_code == 200 and json.loads(download.data)["profiles"]
+    assert client.get("/api/profiles/../app.py", headers=admin).status_code == 404
+
+
+def test_profiled_asgi_request_times_nodes_only(monkeypatch, tmp_path):
+    import app
+    import main
+    from api.asgi import analyze_journal
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+    monkeypatch.setattr(app, "profiler", RequestProfiler(ProfilingSettings(directory=str(tmp_path), admin_token="secret")))
+    body = json.dumps({"journal_entry": "Stressed at work and skipped lunch, now I want candy"}).encode()
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/analyze", "headers": [(b"x-profiling", b"1"), (b"x-admin-token", b"secret")]}
+    asyncio.run(analyze_journal(scope, receive, send))
+    profile = json.loads(sent[-1]["body"])["profile"]
+    assert profile["samples"] == 0 and profile["nodes"]["safety_agent"]["calls"] == 1
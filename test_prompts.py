@@ -0,0 +1,42 @@
+"""
+Checks that agent prompts keep a static prefix and report their token split.
+
+Run with:  python -m pytest test_prompts.py
+"""
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import main
+from app import flask_app
+from fake_llm import build_fake_llm
+from model_registry import ModelRegistry
+from prompts import (LOGISTICS_PROMPT, MEAL_PLANNER_PROMPT, NUTRITIONIST_PROMPT, PREFERENCE_PROMPT, TRIGGER_PROMPT,
+                     count_prompt_tokens)
+
+USER = dict(name="Ana", diet="Vegan", allergies=["peanuts"], likes=[], dislikes=[], glucose_trend="Spiking",
+            energy_level="Low", triggers="Stress", candidates="")
+CASES = [
+    (TRIGGER_PROMPT, dict(journal="stressed at work"), dict(journal="bored at home")),
+    (PREFERENCE_PROMPT, dict(history=[HumanMessage(content="I'm vegan")], profile="{}"),
+     dict(history=[HumanMessage(content="I hate olives")], profile='{"diet": "Vegan"}')),
+    (NUTRITIONIST_PROMPT, USER, {**USER, "name": "Ben", "diet": "Keto", "triggers": "Boredom"}),
+    (LOGISTICS_PROMPT, dict(plan="Tofu bowl", triggers="Stress"), dict(plan="Omelette", triggers="None")),
+    (MEAL_PLANNER_PROMPT, USER, {**USER, "glucose_trend": "Normal"}),
+]
+
+
+@pytest.mark.parametrize("template, first, second", CASES)
+def test_static_prefix_is_identical_across_requests(template, first, second):
+    a, b = template.format_messages(**first), template.format_messages(**second)
+    assert isinstance(a[0], SystemMessage) and a[0].content == b[0].content
+    assert all(str(value) not in a[0].content for value in first.values() if isinstance(value, str) and len(value) > 4)
+    static, variable = count_prompt_tokens(a)
+    assert static > variable > 0
+
+
+def test_analyze_reports_prompt_tokens_per_node(monkeypatch):
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+    response = flask_app.test_client().post("/api/analyze", json={"journal_entry": "So stressed at work, want pizza"})
+    tokens = response.get_json()["prompt_tokens"]
+    assert set(tokens) == {"nutritionist_agent", "logistics_agent"}
+    assert all(split["static"] > 0 and split["variable"] > 0 for split in tokens.values())
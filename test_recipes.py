@@ -0,0 +1,77 @@
+"""
+Checks and a retrieval benchmark for the recipe index (RECIPE_MODE).
+
+Run with:  python -m pytest test_recipes.py
+           python -m pytest test_recipes.py --benchmark-only   (requires pytest-benchmark)
+"""
+import pytest
+
+import main
+from app import build_initial_state
+from fake_llm import build_fake_llm
+from model_registry import ModelRegistry
+from recipes import load_recipe_index
+
+index = load_recipe_index()
+JOURNAL = "So stressed with work today and my energy crashed around 3pm."
+
+
+def test_candidates_respect_diet_allergies_and_glucose():
+    vegan = index.candidates({"diet": "Vegan", "allergies": ["tree nuts", "sesame"]}, {}, ["Boredom"])
+    assert vegan and all("vegan" in r.diets and not r.allergens & {"tree_nut", "sesame"} for r in vegan)
+
+    spiking = index.candidates({"diet": "No specific diet"}, {"glucose_trend": "Spiking"}, ["Sleep deprivation"], limit=10)
+    assert spiking and all(r.glycemic == "low" for r in spiking)
+
+    # An allergy the index has no tag for excludes recipes that mention it
+    assert all("quinoa" not in " ".join(r.ingredients) for r in index.candidates({"allergies": ["Quinoa"]}, {}, [], limit=30))
+
+
+def test_candidates_are_ranked_by_trigger_fit_and_dislikes():
+    top = index.candidates({}, {}, ["Comfort seeking", "Loneliness"])[0]
+    assert {"Comfort seeking", "Loneliness"} <= top.triggers
+    assert all("lentil" not in r.name.lower() for r in index.candidates({"dislikes": ["lentils"]}, {}, ["Comfort seeking", "Loneliness"]))
+
+
+@pytest.fixture
+def recipe_mode(monkeypatch):
+    monkeypatch.setattr(main, "recipe_index", index)
+    monkeypatch.setattr(main, "TRIGGER_MODE", "local")
+    monkeypatch.setattr(main, "semantic_cache", None)
+
+    def run(mode, models):
+        monkeypatch.setattr(main, "RECIPE_MODE", mode)
+        monkeypatch.setattr(main, "models", models)
+        return main.build_workflow().invoke(build_initial_state({"journal_entry": JOURNAL}))
+    return run
+
+
+def test_template_mode_plans_without_the_llm(recipe_mode):
+    def no_llm(model_id):
+        raise AssertionError("template mode must not build a model")
+
+    result = recipe_mode("template", ModelRegistry(no_llm))
+    recipe = index.by_id[result["recipe_id"]]
+    assert result["final_plan"].startswith(f"**Meal: {recipe.name}**")
+    assert all(item in result["messages"][-1].content for item in recipe.ingredients)
+
+
+def test_grounded_plan_takes_groceries_from_the_index(recipe_mode):
+    calls = []
+
+    def fake(model_id):
+        llm = build_fake_llm(model_id, ttft_ms=1, cache=False)
+        calls.append(model_id)
+        return llm
+
+    result = recipe_mode("ground", ModelRegistry(fake))
+    assert result["recipe_id"] == "chicken_quinoa_bowl"
+    # Only in the indexed recipe, not in the fake model's logistics reply
+    assert "2 tbsp olive oil" in result["messages"][-1].content
+    assert result["timings"]["logistics_agent"] < 5
+
+
+def test_bench_candidates(benchmark):
+    profile = {"diet": "Vegetarian", "allergies": ["peanuts"], "likes": ["berries"], "dislikes": ["mushrooms"]}
+    candidates = benchmark(index.candidates, profile, {"glucose_trend": "Rising"}, ["Stress", "Boredom"])
+    assert candidates
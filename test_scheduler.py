@@ -0,0 +1,238 @@
+"""
+Checks for the LLM admission scheduler (scheduler.py).
+
+Run with:  python -m pytest test_scheduler.py -s
+"""
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from scheduler import LLMScheduler, Overloaded, SchedulerSettings
+
+
+def scheduler(**settings) -> LLMScheduler:
+    return LLMScheduler(SchedulerSettings(**settings))
+
+
+def queued_behind(flight: LLMScheduler, priority: str, order: list, pool: ThreadPoolExecutor):
+    """Submits a waiting call that records when it is granted"""
+    before = flight.stats()["queued"][priority]
+
+    def call():
+        ticket = flight.acquire(priority)
+        order.append(priority)
+        flight.release(ticket)
+    future = pool.submit(call)
+    while flight.stats()["queued"][priority] == before:
+        time.sleep(0.001)
+    return future
+
+
+def test_interactive_calls_go_before_batch():
+    flight = scheduler(max_concurrency=1)
+    held = flight.acquire("batch")
+    order = []
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [queued_behind(flight, "batch", order, pool), queued_behind(flight, "interactive", order, pool)]
+        flight.release(held)
+        for future in futures:
+            future.result(timeout=5)
+    assert order == ["interactive", "batch"]
+
+
+def test_full_queue_and_long_wait_are_turned_away_fast():
+    flight = scheduler(max_concurrency=1, max_queue={"interactive": 1, "batch": 10})
+    held = flight.acquire()
+    order = []
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        waiting = queued_behind(flight, "interactive", order, pool)
+        started = time.perf_counter()
+        with pytest.raises(Overloaded) as full:
+            flight.acquire()
+        assert full.value.reason == "queue_full" and full.value.retry_after > 0
+        with pytest.raises(Overloaded) as slow:
+            flight.acquire("batch", timeout=0.5)
+        assert slow.value.reason == "wait"
+        assert time.perf_counter() - started < 0.1
+        flight.release(held)
+        waiting.result(timeout=5)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_tenant_quota_settles_on_actual_usage():
+    flight = scheduler(tenant_tokens_per_minute=1000, tenant_quotas={"big-key": 5000})
+    ticket = flight.acquire(tenant="alice", tokens=800)
+    with pytest.raises(Overloaded) as over:
+        flight.acquire(tenant="alice", tokens=800)
+    assert over.value.reason == "quota"
+    flight.release(flight.acquire(tenant="bob", tokens=800))
+    flight.release(flight.acquire(tenant="big-key", tokens=4000))
+
+    # The call used far fewer tokens than estimated; the rest is refunded
+    flight.release(ticket, used_tokens=100)
+    flight.release(flight.acquire(tenant="alice", tokens=800))
+
+
+def test_tokens_per_minute_budget_paces_calls():
+    flight = scheduler(tokens_per_minute=6000)
+    flight.release(flight.acquire(tokens=6000))
+    started = time.perf_counter()
+    flight.release(flight.acquire(tokens=50))
+    assert 0.4 < time.perf_counter() - started < 2
+
+
+def test_async_waiters_are_granted_in_priority_order():
+    flight = scheduler(max_concurrency=1)
+    order = []
+
+    async def call(priority, delay):
+        await asyncio.sleep(delay)
+        ticket = await flight.aacquire(priority)
+        order.append(priority)
+        await asyncio.sleep(0.01)
+        flight.release(ticket)
+
+    async def run():
+        await asyncio.gather(call("batch", 0), call("batch", 0.001), call("interactive", 0.002))
+
+    asyncio.run(run())
+    assert order == ["batch", "interactive", "batch"]
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    flight = scheduler(max_concurrency=1)
+
+    async def run():
+        held = await flight.aacquire()
+        waiter = asyncio.create_task(flight.aacquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        flight.release(held)
+        flight.release(await asyncio.wait_for(flight.aacquire(timeout=1), 1))
+
+    asyncio.run(run())
+    assert flight.stats()["in_flight"] == 0 and flight.stats()["queued"]["interactive"] == 0
+
+
+def test_interactive_latency_holds_under_batch_overload():
+    """A batch flood queued ahead does not delay interactive calls beyond the calls already running"""
+    flight = scheduler(max_concurrency=4)
+    waits = {"interactive": [], "batch": []}
+
+    def call(priority):
+        queued = time.perf_counter()
+        ticket = flight.acquire(priority)
+        waits[priority].append(time.perf_counter() - queued)
+        time.sleep(0.02)
+        flight.release(ticket)
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        batch = [pool.submit(call, "batch") for _ in range(48)]
+        time.sleep(0.05)
+        interactive = [pool.submit(call, "interactive") for _ in range(8)]
+        for future in batch + interactive:
+            future.result(timeout=10)
+
+    p95 = {priority: np.percentile(samples, 95) for priority, samples in waits.items()}
+    print(f"\nQueue wait p95: interactive {p95['interactive'] * 1000:.0f} ms, batch {p95['batch'] * 1000:.0f} ms")
+    assert p95["interactive"] < 0.1 < p95["batch"]
+
+
+def test_overloaded_analyze_answers_429(monkeypatch):
+    import main
+    from app import flask_app
+    from fake_llm import build_fake_llm
+    from model_registry import ModelRegistry
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+    flight = scheduler(max_concurrency=1, max_queue={"interactive": 0, "batch": 0})
+    monkeypatch.setattr(main, "llm_scheduler", flight)
+    held = flight.acquire()
+
+    body = {"journal_entry": "Stressed at work and skipped lunch, now I want candy"}
+    response = flask_app.test_client().post("/api/analyze", json=body, headers={"X-Api-Key": "key-1"})
+    assert response.status_code == 429
+    assert response.get_json()["reason"] == "queue_full" and int(response.headers["Retry-After"]) >= 1
+
+    flight.release(held)
+    response = flask_app.test_client().post("/api/analyze", json=body, headers={"X-Api-Key": "key-1"})
+    assert response.status_code == 200
+
+
+def test_overloaded_stream_answers_429_or_a_typed_event(monkeypatch):
+    import main
+    from api.asgi import analyze_journal_stream
+    from app import flask_app
+    from fake_llm import build_fake_llm
+    from model_registry import ModelRegistry
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=1, cache=False)))
+    flight = scheduler(max_concurrency=1, max_queue={"interactive": 0, "batch": 0})
+    monkeypatch.setattr(main, "llm_scheduler", flight)
+    held = flight.acquire()
+    body = {"journal_entry": "Stressed at work and skipped lunch, now I want candy"}
+
+    # Turned away before the response starts: a real 429 on both servers
+    response = flask_app.test_client().post("/api/analyze/stream", json=body)
+    assert response.status_code == 429 and response.get_json()["reason"] == "queue_full"
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode()}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(analyze_journal_stream({"type": "http", "headers": []}, receive, send))
+    assert sent[0]["status"] == 429 and int(dict(sent[0]["headers"])[b"retry-after"]) >= 1
+
+    # Turned away after it started: the stream ends with an overloaded event
+    monkeypatch.setattr(main, "check_admission", lambda config: None)
+    stream = flask_app.test_client().post("/api/analyze/stream", json=body).get_data(as_text=True)
+    event, data = stream.rstrip().split("\n\n")[-1].split("\n")
+    assert event == "event: overloaded" and json.loads(data[len("data: "):])["retry_after"] > 0
+    flight.release(held)
+
+
+def test_rate_limited_batch_call_gives_its_slot_back_while_it_waits(monkeypatch):
+    import main
+    from batch import SharedBackoff, batch_config
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langchain_core.runnables import RunnableLambda
+
+    flight = scheduler(max_concurrency=1)
+    monkeypatch.setattr(main, "llm_scheduler", flight)
+    held_while_waiting = []
+
+    class RateLimited(Exception):
+        status_code = 429
+
+    class RecordingBackoff(SharedBackoff):
+        def wait_time(self):
+            wait = super().wait_time()
+            if wait:
+                held_while_waiting.append(flight.stats()["in_flight"])
+            return wait
+
+    attempts = []
+
+    def reply(prompt):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RateLimited()
+        return AIMessage("ok")
+
+    @main.agent_node
+    def probe_agent(state):
+        response = yield [HumanMessage("hi")]
+        return {"final_plan": response.content}
+
+    config = batch_config(1, llm=RunnableLambda(reply), backoff=RecordingBackoff(base_delay=0.05))
+    assert probe_agent({}, config)["final_plan"] == "ok"
+    assert held_while_waiting == [0] and len(attempts) == 2 and flight.stats()["in_flight"] == 0
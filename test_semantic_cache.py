@@ -0,0 +1,97 @@
+"""
+Checks and a lookup benchmark for the semantic journal cache.
+
+Run with:  python -m pytest test_semantic_cache.py
+           python -m pytest test_semantic_cache.py --benchmark-only   (requires pytest-benchmark)
+"""
+import threading
+
+import numpy as np
+
+from semantic_cache import HashedNgramEmbedder, SemanticCache, VectorIndex, build_semantic_cache, context_key
+
+embedder = HashedNgramEmbedder()
+JOURNAL = "stressed at work, tired, want pizza"
+PLAN = {"detected_triggers": ["Stress", "Fatigue"], "final_plan": "plan", "response": "plan + logistics"}
+CONTEXT = context_key({"diet": "Low Carb"}, {"energy_level": "Low"})
+
+
+def similarity(a, b):
+    return float(embedder.embed(a) @ embedder.embed(b))
+
+
+def test_rewordings_are_close_and_negations_are_not():
+    assert similarity(JOURNAL, "So stressed at work and tired, I want pizza!") > 0.95
+    assert similarity(JOURNAL, "not stressed at work, not tired, don't want pizza") < 0.5
+    assert similarity(JOURNAL, "Bored at home and craving chips") < 0.2
+
+
+def test_hits_need_the_same_context():
+    cache = build_semantic_cache("memory", threshold=0.85)
+    cache.store(JOURNAL, CONTEXT, PLAN)
+    assert cache.lookup("So stressed at work and tired, I want pizza", CONTEXT)[0] == PLAN
+    other = context_key({"diet": "Vegan"}, {"energy_level": "Low"})
+    assert cache.lookup(JOURNAL, other)[0] is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    index = VectorIndex(embedder.dim, max_entries=2)
+    journals = ["bored at home", "anxious before exam", "lonely weekend"]
+    index.add(embedder.embed(journals[0]), CONTEXT, {"n": 0}, now=1)
+    index.add(embedder.embed(journals[1]), CONTEXT, {"n": 1}, now=2)
+    assert index.match(embedder.embed(journals[0]), CONTEXT, 0.99, now=3)[1] == {"n": 0}
+    index.add(embedder.embed(journals[2]), CONTEXT, {"n": 2}, now=4)
+
+    assert len(index) == 2 and index.evictions == 1
+    assert index.match(embedder.embed(journals[1]), CONTEXT, 0.99, now=5)[0] < 0.5
+    assert index.match(embedder.embed(journals[0]), CONTEXT, 0.99, now=5)[0] > 0.99
+
+
+def test_lookup_never_returns_another_contexts_plan():
+    """Lookups racing adds that evict rows of a full cache"""
+    cache = SemanticCache(embedder, VectorIndex(embedder.dim, max_entries=1), threshold=0.5)
+    other = context_key({"diet": "Vegan"}, {"energy_level": "Low"})
+    done = threading.Event()
+
+    def churn():
+        while not done.is_set():
+            for context in (CONTEXT, other):
+                cache.store(JOURNAL, context, {"context": context})
+
+    writer = threading.Thread(target=churn)
+    writer.start()
+    try:
+        found = [cache.lookup(JOURNAL, CONTEXT)[0] for _ in range(3000)]
+    finally:
+        done.set()
+        writer.join()
+    assert all(payload is None or payload["context"] == CONTEXT for payload in found)
+
+
+def test_expired_entries_are_not_returned():
+    index = VectorIndex(embedder.dim, ttl_seconds=60)
+    index.add(embedder.embed(JOURNAL), CONTEXT, PLAN, now=1000)
+    assert index.match(embedder.embed(JOURNAL), CONTEXT, 0.9, now=1030)[1] == PLAN
+    assert index.match(embedder.embed(JOURNAL), CONTEXT, 0.9, now=1061)[1] is None
+
+
+def test_index_survives_a_restart(tmp_path):
+    path = str(tmp_path / "semantic.npz")
+    cache = build_semantic_cache("file", path=path)
+    cache.store(JOURNAL, CONTEXT, PLAN)
+    cache.save()
+
+    restored = build_semantic_cache("file", path=path)
+    assert restored.lookup(JOURNAL, CONTEXT)[0] == PLAN
+
+
+def test_bench_lookup_2048_entries(benchmark):
+    rng = np.random.default_rng(0)
+    index = VectorIndex(embedder.dim, max_entries=2048)
+    for n in range(2048):
+        vector = rng.standard_normal(embedder.dim).astype(np.float32)
+        index.add(vector / np.linalg.norm(vector), CONTEXT, {"n": n})
+    cache = SemanticCache(embedder, index)
+    payload, _ = benchmark(cache.lookup, JOURNAL, CONTEXT)
+    assert payload is None
@@ -0,0 +1,121 @@
+"""
+Checks for coalescing identical in-flight /api/analyze requests.
+
+Run with:  python -m pytest test_singleflight.py
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from fake_llm import build_fake_llm
+from metrics import metrics
+from model_registry import ModelRegistry
+from singleflight import SingleFlight, request_key
+
+
+def test_key_ignores_key_order():
+    assert request_key("x", {"a": 1, "b": [1, 2]}) == request_key("x", {"b": [1, 2], "a": 1})
+    assert request_key("x", {"a": 1}) != request_key("y", {"a": 1})
+
+
+def test_waiters_share_one_run_and_nothing_is_kept():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "plan"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", work)]
+        started.wait(5)
+        futures += [pool.submit(flight.do, "key", work) for _ in range(3)]
+        time.sleep(0.05)
+        release.set()
+        results = [future.result() for future in futures]
+    assert len(calls) == 1
+    assert sorted(results) == [("plan", False)] + [("plan", True)] * 3
+    assert flight.in_flight() == 0
+
+    def fail():
+        raise ValueError("boom")
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    # Nothing is cached: the next call runs again
+    assert flight.do("key", lambda: "again") == ("again", False)
+
+
+def test_async_waiters_share_one_run():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    async def run():
+        return await asyncio.gather(*(flight.ado("key", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1 and [shared for _, shared in results].count(True) == 4
+
+
+def test_waiters_rerun_the_work_when_the_leader_is_cancelled():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "plan"
+
+    async def run():
+        leader = asyncio.create_task(flight.ado("key", work))
+        await asyncio.sleep(0)
+        waiters = asyncio.gather(*(flight.ado("key", work) for _ in range(3)))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiters
+
+    results = asyncio.run(run())
+    assert [result for result, _ in results] == ["plan"] * 3
+    assert len(calls) == 2 and [shared for _, shared in results].count(True) == 2
+
+
+def test_duplicate_analyze_requests_coalesce(monkeypatch):
+    import main
+    from app import flask_app
+
+    monkeypatch.setattr(main, "models", ModelRegistry(lambda model_id: build_fake_llm(model_id, ttft_ms=150, cache=False)))
+    before = metrics.counter("nutrition_coalesced_requests_total", endpoint="analyze")
+    body = {"journal_entry": "So stressed, skipped lunch and now craving sweets", "user_profile": {"name": "Sam", "diet": "Vegan"}}
+    start = threading.Barrier(3)
+
+    def post(payload):
+        start.wait()
+        return flask_app.test_client().post("/api/analyze", json=payload).get_json()
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        reordered = {"user_profile": {"diet": "Vegan", "name": "Sam"}, "journal_entry": body["journal_entry"]}
+        responses = list(pool.map(post, [body, body, reordered]))
+
+    assert [response["coalesced"] for response in responses].count(True) == 2
+    assert len({response["results"]["final_plan"] for response in responses}) == 1
+    assert metrics.counter("nutrition_coalesced_requests_total", endpoint="analyze") == before + 2
+
+
+def test_tenants_and_deadlines_do_not_share_runs():
+    from app import coalescing_key
+
+    body = {"journal_entry": "So stressed, skipped lunch and now craving sweets"}
+    key = coalescing_key(body, {"X-Api-Key": "tenant-a"})
+    assert coalescing_key(dict(body), {"X-Api-Key": "tenant-a"}) == key
+    assert coalescing_key(body, {"X-Api-Key": "tenant-b"}) != key
+    assert coalescing_key(body, {"X-Api-Key": "tenant-a", "X-Request-Deadline-Ms": "50"}) != key
@@ -0,0 +1,64 @@
+"""
+Accuracy and savings benchmark for the local trigger fast path.
+
+Run with:  python -m pytest test_trigger_benchmark.py -s
+The savings report assumes BENCH_LLM_LATENCY_MS per trigger detective call
+(default 1200 ms, roughly one Groq round trip).
+"""
+import json
+import os
+import time
+
+import pytest
+
+from triggers import TriggerClassifier, TRIGGERS
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "trigger_journals.jsonl")
+THRESHOLD = 0.8
+LLM_LATENCY_MS = float(os.getenv("BENCH_LLM_LATENCY_MS", "1200"))
+
+classifier = TriggerClassifier()
+
+with open(FIXTURES) as f:
+    CASES = [json.loads(line) for line in f if line.strip()]
+
+
+def test_fixture_labels_use_trigger_vocabulary():
+    for case in CASES:
+        assert set(case["triggers"]) <= set(TRIGGERS), case["text"]
+
+
+@pytest.mark.parametrize("case", CASES, ids=lambda case: case["text"][:40])
+def test_confident_predictions_match_labels(case):
+    triggers, confidence = classifier.classify(case["text"])
+    if confidence >= THRESHOLD:
+        assert triggers == case["triggers"]
+
+
+def test_negated_cue_is_not_confident():
+    triggers, confidence = classifier.classify("Not stressed at all today, just hungry.")
+    assert triggers == []
+    assert confidence < THRESHOLD
+
+
+def test_hybrid_mode_savings_report():
+    start = time.perf_counter()
+    results = [classifier.classify(case["text"]) for case in CASES]
+    local_ms = (time.perf_counter() - start) * 1000
+
+    skipped = sum(1 for _, confidence in results if confidence >= THRESHOLD)
+    saved_ms = skipped * LLM_LATENCY_MS
+
+    print(
+        f"\nTrigger fast path on {len(CASES)} labelled journals: "
+        f"{skipped} LLM calls skipped ({skipped / len(CASES):.0%}), "
+        f"local classification {local_ms:.2f} ms total, "
+        f"~{saved_ms:.0f} ms saved at {LLM_LATENCY_MS:.0f} ms per LLM call"
+    )
+    assert skipped / len(CASES) >= 0.5
+
+
+def test_bench_classify(benchmark):
+    text = CASES[0]["text"]
+    triggers, _ = benchmark(classifier.classify, text)
+    assert triggers == CASES[0]["triggers"]
@@ -0,0 +1,137 @@
+import re
+from typing import Dict, List, Tuple
+
+# The fixed trigger vocabulary shared with the trigger detective prompt
+TRIGGERS = [
+    "Stress",
+    "Anxiety",
+    "Boredom",
+    "Social pressure",
+    "Low Energy",
+    "Fatigue",
+    "Emotional eating",
+    "Sleep deprivation",
+    "Time pressure",
+    "Loneliness",
+    "Celebration/Reward seeking",
+    "Procrastination",
+    "Depression",
+    "Anger/Frustration",
+    "Comfort seeking",
+]
+
+STRONG = 1.0
+WEAK = 0.5
+
+
+class TriggerClassifier:
+    def __init__(self):
+        # Cue patterns per trigger. Strong cues name the trigger outright,
+        # weak cues only hint at it and are left for the LLM to confirm.
+        self.cues: Dict[str, Dict[float, List[str]]] = {
+            "Stress": {
+                STRONG: [r"stress(?:ed|ful)?", r"overwhelm(?:ed|ing)", r"under (?:a lot of )?pressure"],
+            },
+            "Anxiety": {
+                STRONG: [r"anxious", r"anxiety", r"nervous", r"panick(?:ed|y)", r"panic attack"],
+                WEAK: [r"worried", r"on edge"],
+            },
+            "Boredom": {
+                STRONG: [r"bored", r"boring", r"nothing (?:else )?to do"],
+            },
+            "Social pressure": {
+                STRONG: [r"peer pressure", r"everyone (?:else )?was eating", r"pressured (?:me )?(?:to|into) eat",
+                         r"(?:friends|colleagues|coworkers|family) (?:insisted|kept pushing)"],
+                WEAK: [r"party", r"didn't want to be rude"],
+            },
+            "Low Energy": {
+                STRONG: [r"energy (?:crashed|crash|dipped|dip|slump)", r"low energy", r"no energy", r"sluggish"],
+            },
+            "Fatigue": {
+                STRONG: [r"exhausted", r"exhausting", r"worn out", r"drained", r"fatigued?"],
+                WEAK: [r"tired"],
+            },
+            "Emotional eating": {
+                STRONG: [r"(?:ate|eat|eating) my feelings", r"emotional eating", r"stress[- ]eat(?:ing)?", r"binge(?:d|ing)?"],
+            },
+            "Sleep deprivation": {
+                STRONG: [r"couldn't sleep", r"could not sleep", r"didn't sleep", r"barely slept", r"no sleep",
+                         r"insomnia", r"slept (?:badly|terribly|poorly)", r"only (?:slept|got) \d+ hours",
+                         r"sleep[- ]deprived"],
+            },
+            "Time pressure": {
+                STRONG: [r"no time to", r"rushed", r"in a rush", r"back[- ]to[- ]back", r"running late", r"deadlines?"],
+                WEAK: [r"busy"],
+            },
+            "Loneliness": {
+                STRONG: [r"lonely", r"loneliness", r"isolated", r"alone all (?:day|evening|weekend)"],
+                WEAK: [r"by myself"],
+            },
+            "Celebration/Reward seeking": {
+                STRONG: [r"celebrat(?:e|ed|ing|ion)", r"treat myself", r"reward myself", r"i deserve(?:d)? (?:a|it|this)"],
+            },
+            "Procrastination": {
+                STRONG: [r"procrastinat(?:e|ed|ing|ion)", r"putting (?:it |things )?off", r"avoiding (?:my )?(?:work|tasks|emails)"],
+            },
+            "Depression": {
+                STRONG: [r"depressed", r"hopeless", r"empty inside", r"can't get out of bed"],
+                WEAK: [r"sad", r"down in the dumps"],
+            },
+            "Anger/Frustration": {
+                STRONG: [r"angry", r"furious", r"frustrat(?:ed|ing|ion)", r"pissed off", r"annoyed", r"irritated"],
+                WEAK: [r"upset"],
+            },
+            "Comfort seeking": {
+                STRONG: [r"comfort food", r"something comforting", r"craving comfort"],
+                WEAK: [r"cozy"],
+            },
+        }
+
+        # Precompile every cue once, wrapped in word boundaries
+        self._compiled: List[Tuple[str, float, "re.Pattern[str]"]] = [
+            (trigger, weight, re.compile(rf"\b(?:{pattern})\b"))
+            for trigger, levels in self.cues.items()
+            for weight, patterns in levels.items()
+            for pattern in patterns
+        ]
+
+        # A negation just before a cue ("not stressed", "wasn't tired at all")
+        self._negation = re.compile(r"(?:\bnot|\bno|\bnever|n't)\s+(?:\w+\s+){0,2}$")
+
+    def classify(self, text: str) -> Tuple[List[str], float]:
+        """
+        Detects triggers locally.
+        Returns: (triggers: list in TRIGGERS order, confidence: 0.0-1.0)
+        Confidence is high only when every trigger rests on a strong,
+        non-negated cue in a short entry; anything else should go to the LLM.
+        """
+        if not text:
+            return [], 1.0
+
+        lower_text = text.lower()
+        scores: Dict[str, float] = {}
+        negated = False
+
+        for trigger, weight, pattern in self._compiled:
+            for match in pattern.finditer(lower_text):
+                if self._negation.search(lower_text, max(0, match.start() - 30), match.start()):
+                    negated = True
+                    continue
+                scores[trigger] = max(scores.get(trigger, 0.0), weight)
+                break
+
+        triggers = [trigger for trigger in TRIGGERS if trigger in scores]
+
+        if not triggers:
+            # No cues at all - subtle triggers are the LLM's job
+            confidence = 0.3
+        else:
+            confidence = 0.9 if min(scores.values()) >= STRONG else 0.5
+
+        if negated:
+            confidence *= 0.5
+        # Long entries are more likely to hide triggers the lexicon misses
+        if len(lower_text.split()) > 60:
+            confidence *= 0.8
+
+        return triggers, round(confidence, 2)